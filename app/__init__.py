@@ -26,7 +26,11 @@ def create_app(config_name='default'):
     app.template_filter('uk_timezone')(to_uk_timezone)
     app.template_filter('uk_strftime')(uk_timezone_strftime)
     app.template_filter('from_json')(from_json)
-    
+
+    # Keep rollups, the billing ledger and cached reports in step with committed writes
+    from app.services import session_hooks
+    session_hooks.register(db.session)
+
     # Register blueprints
     from app.routes.main import bp as main_bp
     from app.routes.auth import bp as auth_bp
@@ -77,6 +81,12 @@ def create_app(config_name='default'):
                         db.session.add(role)
                         print(f"✓ Added role: {role_data['name']}")
                 
+                # Add the bank holidays that holiday requests are counted against
+                from app.services.working_days import WorkingDayService
+                added = WorkingDayService.seed_bank_holidays()
+                if added:
+                    print(f"✓ Added {added} bank holidays")
+                
                 db.session.commit()
                 print("✓ Database initialization completed successfully")
                 break  # Success, exit retry loop
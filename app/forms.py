@@ -1095,6 +1095,7 @@ class HolidayApprovalForm(FlaskForm):
         ('reject', 'Reject')
     ], validators=[DataRequired()])
     notes = TextAreaField('Notes', validators=[Optional(), Length(max=500)])
+    reassign_appointments = BooleanField('Reassign booked appointments to the suggested stylists')
     submit = SubmitField('Submit Decision')
 
 class HolidayQuotaForm(FlaskForm):
@@ -1,6 +1,7 @@
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy import event, DDL
 from app.extensions import db
 from app.utils import uk_utcnow
 from config import Config
@@ -264,7 +265,12 @@ class Appointment(db.Model):
     # Status and tracking
     status = db.Column(db.String(20), default='confirmed')  # confirmed, completed, cancelled, no-show
     created_at = db.Column(db.DateTime, default=uk_utcnow)
-    updated_at = db.Column(db.DateTime, default=uk_utcnow, onupdate=uk_utcnow)
+    updated_at = db.Column(db.DateTime, default=uk_utcnow, onupdate=uk_utcnow, index=True)
+
+    # A stylist's appointments over a date range, e.g. those a holiday would cover
+    __table_args__ = (
+        db.Index('ix_appointment_stylist_date', 'stylist_id', 'appointment_date'),
+    )
 
     # Relationships
     customer = db.relationship('User', foreign_keys=[customer_id], backref='customer_appointments')
@@ -310,13 +316,31 @@ class Appointment(db.Model):
         """Check if appointment is in the future"""
         return not self.is_past
 
+# On PostgreSQL the database itself refuses overlapping active bookings for a stylist
+APPOINTMENT_NO_OVERLAP_DDL = """
+ALTER TABLE appointment ADD CONSTRAINT appointment_no_overlap
+EXCLUDE USING gist (
+    stylist_id WITH =,
+    tsrange(appointment_date + start_time, appointment_date + end_time, '[)') WITH &&
+) WHERE (status IN ('confirmed', 'completed'))
+"""
+
+event.listen(
+    Appointment.__table__, 'after_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql')
+)
+event.listen(
+    Appointment.__table__, 'after_create',
+    DDL(APPOINTMENT_NO_OVERLAP_DDL).execute_if(dialect='postgresql')
+)
+
 class AppointmentStatus(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id'), nullable=False)
     status = db.Column(db.String(20), nullable=False)  # confirmed, completed, cancelled, no-show
     notes = db.Column(db.Text)
     changed_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    changed_at = db.Column(db.DateTime, default=uk_utcnow)
+    changed_at = db.Column(db.DateTime, default=uk_utcnow, index=True)
     
     # Relationships
     appointment = db.relationship('Appointment', backref='status_history')
@@ -468,6 +492,7 @@ class HolidayQuota(db.Model):
     holiday_days_entitled = db.Column(db.Integer, nullable=False)
     holiday_days_taken = db.Column(db.Integer, default=0)
     holiday_days_remaining = db.Column(db.Integer, nullable=False)
+    holiday_days_carried_over = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=uk_utcnow)
     updated_at = db.Column(db.DateTime, default=uk_utcnow, onupdate=uk_utcnow)
     
@@ -491,8 +516,9 @@ class HolidayQuota(db.Model):
             return int((hours_per_week / 37.5) * 28)
     
     def update_remaining_days(self):
-        """Update remaining days based on taken days"""
-        self.holiday_days_remaining = self.holiday_days_entitled - self.holiday_days_taken
+        """Update remaining days based on taken and carried over days"""
+        self.holiday_days_remaining = (self.holiday_days_entitled + (self.holiday_days_carried_over or 0)
+                                       - self.holiday_days_taken)
 
 class HolidayRequest(db.Model):
     """Holiday requests and approvals"""
@@ -554,6 +580,22 @@ class HolidayRequest(db.Model):
         if notes:
             self.notes = notes
 
+class BankHoliday(db.Model):
+    """Public holiday on which the salon's staff are not counted as using holiday days"""
+    __tablename__ = 'bank_holiday'
+    __table_args__ = (
+        db.UniqueConstraint('region', 'date', name='uq_bank_holiday_region_date'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
+    region = db.Column(db.String(50), nullable=False, default='england-and-wales')
+    created_at = db.Column(db.DateTime, default=uk_utcnow)
+    
+    def __repr__(self):
+        return f'<BankHoliday {self.date} {self.name}>'
+
 class BillingElement(db.Model):
     """Salon billing elements for commission calculations"""
     id = db.Column(db.Integer, primary_key=True)
@@ -647,4 +689,98 @@ class AppointmentCost(db.Model):
             'elements': elements
         }
         
-        return summary 
\ No newline at end of file
+        return summary
+
+class CostRecalculationJob(db.Model):
+    """Queued 'appointment cost dirty' event, at most one per appointment"""
+    id = db.Column(db.Integer, primary_key=True)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id'), nullable=False, unique=True)
+    requested_at = db.Column(db.DateTime, default=uk_utcnow, nullable=False, index=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    
+    def __repr__(self):
+        return f'<CostRecalculationJob {self.appointment_id}>'
+
+class DailyStylistRollup(db.Model):
+    """Per-day, per-stylist totals of appointments and their costs, kept in step with the source rows"""
+    __tablename__ = 'daily_stylist_rollup'
+    __table_args__ = (db.UniqueConstraint('date', 'stylist_id', name='uq_daily_stylist_rollup'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False, index=True)
+    stylist_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    
+    # Appointment counts and booked (confirmed or completed) minutes
+    appointment_count = db.Column(db.Integer, default=0, nullable=False)
+    completed_count = db.Column(db.Integer, default=0, nullable=False)
+    booked_minutes = db.Column(db.Integer, default=0, nullable=False)
+    
+    # Costs of completed appointments
+    costed_count = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Numeric(12, 2), default=0, nullable=False)
+    stylist_cost = db.Column(db.Numeric(12, 2), default=0, nullable=False)
+    salon_profit = db.Column(db.Numeric(12, 2), default=0, nullable=False)
+    hours_worked = db.Column(db.Numeric(8, 2), default=0, nullable=False)
+    
+    # Costs of completed commission-based appointments
+    commission_count = db.Column(db.Integer, default=0, nullable=False)
+    commission_revenue = db.Column(db.Numeric(12, 2), default=0, nullable=False)
+    commission_amount = db.Column(db.Numeric(12, 2), default=0, nullable=False)
+    commission_salon_profit = db.Column(db.Numeric(12, 2), default=0, nullable=False)
+    
+    # Commission on any appointment with some, whatever its status (used for trends)
+    booked_commission_count = db.Column(db.Integer, default=0, nullable=False)
+    booked_commission_revenue = db.Column(db.Numeric(12, 2), default=0, nullable=False)
+    booked_commission_amount = db.Column(db.Numeric(12, 2), default=0, nullable=False)
+    
+    updated_at = db.Column(db.DateTime, default=uk_utcnow, onupdate=uk_utcnow)
+    
+    stylist = db.relationship('User', foreign_keys=[stylist_id])
+    
+    def __repr__(self):
+        return f'<DailyStylistRollup {self.date} - {self.stylist_id}>'
+
+class ReportCacheEntry(db.Model):
+    """Cached report result shared between worker processes"""
+    __tablename__ = 'report_cache_entry'
+    
+    key = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.LargeBinary, nullable=False)
+    # Comma-wrapped dependency tags, e.g. ',appointments,costs,'
+    tags = db.Column(db.String(255), nullable=False, default=',')
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_used_at = db.Column(db.DateTime, default=uk_utcnow, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<ReportCacheEntry {self.key}>'
+
+class ReportCacheGeneration(db.Model):
+    """How many times results tagged with one report tag have been invalidated"""
+    __tablename__ = 'report_cache_generation'
+    
+    tag = db.Column(db.String(50), primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ReportCacheGeneration {self.tag} {self.generation}>'
+
+class AppointmentCostElement(db.Model):
+    """One billing element applied to an appointment cost, for aggregating element performance in SQL"""
+    __tablename__ = 'appointment_cost_element'
+    __table_args__ = (
+        db.UniqueConstraint('appointment_cost_id', 'element_id', name='uq_appointment_cost_element'),
+        db.Index('ix_appointment_cost_element_element_date', 'element_id', 'date'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    appointment_cost_id = db.Column(db.Integer, db.ForeignKey('appointment_cost.id', ondelete='CASCADE'),
+                                    nullable=False, index=True)
+    element_id = db.Column(db.Integer, db.ForeignKey('billing_element.id', ondelete='CASCADE'), nullable=False)
+    date = db.Column(db.Date, nullable=False, index=True)
+    stylist_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    commission_portion = db.Column(db.Numeric(10, 2), nullable=False)
+    
+    def __repr__(self):
+        return f'<AppointmentCostElement {self.appointment_cost_id} - {self.element_id}>'
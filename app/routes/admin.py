@@ -1,5 +1,5 @@
 from datetime import date
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from app.models import User, Role, UserProfile, SalonSettings, WorkPattern, EmploymentDetails, AppointmentCost, Appointment, HolidayRequest, HolidayQuota
 from app.forms import AdminUserForm, RoleAssignmentForm, SalonSettingsForm, WorkPatternForm, EmploymentDetailsForm, AdminUserAddForm, HRDashboardFilterForm, HolidayRequestForm, HolidayApprovalForm, HolidayQuotaForm
@@ -8,7 +8,13 @@ from app.routes.main import role_required
 from app.utils import uk_now
 from app.services.hr_service import HRService
 from app.services.holiday_service import HolidayService
+from app.services.holiday_coverage import HolidayCoverageService
+from app.services.holiday_reassignment import HolidayReassignmentService
 from app.services.analytics_service import AnalyticsService
+from app.services.date_buckets import DATE_BUCKET_UNITS
+from app.services.schedule_cache import ScheduleCache
+from app.services.query_profiles import QueryProfiles
+from app.services.report_cache import ReportCache
 from app.models import BillingElement
 import json
 
@@ -86,7 +92,8 @@ def appointment_costs():
     stylist_id = request.args.get('stylist_id', type=int)
     
     # Build query with join to appointment
-    query = AppointmentCost.query.join(AppointmentCost.appointment)
+    query = AppointmentCost.query.join(AppointmentCost.appointment)\
+        .options(*QueryProfiles.appointment_costs())
     
     if date_from:
         query = query.filter(Appointment.appointment_date >= date_from)
@@ -117,12 +124,16 @@ def stylist_earnings():
     
     # Get all stylists
     from app.models import User, Role
-    stylists = User.query.join(User.roles).filter(Role.name == 'stylist').all()
+    stylists = User.query.join(User.roles).filter(Role.name == 'stylist')\
+        .options(*QueryProfiles.staff_employment()).all()
     
-    # Calculate earnings for each stylist
+    # Calculate earnings for every stylist in one grouped query
+    earnings_by_stylist = HRService.calculate_earnings_by_stylist(
+        date_from, date_to, stylist_ids=[stylist.id for stylist in stylists]
+    )
     stylist_earnings = []
     for stylist in stylists:
-        earnings = HRService.calculate_stylist_earnings(stylist.id, date_from, date_to)
+        earnings = earnings_by_stylist[stylist.id]
         stylist_earnings.append({
             'stylist': stylist,
             'earnings': earnings
@@ -312,6 +323,7 @@ def salon_settings():
             salon_settings.opening_hours = form.get_opening_hours_dict()
             
             db.session.commit()
+            ScheduleCache.invalidate_salon_hours()
             flash('Salon settings updated successfully!', 'success')
             return redirect(url_for('admin.salon_settings'))
             
@@ -368,6 +380,7 @@ def new_work_pattern():
             
             db.session.add(work_pattern)
             db.session.commit()
+            ScheduleCache.invalidate_work_patterns(work_pattern.user_id)
             
             flash('Work pattern created successfully!', 'success')
             return redirect(url_for('admin.work_patterns'))
@@ -398,6 +411,8 @@ def edit_work_pattern(pattern_id):
             work_pattern.is_active = form.is_active.data
             
             db.session.commit()
+            # The pattern may have moved between stylists, so drop all compiled patterns
+            ScheduleCache.invalidate_work_patterns()
             
             flash('Work pattern updated successfully!', 'success')
             return redirect(url_for('admin.work_patterns'))
@@ -424,10 +439,12 @@ def delete_work_pattern(pattern_id):
     """Delete a work pattern"""
     
     work_pattern = WorkPattern.query.get_or_404(pattern_id)
+    user_id = work_pattern.user_id
     
     try:
         db.session.delete(work_pattern)
         db.session.commit()
+        ScheduleCache.invalidate_work_patterns(user_id)
         flash('Work pattern deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -607,10 +624,25 @@ def view_holiday_request(request_id):
     request = HolidayRequest.query.get_or_404(request_id)
     approval_form = HolidayApprovalForm()
     
+    # Days on which approving would leave too many staff off, and who could take booked appointments
+    coverage_conflicts = []
+    reassignments = []
+    if request.status == 'pending':
+        coverage_conflicts = HolidayCoverageService.conflicts_if_approved(request)
+        reassignments = HolidayReassignmentService.plan(request.user_id, request.start_date, request.end_date)
+    stylist_names = {}
+    if reassignments:
+        stylist_names = {user.id: f"{user.first_name} {user.last_name}" for user in User.query.filter(
+            User.id.in_({suggestion['stylist_id'] for suggestion in reassignments if suggestion['stylist_id']})
+        )}
+    
     return render_template('admin/holiday_request_detail.html',
                          title='Holiday Request Details',
                          request=request,
                          approval_form=approval_form,
+                         coverage_conflicts=coverage_conflicts,
+                         reassignments=reassignments,
+                         stylist_names=stylist_names,
                          uk_now=uk_now)
 
 @bp.route('/holiday-requests/<int:request_id>/approve', methods=['POST'])
@@ -624,7 +656,7 @@ def approve_holiday_request(request_id):
     if form.validate_on_submit():
         if form.action.data == 'approve':
             success, message = HolidayService.approve_holiday_request(
-                request_id, current_user.id, form.notes.data
+                request_id, current_user.id, form.notes.data, reassign=form.reassign_appointments.data
             )
         else:
             success, message = HolidayService.reject_holiday_request(
@@ -638,6 +670,40 @@ def approve_holiday_request(request_id):
     
     return redirect(url_for('admin.holiday_requests'))
 
+@bp.route('/holiday-requests/bulk', methods=['POST'])
+@login_required
+@role_required('manager')
+def bulk_decide_holiday_requests():
+    """Approve or reject the selected holiday requests together"""
+    action = request.form.get('action')
+    request_ids = request.form.getlist('request_ids', type=int)
+    if action not in ('approve', 'reject') or not request_ids:
+        flash('Select at least one pending request and an action.', 'error')
+        return redirect(request.referrer or url_for('admin.holiday_requests'))
+    
+    try:
+        result = HolidayService.decide_holiday_requests(request_ids, action, current_user.id,
+                                                        request.form.get('notes') or None,
+                                                        reassign=bool(request.form.get('reassign_appointments')))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error updating holiday requests: {str(e)}', 'error')
+        return redirect(request.referrer or url_for('admin.holiday_requests'))
+    
+    if result['shortfalls']:
+        flash(f"No requests were approved: {HolidayService.describe_shortfalls(result['shortfalls'])}.", 'error')
+    elif result['decided']:
+        flash(f"{len(result['decided'])} holiday request{'s' if len(result['decided']) != 1 else ''} {action}d.",
+              'success')
+    if result['skipped']:
+        flash(f"{len(result['skipped'])} requests were no longer pending and were skipped.", 'warning')
+    if result['reassigned'] or result['unassigned']:
+        flash(f"{HolidayService.describe_reassignments(result)}.",
+              'warning' if result['unassigned'] else 'success')
+    if result['conflicts']:
+        flash(f"Warning: {HolidayService.describe_conflicts(result['conflicts'])}", 'warning')
+    return redirect(request.referrer or url_for('admin.holiday_requests'))
+
 @bp.route('/holiday-quotas')
 @login_required
 @role_required('manager')
@@ -645,26 +711,58 @@ def holiday_quotas():
     """View holiday quotas for all staff"""
     year = request.args.get('year', date.today().year, type=int)
     
-    # Get all stylists with their quotas
-    from app.models import User, Role
-    stylists = User.query.join(User.roles).filter(Role.name == 'stylist').all()
-    
-    quotas_data = []
-    for stylist in stylists:
-        quota = HolidayService.get_or_create_holiday_quota(stylist.id, year)
-        if quota:
-            quotas_data.append({
-                'user': stylist,
-                'quota': quota,
-                'requests': HolidayService.get_user_holiday_requests(stylist.id)
-            })
+    team_summary = HolidayService.get_team_holiday_summary(year)
     
     return render_template('admin/holiday_quotas.html',
                          title='Holiday Quotas',
-                         quotas_data=quotas_data,
+                         quotas_data=team_summary['stylists'],
+                         missing_quota=team_summary['missing_quota'],
                          year=year,
                          uk_now=uk_now)
 
+@bp.route('/holiday-quotas/provision', methods=['POST'])
+@login_required
+@role_required('manager')
+def provision_holiday_quotas():
+    """Create the missing holiday quotas for a year"""
+    year = request.form.get('year', date.today().year, type=int)
+    
+    try:
+        result = HolidayService.provision_missing_quotas(year)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error creating holiday quotas: {str(e)}', 'error')
+        return redirect(url_for('admin.holiday_quotas', year=year))
+    
+    flash(f"Created {result['created']} holiday quotas for {year}.", 'success')
+    if result['skipped']:
+        flash(f"{len(result['skipped'])} staff members need an active work pattern and employment details "
+              f"before a quota can be created.", 'warning')
+    return redirect(url_for('admin.holiday_quotas', year=year))
+
+@bp.route('/holiday-quotas/rollover', methods=['POST'])
+@login_required
+@role_required('manager')
+def rollover_holiday_quotas():
+    """Create next year's holiday quotas for every active employee (JSON API)"""
+    data = request.get_json(silent=True) or request.form
+    try:
+        year = int(data.get('year') or date.today().year + 1)
+        carry_over = str(data.get('carry_over', '')).lower() in ['true', 'on', '1']
+        max_carry_over = int(data['max_carry_over']) if data.get('max_carry_over') not in (None, '') else None
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'year and max_carry_over must be whole numbers'}), 400
+    
+    try:
+        result = HolidayService.rollover_quotas(year, carry_over=carry_over, max_carry_over=max_carry_over)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    return jsonify({'success': True, 'year': year, **result})
+
 @bp.route('/holiday-quotas/<int:user_id>')
 @login_required
 @role_required('manager')
@@ -943,10 +1041,15 @@ def holiday_analytics():
             pass
     
     # Get holiday analytics data
-    holiday_data = AnalyticsService.analyze_holiday_trends(start_date, end_date)
+    bucket = request.args.get('bucket', 'month')
+    if bucket not in DATE_BUCKET_UNITS:
+        bucket = 'month'
+    
+    holiday_data = AnalyticsService.analyze_holiday_trends(start_date, end_date, bucket)
     
     return render_template('admin/holiday_analytics.html',
                          holiday_data=holiday_data,
+                         bucket=bucket,
                          start_date=start_date,
                          end_date=end_date)
 
@@ -977,10 +1080,15 @@ def commission_analytics():
             pass
     
     # Get commission analytics data
-    commission_data = AnalyticsService.analyze_commission_trends(start_date, end_date)
+    bucket = request.args.get('bucket', 'month')
+    if bucket not in DATE_BUCKET_UNITS:
+        bucket = 'month'
+    
+    commission_data = AnalyticsService.analyze_commission_trends(start_date, end_date, bucket)
     
     return render_template('admin/commission_analytics.html',
                          commission_data=commission_data,
+                         bucket=bucket,
                          start_date=start_date,
                          end_date=end_date)
 
@@ -1020,4 +1128,20 @@ def staff_utilization_analytics():
                          utilization_data=utilization_data,
                          capacity_data=capacity_data,
                          start_date=start_date,
-                         end_date=end_date)
\ No newline at end of file
+                         end_date=end_date)
+
+@bp.route('/analytics/cache')
+@login_required
+@role_required('manager')
+def analytics_cache_stats():
+    """Report cache hit/miss statistics for this worker"""
+    return jsonify(ReportCache.stats())
+
+@bp.route('/analytics/cache/clear', methods=['POST'])
+@login_required
+@role_required('manager')
+def clear_analytics_cache():
+    """Drop all cached report results"""
+    ReportCache.clear()
+    flash('Report cache cleared.', 'success')
+    return redirect(request.referrer or url_for('admin.analytics_dashboard'))
\ No newline at end of file
@@ -1,14 +1,20 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, Response, stream_with_context
 from flask_login import current_user, login_required
 from app.models import User, Role, Service, Appointment, AppointmentStatus, AppointmentService, StylistServiceAssociation
 from app.forms import AppointmentBookingForm, AppointmentManagementForm, AppointmentFilterForm, ServiceForm, StylistServiceTimingForm
 from app.extensions import db
-from app.services.hr_service import HRService
+from sqlalchemy.exc import IntegrityError
+from app.services.cost_queue import CostQueue
 from app.services.salon_hours_service import SalonHoursService
+from app.services.availability_service import AvailabilityService, ACTIVE_STATUSES
+from app.services.calendar_service import CalendarService
+from app.services.query_profiles import QueryProfiles
+from collections import Counter
 from datetime import datetime, date, timedelta
 from functools import wraps
 import calendar
-import logging
+import json
+import time as timer
 
 bp = Blueprint('appointments', __name__)
 
@@ -93,27 +99,13 @@ def book_appointment():
         if validation.get('emergency_extension'):
             flash(validation['warning'], 'warning')
         
+        # Serialise bookings for this stylist and day so the check and insert cannot interleave
+        AvailabilityService.lock_stylist_day(form.stylist_id.data, form.appointment_date.data)
+        
         # Check for conflicts (same as before, but for total duration)
-        conflicts = Appointment.query.filter(
-            Appointment.stylist_id == form.stylist_id.data,
-            Appointment.appointment_date == form.appointment_date.data,
-            Appointment.status.in_(['confirmed', 'completed']),
-            db.or_(
-                db.and_(
-                    Appointment.start_time <= start_time,
-                    Appointment.end_time > start_time
-                ),
-                db.and_(
-                    Appointment.start_time < end_time,
-                    Appointment.end_time >= end_time
-                ),
-                db.and_(
-                    Appointment.start_time >= start_time,
-                    Appointment.end_time <= end_time
-                )
-            )
-        ).first()
-        if conflicts:
+        if AvailabilityService.has_conflicting_appointment(
+                form.stylist_id.data, form.appointment_date.data, start_time, end_time):
+            db.session.rollback()
             flash('This time slot conflicts with an existing appointment. Please choose a different time.', 'error')
             return redirect(url_for('appointments.book_appointment'))
         
@@ -133,7 +125,13 @@ def book_appointment():
         
         # Add appointment to database and get ID
         db.session.add(appointment)
-        db.session.flush()  # Get the ID without committing
+        try:
+            db.session.flush()  # Get the ID without committing
+        except IntegrityError:
+            # The PostgreSQL no-overlap constraint caught a concurrent booking
+            db.session.rollback()
+            flash('This time slot conflicts with an existing appointment. Please choose a different time.', 'error')
+            return redirect(url_for('appointments.book_appointment'))
         
         # Add services to the appointment
         for i, service_form in enumerate(form.services.entries):
@@ -156,13 +154,16 @@ def book_appointment():
         )
         db.session.add(status_entry)
         
-        # Calculate appointment costs using HR service
-        try:
-            HRService.calculate_appointment_cost(appointment.id)
-        except Exception as e:
-            logging.error(f"Error calculating appointment cost: {e}")
+        # Queue the cost calculation for the background worker
+        CostQueue.enqueue([appointment.id])
         
-        db.session.commit()
+        try:
+            # Committing also writes the rollups, billing ledger and report cache invalidation
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash('This time slot conflicts with an existing appointment. Please choose a different time.', 'error')
+            return redirect(url_for('appointments.book_appointment'))
         
         flash('Appointment booked successfully!', 'success')
         return redirect(url_for('appointments.view_appointment', appointment_id=appointment.id))
@@ -212,19 +213,31 @@ def stylist_appointments():
         start_date = selected_date.replace(day=1)
         end_date = (start_date + timedelta(days=32)).replace(day=1) - timedelta(days=1)
     
+    # The month view is summarised with one grouped query; full rows are only
+    # loaded for the expanded (selected) day
+    month_summary = None
+    rows_start, rows_end = start_date, end_date
+    if view_type == 'month':
+        month_summary = CalendarService.get_period_summary(
+            start_date, end_date,
+            stylist_id=None if calendar_view == 'global' else current_user.id,
+            by_stylist=calendar_view == 'global'
+        )
+        rows_start = rows_end = selected_date
+    
     # Get appointments based on calendar view
     if calendar_view == 'global':
         # Show all appointments in the salon for the date range
-        appointments = Appointment.query.filter(
-            Appointment.appointment_date >= start_date,
-            Appointment.appointment_date <= end_date
+        appointments = Appointment.query.options(*QueryProfiles.appointment_calendar()).filter(
+            Appointment.appointment_date >= rows_start,
+            Appointment.appointment_date <= rows_end
         ).order_by(Appointment.appointment_date, Appointment.start_time).all()
     else:
         # Show only the current stylist's appointments
-        appointments = Appointment.query.filter(
+        appointments = Appointment.query.options(*QueryProfiles.appointment_calendar()).filter(
             Appointment.stylist_id == current_user.id,
-            Appointment.appointment_date >= start_date,
-            Appointment.appointment_date <= end_date
+            Appointment.appointment_date >= rows_start,
+            Appointment.appointment_date <= rows_end
         ).order_by(Appointment.appointment_date, Appointment.start_time).all()
     
     # Log debug information
@@ -245,6 +258,7 @@ def stylist_appointments():
     
     return render_template('appointments/stylist_calendar.html',
                          appointments=appointments,
+                         month_summary=month_summary,
                          start_date=start_date,
                          end_date=end_date,
                          view_type=view_type,
@@ -308,37 +322,60 @@ def admin_appointments():
         else_=6
     )
     
-    stylists = stylist_query.order_by(seniority_order, User.first_name, User.last_name).all()
+    stylists = stylist_query.options(*QueryProfiles.calendar_stylists()).order_by(
+        seniority_order, User.first_name, User.last_name
+    ).all()
     
-    # Build query
-    query = Appointment.query.filter(
-        Appointment.appointment_date >= start_date,
-        Appointment.appointment_date <= end_date
-    )
+    # Taken before loading so changes made while the page renders are picked up by live updates
+    calendar_token = CalendarService.current_change_token()
     
     # Handle stylist_id filter with proper type conversion
+    stylist_id_int = None
     if stylist_id and stylist_id.strip():
         try:
             stylist_id_int = int(stylist_id)
-            query = query.filter(Appointment.stylist_id == stylist_id_int)
         except ValueError:
             # If stylist_id is not a valid integer, ignore the filter
             pass
     
+    # The month view is summarised with one grouped query; full rows are only
+    # loaded for the expanded (selected) day
+    month_summary = None
+    rows_start, rows_end = start_date, end_date
+    if view_type != 'week':
+        month_summary = CalendarService.get_period_summary(
+            start_date, end_date, stylist_id=stylist_id_int, status=status_filter, by_stylist=True
+        )
+        rows_start = rows_end = selected_date
+    
+    # Build query
+    query = Appointment.query.options(*QueryProfiles.appointment_calendar()).filter(
+        Appointment.appointment_date >= rows_start,
+        Appointment.appointment_date <= rows_end
+    )
+    
+    if stylist_id_int:
+        query = query.filter(Appointment.stylist_id == stylist_id_int)
+    
     if status_filter:
         query = query.filter(Appointment.status == status_filter)
     
     appointments = query.order_by(Appointment.appointment_date, Appointment.start_time).all()
     
-    # Create a helper function to get appointments for a specific time slot
-    def get_appointments_for_slot(appointments, target_date, target_hour, target_minute):
-        return [apt for apt in appointments 
-                if apt.appointment_date == target_date 
-                and apt.start_time.hour == target_hour 
-                and apt.start_time.minute == target_minute]
+    if month_summary:
+        calendar_grid = None
+        status_counts = month_summary['statuses']
+    else:
+        # Index appointments by (date, stylist, slot) once so the template only does lookups
+        calendar_grid = CalendarService.build_week_grid(appointments, start_date)
+        status_counts = Counter(appointment.status for appointment in appointments)
     
     return render_template('appointments/admin_calendar.html',
                          appointments=appointments,
+                         calendar_grid=calendar_grid,
+                         month_summary=month_summary,
+                         status_counts=status_counts,
+                         calendar_token=calendar_token,
                          stylists=stylists,
                          start_date=start_date,
                          end_date=end_date,
@@ -348,8 +385,7 @@ def admin_appointments():
                          title='All Appointments',
                          timedelta=timedelta,
                          calendar=calendar,
-                         date=date,
-                         get_appointments_for_slot=get_appointments_for_slot)
+                         date=date)
 
 @bp.route('/appointment/<int:appointment_id>')
 @login_required
@@ -384,6 +420,17 @@ def edit_appointment(appointment_id):
     
     if form.validate_on_submit():
         old_status = appointment.status
+        
+        # Reactivating a booking must not double-book the stylist, so lock and check as booking does
+        if old_status not in ACTIVE_STATUSES and form.status.data in ACTIVE_STATUSES:
+            AvailabilityService.lock_stylist_day(appointment.stylist_id, appointment.appointment_date)
+            if AvailabilityService.has_conflicting_appointment(
+                    appointment.stylist_id, appointment.appointment_date,
+                    appointment.start_time, appointment.end_time, exclude_id=appointment.id):
+                db.session.rollback()
+                flash('This time slot conflicts with an existing appointment. Please choose a different time.', 'error')
+                return redirect(url_for('appointments.edit_appointment', appointment_id=appointment.id))
+        
         appointment.status = form.status.data
         appointment.notes = form.notes.data
         
@@ -397,19 +444,17 @@ def edit_appointment(appointment_id):
             )
             db.session.add(status_record)
         
-        db.session.commit()
-        
         # HR System Integration - Recalculate cost if status changed to completed
         if old_status != form.status.data and form.status.data == 'completed':
-            try:
-                cost_record = HRService.calculate_appointment_cost(appointment.id)
-                if cost_record:
-                    current_app.logger.info(f"Cost recalculated for completed appointment {appointment.id}: "
-                                           f"Revenue £{cost_record.service_revenue}, "
-                                           f"Stylist Cost £{cost_record.stylist_cost}, "
-                                           f"Profit £{cost_record.salon_profit}")
-            except Exception as e:
-                current_app.logger.error(f"Failed to recalculate cost for appointment {appointment.id}: {str(e)}")
+            CostQueue.enqueue([appointment.id])
+        
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # The PostgreSQL no-overlap constraint caught a concurrent booking
+            db.session.rollback()
+            flash('This time slot conflicts with an existing appointment. Please choose a different time.', 'error')
+            return redirect(url_for('appointments.edit_appointment', appointment_id=appointment_id))
         
         flash('Appointment updated successfully!', 'success')
         return redirect(url_for('appointments.view_appointment', appointment_id=appointment.id))
@@ -670,23 +715,22 @@ def delete_stylist_timing(timing_id):
     return redirect(url_for('appointments.manage_stylist_timings'))
 
 # API endpoints for calendar data
-@bp.route('/api/appointments')
-@login_required
-def api_appointments():
+def _parse_calendar_range():
+    """Parse the start/end query arguments, returning None if missing or invalid"""
     start_date = request.args.get('start')
     end_date = request.args.get('end')
-    stylist_id = request.args.get('stylist_id')
-    
     if not start_date or not end_date:
-        return jsonify([])
+        return None
     
     try:
-        start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-        end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+        return (datetime.strptime(start_date, '%Y-%m-%d').date(),
+                datetime.strptime(end_date, '%Y-%m-%d').date())
     except ValueError:
-        return jsonify([])
-    
-    query = Appointment.query.filter(
+        return None
+
+def _calendar_event_query(start_date, end_date, stylist_id=None):
+    """Appointments in a date range that the current user may see on a calendar"""
+    query = Appointment.query.options(*QueryProfiles.appointment_events()).filter(
         Appointment.appointment_date >= start_date,
         Appointment.appointment_date <= end_date
     )
@@ -704,21 +748,107 @@ def api_appointments():
     elif current_user.has_role('customer'):
         query = query.filter(Appointment.customer_id == current_user.id)
     
-    appointments = query.all()
-    
-    events = []
-    for appointment in appointments:
-        events.append({
-            'id': appointment.id,
-            'title': f"{appointment.customer.first_name} {appointment.customer.last_name} - {appointment.service.name}",
-            'start': f"{appointment.appointment_date.isoformat()}T{appointment.start_time.isoformat()}",
-            'end': f"{appointment.appointment_date.isoformat()}T{appointment.end_time.isoformat()}",
-            'status': appointment.status,
-            'url': url_for('appointments.view_appointment', appointment_id=appointment.id)
-        })
+    return query
+
+def _calendar_event(appointment):
+    """Serialise an appointment as a calendar event"""
+    return {
+        'id': appointment.id,
+        'title': f"{appointment.customer.first_name} {appointment.customer.last_name} - {appointment.service.name}",
+        'start': f"{appointment.appointment_date.isoformat()}T{appointment.start_time.isoformat()}",
+        'end': f"{appointment.appointment_date.isoformat()}T{appointment.end_time.isoformat()}",
+        'stylist_id': appointment.stylist_id,
+        'status': appointment.status,
+        'url': url_for('appointments.view_appointment', appointment_id=appointment.id)
+    }
+
+@bp.route('/api/appointments')
+@login_required
+def api_appointments():
+    date_range = _parse_calendar_range()
+    if not date_range:
+        return jsonify([])
+    
+    appointments = _calendar_event_query(*date_range, request.args.get('stylist_id')).all()
+    
+    events = [_calendar_event(appointment) for appointment in appointments]
     
     return jsonify(events)
 
+@bp.route('/api/appointments/changes')
+@login_required
+def api_appointment_changes():
+    """API endpoint returning appointments created or changed since a change token
+    
+    Without a `since` token only a fresh token is returned, for a calendar that has
+    just been loaded in full. Cancellations come through as status changes.
+    """
+    date_range = _parse_calendar_range()
+    if not date_range:
+        return jsonify({'error': 'start and end dates are required'}), 400
+    
+    token = request.args.get('since')
+    if not token:
+        return jsonify({'token': CalendarService.current_change_token(), 'events': []})
+    
+    query = _calendar_event_query(*date_range, request.args.get('stylist_id'))
+    try:
+        appointments, token = CalendarService.get_changes_since(query, token)
+    except ValueError:
+        return jsonify({'error': 'Invalid change token'}), 400
+    
+    return jsonify({
+        'token': token,
+        'events': [_calendar_event(appointment) for appointment in appointments]
+    })
+
+@bp.route('/api/appointments/stream')
+@login_required
+def api_appointment_stream():
+    """Server-Sent Events stream of calendar changes
+    
+    Polls for changes every CALENDAR_STREAM_POLL_SECONDS and closes after
+    CALENDAR_STREAM_SECONDS so a worker is never held indefinitely; the browser
+    reconnects and resumes from the Last-Event-ID it was sent.
+    """
+    date_range = _parse_calendar_range()
+    if not date_range:
+        return jsonify({'error': 'start and end dates are required'}), 400
+    
+    token = (request.headers.get('Last-Event-ID') or request.args.get('since')
+             or CalendarService.current_change_token())
+    try:
+        CalendarService.parse_change_token(token)
+    except ValueError:
+        return jsonify({'error': 'Invalid change token'}), 400
+    
+    query = _calendar_event_query(*date_range, request.args.get('stylist_id'))
+    duration = current_app.config.get('CALENDAR_STREAM_SECONDS', 55)
+    poll_seconds = current_app.config.get('CALENDAR_STREAM_POLL_SECONDS', 5)
+    
+    @stream_with_context
+    def generate(token):
+        deadline = timer.monotonic() + duration
+        yield f"retry: {poll_seconds * 1000}\n\n"
+        while True:
+            appointments, token = CalendarService.get_changes_since(query, token)
+            events = [_calendar_event(appointment) for appointment in appointments]
+            # End the read transaction so the next poll sees newly committed changes
+            db.session.rollback()
+            
+            if events:
+                payload = json.dumps({'token': token, 'events': events})
+                yield f"id: {token}\nevent: changes\ndata: {payload}\n\n"
+            else:
+                yield f"id: {token}\n: keepalive\n\n"
+            
+            if timer.monotonic() >= deadline:
+                break
+            timer.sleep(poll_seconds)
+    
+    return Response(generate(token), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 
 
 
@@ -772,7 +902,11 @@ def api_service_details(service_id):
 @bp.route('/api/available-slots')
 @login_required
 def api_available_slots():
-    """API endpoint to get available time slots for a date and stylist"""
+    """API endpoint to get available time slots for a date and stylist
+    
+    Optional `service_ids` (repeated or comma-separated) restrict the slots to
+    start times where the full duration of the chosen services fits.
+    """
     date_str = request.args.get('date')
     stylist_id = request.args.get('stylist_id', type=int)
     
@@ -784,10 +918,22 @@ def api_available_slots():
     except ValueError:
         return jsonify({'error': 'Invalid date format'}), 400
     
+    try:
+        service_ids = [int(value) for param in request.args.getlist('service_ids')
+                       for value in param.split(',') if value.strip()]
+    except ValueError:
+        return jsonify({'error': 'Invalid service_ids'}), 400
+    
+    # Work out the block length needed for the chosen services
+    duration = AvailabilityService.calculate_required_duration(service_ids, stylist_id)
+    if service_ids and duration is None:
+        return jsonify({'error': 'Unknown service_ids'}), 400
+    
     # Get available slots
     available_slots = SalonHoursService.generate_available_time_slots(
         appointment_date, 
-        stylist_id
+        stylist_id,
+        duration_minutes=duration
     )
     
     # Get salon hours for this date
@@ -803,5 +949,54 @@ def api_available_slots():
     return jsonify({
         'slots': available_slots,
         'salon_hours': salon_hours,
+        'duration': duration,
         'date': date_str
-    }) 
\ No newline at end of file
+    })
+
+@bp.route('/api/earliest-availability')
+@login_required
+def api_earliest_availability():
+    """API endpoint to find the earliest options across all stylists for a set of services"""
+    try:
+        service_ids = [int(value) for param in request.args.getlist('service_ids')
+                       for value in param.split(',') if value.strip()]
+    except ValueError:
+        return jsonify({'error': 'Invalid service_ids'}), 400
+    
+    if not service_ids:
+        return jsonify({'error': 'service_ids parameter is required'}), 400
+    
+    start_str = request.args.get('start')
+    try:
+        start_date = datetime.strptime(start_str, '%Y-%m-%d').date() if start_str else date.today()
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+    
+    days = min(max(request.args.get('days', 14, type=int), 1), 90)
+    limit = min(max(request.args.get('limit', 5, type=int), 1), 50)
+    
+    # Customers always search for themselves; staff may search on behalf of a customer
+    customer_id = request.args.get('customer_id', type=int)
+    if current_user.has_role('customer'):
+        customer_id = current_user.id
+    
+    options = AvailabilityService.find_earliest_availability(
+        service_ids, start_date, days=days, limit=limit, customer_id=customer_id
+    )
+    
+    return jsonify({
+        'options': [
+            {
+                'stylist_id': option['stylist_id'],
+                'stylist_name': option['stylist_name'],
+                'date': option['date'].isoformat(),
+                'start': option['start_time'].strftime('%H:%M'),
+                'end': option['end_time'].strftime('%H:%M'),
+                'duration': option['duration'],
+                'preferred': option['preferred']
+            }
+            for option in options
+        ],
+        'start': start_date.isoformat(),
+        'days': days
+    })
@@ -3,6 +3,7 @@ from flask_login import current_user, login_required
 from app.models import User, Role
 from app.forms import HolidayRequestForm
 from app.services.holiday_service import HolidayService
+from app.services.query_profiles import QueryProfiles
 from functools import wraps
 
 bp = Blueprint('main', __name__)
@@ -37,13 +38,13 @@ def dashboard():
         from datetime import date, timedelta
         
         today = date.today()
-        upcoming_appointments = Appointment.query.filter(
+        upcoming_appointments = Appointment.query.options(*QueryProfiles.stylist_dashboard()).filter(
             Appointment.stylist_id == current_user.id,
             Appointment.appointment_date >= today,
             Appointment.status.in_(['confirmed', 'completed'])
         ).order_by(Appointment.appointment_date, Appointment.start_time).limit(5).all()
         
-        today_appointments = Appointment.query.filter(
+        today_appointments = Appointment.query.options(*QueryProfiles.stylist_dashboard()).filter(
             Appointment.stylist_id == current_user.id,
             Appointment.appointment_date == today,
             Appointment.status == 'confirmed'
@@ -59,13 +60,13 @@ def dashboard():
         from datetime import date
         
         today = date.today()
-        upcoming_appointments = Appointment.query.filter(
+        upcoming_appointments = Appointment.query.options(*QueryProfiles.customer_dashboard()).filter(
             Appointment.customer_id == current_user.id,
             Appointment.appointment_date >= today,
             Appointment.status.in_(['confirmed', 'completed'])
         ).order_by(Appointment.appointment_date, Appointment.start_time).limit(5).all()
         
-        past_appointments = Appointment.query.filter(
+        past_appointments = Appointment.query.options(*QueryProfiles.customer_dashboard()).filter(
             Appointment.customer_id == current_user.id,
             Appointment.appointment_date < today
         ).order_by(Appointment.appointment_date.desc(), Appointment.start_time.desc()).limit(3).all()
@@ -106,7 +107,7 @@ def holiday_request():
     form = HolidayRequestForm()
     
     # Get user's holiday quota
-    quota = HolidayService.get_or_create_holiday_quota(current_user.id)
+    quota = HolidayService.get_holiday_quota(current_user.id)
     
     # Get recent requests
     recent_requests = HolidayService.get_user_holiday_requests(current_user.id)[:5]
@@ -7,10 +7,17 @@ Provides comprehensive analytics for holiday, commission, and staff utilization
 from app import db
 from app.models import (
     User, Role, Appointment, AppointmentCost, EmploymentDetails,
-    HolidayRequest, HolidayQuota, WorkPattern, Service, BillingElement
+    HolidayRequest, HolidayQuota, WorkPattern, Service, BillingElement, DailyStylistRollup
 )
 from app.services.hr_service import HRService
 from app.services.holiday_service import HolidayService
+from app.services.billing_ledger import BillingLedgerService
+from app.services.capacity_service import CapacityService, CAPACITY_OVER_UTILIZATION, CAPACITY_UNDER_UTILIZATION
+from app.services.date_buckets import bucket_label, date_bucket
+from app.services.holiday_coverage import HolidayCoverageService
+from app.services.report_cache import ReportCache
+from app.services.staff_directory import StaffDirectory
+from app.services.utilization_service import UtilizationService
 from decimal import Decimal
 from datetime import datetime, date, timedelta
 from sqlalchemy import func, and_, or_, case
@@ -21,6 +28,7 @@ class AnalyticsService:
     """Comprehensive analytics service for advanced reporting features"""
 
     @staticmethod
+    @ReportCache.cached('appointments', 'costs', 'holidays', 'employment')
     def get_executive_dashboard_data(start_date=None, end_date=None):
         """Get high-level KPIs for executive dashboard"""
         if not start_date:
@@ -33,10 +41,18 @@ class AnalyticsService:
         
         # Staff metrics
         total_stylists = User.query.join(User.roles).filter(Role.name == 'stylist').count()
-        active_stylists = Appointment.query.filter(
-            Appointment.appointment_date >= start_date,
-            Appointment.appointment_date <= end_date
-        ).with_entities(Appointment.stylist_id).distinct().count()
+        
+        # Active stylists and appointment totals from the daily rollups
+        appointment_totals = db.session.query(
+            func.count(func.distinct(DailyStylistRollup.stylist_id)).label('active_stylists'),
+            func.sum(DailyStylistRollup.appointment_count).label('total_appointments')
+        ).filter(
+            DailyStylistRollup.date >= start_date,
+            DailyStylistRollup.date <= end_date,
+            DailyStylistRollup.appointment_count > 0
+        ).first()
+        active_stylists = appointment_totals.active_stylists or 0
+        total_appointments = int(appointment_totals.total_appointments or 0)
 
         # Holiday metrics
         holiday_requests = HolidayRequest.query.filter(
@@ -50,12 +66,6 @@ class AnalyticsService:
             HolidayRequest.status == 'approved'
         ).count()
 
-        # Appointment metrics
-        total_appointments = Appointment.query.filter(
-            Appointment.appointment_date >= start_date,
-            Appointment.appointment_date <= end_date
-        ).count()
-
         return {
             'revenue': revenue_data.get('total_revenue', 0),
             'commission': revenue_data.get('total_commission', 0),
@@ -73,32 +83,32 @@ class AnalyticsService:
         }
 
     @staticmethod
-    def analyze_holiday_trends(start_date=None, end_date=None):
-        """Analyze holiday request patterns and trends"""
+    @ReportCache.cached('holidays')
+    def analyze_holiday_trends(start_date=None, end_date=None, bucket='month'):
+        """Analyze holiday request patterns and trends, per day, week, month or quarter"""
         if not start_date:
             start_date = date.today() - timedelta(days=90)
         if not end_date:
             end_date = date.today()
 
-        # Monthly holiday request trends
+        # Holiday request trends per period
+        period = date_bucket(bucket, HolidayRequest.start_date).label('period')
         monthly_trends = db.session.query(
-            func.to_char(HolidayRequest.start_date, 'YYYY-MM').label('month'),
+            period,
             func.count(HolidayRequest.id).label('total_requests'),
-            func.count(case([(HolidayRequest.status == 'approved', 1)])).label('approved'),
-            func.count(case([(HolidayRequest.status == 'rejected', 1)])).label('rejected'),
-            func.count(case([(HolidayRequest.status == 'pending', 1)])).label('pending')
+            func.count(case((HolidayRequest.status == 'approved', 1))).label('approved'),
+            func.count(case((HolidayRequest.status == 'rejected', 1))).label('rejected'),
+            func.count(case((HolidayRequest.status == 'pending', 1))).label('pending')
         ).filter(
             HolidayRequest.start_date >= start_date,
             HolidayRequest.start_date <= end_date
-        ).group_by(
-            func.to_char(HolidayRequest.start_date, 'YYYY-MM')
-        ).order_by('month').all()
+        ).group_by(period).order_by(period).all()
 
         # Staff holiday utilization
         staff_utilization = db.session.query(
             User.username,
             func.count(HolidayRequest.id).label('total_requests'),
-            func.count(case([(HolidayRequest.status == 'approved', 1)])).label('approved_requests'),
+            func.count(case((HolidayRequest.status == 'approved', 1))).label('approved_requests'),
             func.avg(HolidayRequest.days_requested).label('avg_duration')
         ).join(
             HolidayRequest, User.id == HolidayRequest.user_id
@@ -113,7 +123,7 @@ class AnalyticsService:
         return {
             'monthly_trends': [
                 {
-                    'month': trend.month,
+                    'month': bucket_label(trend.period, bucket),
                     'total_requests': trend.total_requests,
                     'approved': trend.approved,
                     'rejected': trend.rejected,
@@ -137,103 +147,74 @@ class AnalyticsService:
 
     @staticmethod
     def _detect_holiday_conflicts(start_date, end_date):
-        """Detect potential holiday scheduling conflicts"""
-        conflicts = []
-        
-        # Find overlapping holiday requests
-        overlapping_requests = db.session.query(
-            HolidayRequest.id,
-            HolidayRequest.user_id,
-            HolidayRequest.start_date,
-            HolidayRequest.end_date,
-            User.username
-        ).join(User, User.id == HolidayRequest.user_id).filter(
-            HolidayRequest.start_date <= end_date,
-            HolidayRequest.end_date >= start_date,
-            HolidayRequest.status == 'approved'
-        ).all()
+        """Detect days on which too many staff are on approved holiday"""
+        windows = HolidayCoverageService.get_conflicts(start_date, end_date)
+        names = StaffDirectory.get_names({user_id for window in windows for user_id in window['user_ids']})
 
-        # Check for multiple staff on holiday simultaneously
-        for request in overlapping_requests:
-            overlapping_count = HolidayRequest.query.filter(
-                HolidayRequest.status == 'approved',
-                HolidayRequest.start_date <= request.end_date,
-                HolidayRequest.end_date >= request.start_date
-            ).count()
-            
-            if overlapping_count > 2:  # More than 2 staff on holiday at same time
-                conflicts.append({
-                    'type': 'multiple_staff_holiday',
-                    'date_range': f"{request.start_date} to {request.end_date}",
-                    'affected_staff': overlapping_count,
-                    'description': f"{overlapping_count} staff members on holiday simultaneously"
-                })
-
-        return conflicts
+        return [
+            {
+                'type': 'multiple_staff_holiday',
+                'date_range': f"{window['start']} to {window['end']}",
+                'affected_staff': window['peak'],
+                'staff': sorted(names.get(user_id, 'Unknown') for user_id in window['user_ids']),
+                'description': f"{window['peak']} staff members on holiday simultaneously"
+            }
+            for window in windows
+        ]
 
     @staticmethod
-    def analyze_commission_trends(start_date=None, end_date=None):
-        """Analyze commission performance trends"""
+    @ReportCache.cached('appointments', 'costs')
+    def analyze_commission_trends(start_date=None, end_date=None, bucket='month'):
+        """Analyze commission performance trends, per day, week, month or quarter"""
         if not start_date:
             start_date = date.today() - timedelta(days=90)
         if not end_date:
             end_date = date.today()
 
-        # Monthly commission trends
+        # Commission trends per period from the daily rollups
+        in_range = and_(
+            DailyStylistRollup.date >= start_date,
+            DailyStylistRollup.date <= end_date,
+            DailyStylistRollup.booked_commission_count > 0
+        )
+        period = date_bucket(bucket, DailyStylistRollup.date).label('period')
         monthly_commission = db.session.query(
-            func.to_char(Appointment.appointment_date, 'YYYY-MM').label('month'),
-            func.sum(AppointmentCost.service_revenue).label('total_revenue'),
-            func.sum(AppointmentCost.commission_amount).label('total_commission'),
-            func.avg(AppointmentCost.commission_amount).label('avg_commission')
-        ).join(
-            AppointmentCost, Appointment.id == AppointmentCost.appointment_id
-        ).filter(
-            Appointment.appointment_date >= start_date,
-            Appointment.appointment_date <= end_date,
-            AppointmentCost.commission_amount > 0
-        ).group_by(
-            func.to_char(Appointment.appointment_date, 'YYYY-MM')
-        ).order_by('month').all()
+            period,
+            func.sum(DailyStylistRollup.booked_commission_revenue).label('total_revenue'),
+            func.sum(DailyStylistRollup.booked_commission_amount).label('total_commission'),
+            func.sum(DailyStylistRollup.booked_commission_count).label('appointment_count')
+        ).filter(in_range).group_by(period).order_by(period).all()
 
         # Stylist performance rankings
         stylist_rankings = db.session.query(
             User.username,
-            func.sum(AppointmentCost.service_revenue).label('total_revenue'),
-            func.sum(AppointmentCost.commission_amount).label('total_commission'),
-            func.avg(AppointmentCost.commission_amount).label('avg_commission'),
-            func.count(Appointment.id).label('appointment_count')
+            func.sum(DailyStylistRollup.booked_commission_revenue).label('total_revenue'),
+            func.sum(DailyStylistRollup.booked_commission_amount).label('total_commission'),
+            func.sum(DailyStylistRollup.booked_commission_count).label('appointment_count')
         ).join(
-            Appointment, User.id == Appointment.stylist_id
-        ).join(
-            AppointmentCost, Appointment.id == AppointmentCost.appointment_id
-        ).filter(
-            Appointment.appointment_date >= start_date,
-            Appointment.appointment_date <= end_date,
-            AppointmentCost.commission_amount > 0
-        ).group_by(User.id, User.username).order_by(
-            func.sum(AppointmentCost.commission_amount).desc()
+            DailyStylistRollup, User.id == DailyStylistRollup.stylist_id
+        ).filter(in_range).group_by(User.id, User.username).order_by(
+            func.sum(DailyStylistRollup.booked_commission_amount).desc()
         ).all()
 
-        # Billing element performance
-        billing_elements = BillingElement.get_active_elements()
+        # Billing element performance from the element ledger
+        element_totals = BillingLedgerService.element_performance(start_date, end_date)
         element_performance = {}
-        
-        for element in billing_elements:
-            # This would require more complex querying based on billing_elements_applied JSON
-            # For now, we'll provide a placeholder structure
+        for element in BillingElement.get_active_elements():
+            totals = element_totals.get(element.id, {})
             element_performance[element.name] = {
                 'percentage': float(element.percentage),
-                'total_revenue': 0,  # Would need to calculate from JSON data
-                'commission_generated': 0  # Would need to calculate from JSON data
+                'total_revenue': totals.get('total_revenue', 0),
+                'commission_generated': totals.get('commission_generated', 0)
             }
 
         return {
             'monthly_trends': [
                 {
-                    'month': trend.month,
+                    'month': bucket_label(trend.period, bucket),
                     'total_revenue': float(trend.total_revenue) if trend.total_revenue else 0,
                     'total_commission': float(trend.total_commission) if trend.total_commission else 0,
-                    'avg_commission': float(trend.avg_commission) if trend.avg_commission else 0,
+                    'avg_commission': float(trend.total_commission) / trend.appointment_count if trend.appointment_count else 0,
                     'commission_rate': (float(trend.total_commission) / float(trend.total_revenue) * 100) if trend.total_revenue else 0
                 }
                 for trend in monthly_commission
@@ -243,7 +224,7 @@ class AnalyticsService:
                     'username': ranking.username,
                     'total_revenue': float(ranking.total_revenue) if ranking.total_revenue else 0,
                     'total_commission': float(ranking.total_commission) if ranking.total_commission else 0,
-                    'avg_commission': float(ranking.avg_commission) if ranking.avg_commission else 0,
+                    'avg_commission': float(ranking.total_commission) / ranking.appointment_count if ranking.appointment_count else 0,
                     'appointment_count': ranking.appointment_count,
                     'commission_efficiency': (float(ranking.total_commission) / float(ranking.total_revenue) * 100) if ranking.total_revenue else 0
                 }
@@ -253,6 +234,7 @@ class AnalyticsService:
         }
 
     @staticmethod
+    @ReportCache.cached('appointments', 'costs', 'holidays', 'employment')
     def calculate_staff_utilization(start_date=None, end_date=None):
         """Calculate comprehensive staff utilization metrics"""
         if not start_date:
@@ -260,54 +242,7 @@ class AnalyticsService:
         if not end_date:
             end_date = date.today()
 
-        # Get all stylists
-        stylists = User.query.join(User.roles).filter(Role.name == 'stylist').all()
-        
-        utilization_data = []
-        
-        for stylist in stylists:
-            # Get work pattern
-            work_pattern = WorkPattern.query.filter_by(user_id=stylist.id).first()
-            
-            # Get appointments in date range
-            appointments = Appointment.query.filter(
-                Appointment.stylist_id == stylist.id,
-                Appointment.appointment_date >= start_date,
-                Appointment.appointment_date <= end_date
-            ).all()
-            
-            # Calculate scheduled hours
-            scheduled_hours = 0
-            if work_pattern:
-                # Calculate total scheduled hours based on work pattern
-                # This is a simplified calculation - would need more complex logic
-                scheduled_hours = 40  # Placeholder
-            
-            # Calculate actual hours (from appointments)
-            actual_hours = sum(appointment.duration_minutes / 60.0 for appointment in appointments)
-            
-            # Calculate utilization rate
-            utilization_rate = (actual_hours / scheduled_hours * 100) if scheduled_hours > 0 else 0
-            
-            # Calculate revenue per hour
-            total_revenue = sum(
-                float(AppointmentCost.query.filter_by(appointment_id=appointment.id).first().service_revenue)
-                for appointment in appointments
-                if AppointmentCost.query.filter_by(appointment_id=appointment.id).first()
-            )
-            
-            revenue_per_hour = (total_revenue / actual_hours) if actual_hours > 0 else 0
-            
-            utilization_data.append({
-                'username': stylist.username,
-                'scheduled_hours': scheduled_hours,
-                'actual_hours': actual_hours,
-                'utilization_rate': utilization_rate,
-                'appointment_count': len(appointments),
-                'total_revenue': float(total_revenue),
-                'revenue_per_hour': float(revenue_per_hour),
-                'avg_appointment_duration': (actual_hours / len(appointments)) if appointments else 0
-            })
+        utilization_data = UtilizationService.calculate_team_utilization(start_date, end_date)
         
         return {
             'staff_utilization': utilization_data,
@@ -318,54 +253,52 @@ class AnalyticsService:
         }
 
     @staticmethod
-    def generate_capacity_recommendations():
-        """Generate capacity planning recommendations"""
-        # Analyze current capacity vs demand
-        current_appointments = Appointment.query.filter(
-            Appointment.appointment_date >= date.today(),
-            Appointment.appointment_date <= date.today() + timedelta(days=30)
-        ).all()
-        
-        # Group by date and stylist
-        daily_capacity = {}
-        for appointment in current_appointments:
-            date_key = appointment.appointment_date.strftime('%Y-%m-%d')
-            if date_key not in daily_capacity:
-                daily_capacity[date_key] = {}
-            
-            stylist_id = appointment.stylist_id
-            if stylist_id not in daily_capacity[date_key]:
-                daily_capacity[date_key][stylist_id] = 0
-            
-            daily_capacity[date_key][stylist_id] += appointment.duration_minutes / 60.0
-        
+    @ReportCache.cached('appointments', 'holidays', 'employment')
+    def generate_capacity_recommendations(days=30):
+        """Generate capacity planning recommendations from booked demand against staffed capacity"""
+        start_date = date.today()
+        analysis = CapacityService.analyze(start_date, start_date + timedelta(days=days))
+
+        # The longest over or under capacity stretch of each day, to say when to act
+        longest_windows = {}
+        for window in analysis['windows']:
+            key = (window['date'], window['type'])
+            if key not in longest_windows or window['minutes'] > longest_windows[key]['minutes']:
+                longest_windows[key] = window
+
         recommendations = []
-        
-        for date_key, stylist_data in daily_capacity.items():
-            total_hours = sum(stylist_data.values())
-            stylist_count = len(stylist_data)
-            
-            # Simple capacity analysis
-            if total_hours > 40:  # Over capacity
-                recommendations.append({
-                    'date': date_key,
-                    'type': 'over_capacity',
-                    'description': f"High demand day - {total_hours} hours scheduled",
-                    'suggestion': 'Consider adding temporary staff or extending hours'
-                })
-            elif total_hours < 20:  # Under capacity
-                recommendations.append({
-                    'date': date_key,
-                    'type': 'under_capacity',
-                    'description': f"Low demand day - {total_hours} hours scheduled",
-                    'suggestion': 'Consider promotional activities or staff training'
-                })
-        
+        staffed_days = [day for day in analysis['days'] if day['staffed_hours'] > 0]
+        for day in staffed_days:
+            if day['utilization'] >= CAPACITY_OVER_UTILIZATION:
+                recommendation_type = 'over_capacity'
+                description = f"High demand day - {day['utilization']:.0f}% of staffed time booked"
+                suggestion = 'Consider adding temporary staff or extending hours'
+            elif day['utilization'] <= CAPACITY_UNDER_UTILIZATION:
+                recommendation_type = 'under_capacity'
+                description = f"Low demand day - {day['utilization']:.0f}% of staffed time booked"
+                suggestion = 'Consider promotional activities or staff training'
+            else:
+                continue
+
+            description += f" ({day['booked_hours']:.1f} of {day['staffed_hours']:.1f} hours)"
+            window = longest_windows.get((day['date'], recommendation_type))
+            if window:
+                description += f", mainly {window['start']}-{window['end']}"
+
+            recommendations.append({
+                'date': day['date'].strftime('%Y-%m-%d'),
+                'type': recommendation_type,
+                'description': description,
+                'suggestion': suggestion
+            })
+
         return {
             'recommendations': recommendations,
+            'heatmap': analysis['heatmap'],
+            'windows': analysis['windows'],
             'capacity_analysis': {
-                'total_days_analyzed': len(daily_capacity),
+                'total_days_analyzed': len(staffed_days),
                 'over_capacity_days': len([r for r in recommendations if r['type'] == 'over_capacity']),
                 'under_capacity_days': len([r for r in recommendations if r['type'] == 'under_capacity'])
             }
-        } 
\ No newline at end of file
+        }
\ No newline at end of file
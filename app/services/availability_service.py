@@ -0,0 +1,367 @@
+from datetime import time, timedelta
+from bisect import bisect_left
+from collections import defaultdict
+from sqlalchemy import text
+from app.models import (
+    Appointment, Service, StylistServiceTiming, StylistServiceAssociation,
+    User, Role, UserProfile, HolidayRequest
+)
+from app.extensions import db
+from app.services.schedule_cache import ScheduleCache, NO_PATTERN
+from app.utils import uk_now
+
+# Appointment statuses that occupy a stylist's time
+ACTIVE_STATUSES = ('confirmed', 'completed')
+
+# Length assumed for a slot when the services being booked are not known
+DEFAULT_SLOT_DURATION = 30
+
+
+class AvailabilityService:
+    """Interval-based availability engine working in integer minutes from midnight"""
+
+    @staticmethod
+    def time_to_minutes(time_obj):
+        """Convert a time object to minutes from midnight"""
+        return time_obj.hour * 60 + time_obj.minute
+
+    @staticmethod
+    def minutes_to_time(minutes):
+        """Convert minutes from midnight to a time object"""
+        minutes = minutes % (24 * 60)
+        return time(minutes // 60, minutes % 60)
+
+    @staticmethod
+    def merge_intervals(intervals):
+        """Sort and merge overlapping or touching (start, end) minute intervals"""
+        merged = []
+        for start, end in sorted(intervals):
+            if end <= start:
+                continue
+            if merged and start <= merged[-1][1]:
+                if end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        return merged
+
+    @staticmethod
+    def load_busy_intervals(stylist_id, appointment_date):
+        """Load a stylist's booked time for a day as merged minute intervals (one query)"""
+        if not stylist_id:
+            return []
+
+        rows = db.session.query(
+            Appointment.start_time,
+            Appointment.end_time
+        ).filter(
+            Appointment.stylist_id == stylist_id,
+            Appointment.appointment_date == appointment_date,
+            Appointment.status.in_(ACTIVE_STATUSES)
+        ).all()
+
+        return AvailabilityService.merge_intervals(
+            (AvailabilityService.time_to_minutes(row.start_time),
+             AvailabilityService.time_to_minutes(row.end_time))
+            for row in rows
+        )
+
+    @staticmethod
+    def load_busy_intervals_for_range(stylist_ids, start_date, end_date):
+        """Load booked time for several stylists over a date range in a single query
+
+        Returns a dict keyed by (stylist_id, date) of merged minute intervals.
+        """
+        if not stylist_ids:
+            return {}
+
+        rows = db.session.query(
+            Appointment.stylist_id,
+            Appointment.appointment_date,
+            Appointment.start_time,
+            Appointment.end_time
+        ).filter(
+            Appointment.stylist_id.in_(stylist_ids),
+            Appointment.appointment_date >= start_date,
+            Appointment.appointment_date <= end_date,
+            Appointment.status.in_(ACTIVE_STATUSES)
+        ).all()
+
+        intervals = defaultdict(list)
+        for row in rows:
+            intervals[(row.stylist_id, row.appointment_date)].append(
+                (AvailabilityService.time_to_minutes(row.start_time),
+                 AvailabilityService.time_to_minutes(row.end_time))
+            )
+
+        return {key: AvailabilityService.merge_intervals(value) for key, value in intervals.items()}
+
+    @staticmethod
+    def is_free(busy, start, end):
+        """Check that [start, end) does not overlap any merged busy interval"""
+        # Only the last interval starting before `end` can overlap
+        index = bisect_left(busy, (end,)) - 1
+        return index < 0 or busy[index][1] <= start
+
+    @staticmethod
+    def has_conflicting_appointment(stylist_id, appointment_date, start_time, end_time, exclude_id=None):
+        """Check whether a stylist already has an active booking overlapping [start, end)"""
+        query = Appointment.query.filter(
+            Appointment.stylist_id == stylist_id,
+            Appointment.appointment_date == appointment_date,
+            Appointment.status.in_(ACTIVE_STATUSES),
+            Appointment.start_time < end_time,
+            Appointment.end_time > start_time
+        )
+        if exclude_id:
+            query = query.filter(Appointment.id != exclude_id)
+        return db.session.query(query.exists()).scalar()
+
+    @staticmethod
+    def lock_stylist_day(stylist_id, appointment_date):
+        """Serialise bookings for one stylist on one day until the transaction ends
+
+        PostgreSQL takes a transaction-scoped advisory lock keyed by (stylist, day),
+        so bookings for other stylists or days never wait. Other databases fall
+        back to locking the stylist's user row; SQLite ignores this and relies on
+        its single-writer locking instead.
+        """
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(
+                text('SELECT pg_advisory_xact_lock(:stylist_id, :day)'),
+                {'stylist_id': stylist_id, 'day': appointment_date.toordinal()}
+            )
+        else:
+            db.session.query(User.id).filter(User.id == stylist_id).with_for_update().first()
+
+    @staticmethod
+    def calculate_required_duration(service_ids, stylist_id=None):
+        """Total minutes (duration plus waiting time) needed for a list of service IDs
+
+        Stylist timing overrides are applied when a stylist is given. Services and
+        overrides are loaded together in one query. Returns None if no service matches.
+        """
+        if not service_ids:
+            return None
+
+        timing_join = db.and_(
+            StylistServiceTiming.service_id == Service.id,
+            StylistServiceTiming.stylist_id == stylist_id,
+            StylistServiceTiming.is_active == True
+        )
+        rows = db.session.query(
+            Service.id,
+            Service.duration,
+            Service.waiting_time,
+            StylistServiceTiming.custom_duration,
+            StylistServiceTiming.custom_waiting_time
+        ).outerjoin(
+            StylistServiceTiming, timing_join
+        ).filter(
+            Service.id.in_(set(service_ids))
+        ).all()
+
+        durations = {}
+        for row in rows:
+            duration = row.custom_duration or row.duration
+            waiting_time = row.custom_waiting_time if row.custom_waiting_time is not None else row.waiting_time
+            durations[row.id] = duration + (waiting_time or 0)
+
+        # Count a service once per occurrence in the booking
+        matched = [durations[service_id] for service_id in service_ids if service_id in durations]
+        if not matched:
+            return None
+        return sum(matched)
+
+    @staticmethod
+    def calculate_required_durations(service_ids, stylist_ids):
+        """Total minutes needed for a list of service IDs, per stylist
+
+        Loads the services and all matching stylist timing overrides in two
+        queries. Returns an empty dict if no service matches.
+        """
+        if not service_ids or not stylist_ids:
+            return {}
+
+        services = db.session.query(
+            Service.id, Service.duration, Service.waiting_time
+        ).filter(Service.id.in_(set(service_ids))).all()
+        if not services:
+            return {}
+
+        timings = db.session.query(
+            StylistServiceTiming.stylist_id,
+            StylistServiceTiming.service_id,
+            StylistServiceTiming.custom_duration,
+            StylistServiceTiming.custom_waiting_time
+        ).filter(
+            StylistServiceTiming.service_id.in_(set(service_ids)),
+            StylistServiceTiming.stylist_id.in_(stylist_ids),
+            StylistServiceTiming.is_active == True
+        ).all()
+        overrides = {(timing.stylist_id, timing.service_id): timing for timing in timings}
+
+        durations = {}
+        for stylist_id in stylist_ids:
+            per_service = {}
+            for service in services:
+                timing = overrides.get((stylist_id, service.id))
+                duration = (timing.custom_duration if timing else None) or service.duration
+                waiting_time = service.waiting_time
+                if timing and timing.custom_waiting_time is not None:
+                    waiting_time = timing.custom_waiting_time
+                per_service[service.id] = duration + (waiting_time or 0)
+            durations[stylist_id] = sum(
+                per_service[service_id] for service_id in service_ids if service_id in per_service
+            )
+
+        return durations
+
+    @staticmethod
+    def find_free_starts(open_minutes, close_minutes, busy, interval_minutes=5,
+                         duration_minutes=DEFAULT_SLOT_DURATION, window=None, must_fit=False):
+        """Return start minutes between opening and closing whose block is free
+
+        `window` optionally restricts start times to a (start, end) working range.
+        With `must_fit` the whole block must also end by closing time and the end
+        of the window. Runs as a single sweep over the sorted busy intervals.
+        """
+        first = open_minutes
+        last = close_minutes
+        if window:
+            first = max(first, window[0])
+            last = min(last, window[1])
+        if must_fit:
+            last = last - duration_minutes + 1
+
+        starts = []
+        index = 0
+        for start in range(open_minutes, last, interval_minutes):
+            if start < first:
+                continue
+            end = start + duration_minutes
+            while index < len(busy) and busy[index][1] <= start:
+                index += 1
+            if index < len(busy) and busy[index][0] < end:
+                continue
+            starts.append(start)
+
+        return starts
+
+    @staticmethod
+    def find_earliest_availability(service_ids, start_date, days=14, limit=5,
+                                   customer_id=None, interval_minutes=5):
+        """Find the earliest (stylist, date, start) options for a set of services
+
+        Searches every active stylist who may perform all the services, honouring
+        stylist timings, work patterns, approved holidays and existing bookings.
+        Each option is a stylist's earliest free start on a day. Everything is
+        preloaded once for the whole horizon, so the query count does not grow
+        with the number of stylists or days. On a tie the customer's preferred
+        stylist is ranked first.
+        """
+        end_date = start_date + timedelta(days=days - 1)
+
+        stylists = User.query.join(User.roles).filter(
+            Role.name == 'stylist',
+            User.is_active == True
+        ).order_by(User.first_name, User.last_name).all()
+        if not stylists or not service_ids:
+            return []
+        stylist_ids = [stylist.id for stylist in stylists]
+
+        # A missing association means the stylist is allowed (backward compatibility)
+        blocked = {
+            row.stylist_id for row in db.session.query(StylistServiceAssociation.stylist_id).filter(
+                StylistServiceAssociation.stylist_id.in_(stylist_ids),
+                StylistServiceAssociation.service_id.in_(set(service_ids)),
+                StylistServiceAssociation.is_allowed == False
+            )
+        }
+        stylists = [stylist for stylist in stylists if stylist.id not in blocked]
+        stylist_ids = [stylist.id for stylist in stylists]
+
+        durations = AvailabilityService.calculate_required_durations(service_ids, stylist_ids)
+        if not durations:
+            return []
+
+        ScheduleCache.preload_stylists(stylist_ids)
+
+        holidays = HolidayRequest.query.filter(
+            HolidayRequest.user_id.in_(stylist_ids),
+            HolidayRequest.status == 'approved',
+            HolidayRequest.start_date <= end_date,
+            HolidayRequest.end_date >= start_date
+        ).all()
+        days_off = set()
+        for holiday in holidays:
+            current_date = max(holiday.start_date, start_date)
+            while current_date <= min(holiday.end_date, end_date):
+                days_off.add((holiday.user_id, current_date))
+                current_date += timedelta(days=1)
+
+        busy_by_day = AvailabilityService.load_busy_intervals_for_range(stylist_ids, start_date, end_date)
+
+        preferred_stylist_id = None
+        if customer_id:
+            profile = UserProfile.query.filter_by(user_id=customer_id).first()
+            preferred_stylist_id = profile.preferred_stylist_id if profile else None
+
+        now = uk_now()
+        options = []
+        for offset in range(days):
+            current_date = start_date + timedelta(days=offset)
+            hours = ScheduleCache.get_opening_minutes(current_date)
+            if not hours:
+                continue
+
+            # Never offer start times that have already passed today
+            earliest = 0
+            if current_date == now.date():
+                earliest = now.hour * 60 + now.minute
+            elif current_date < now.date():
+                continue
+
+            day_options = []
+            for rank, stylist in enumerate(stylists):
+                if (stylist.id, current_date) in days_off:
+                    continue
+
+                window = ScheduleCache.get_stylist_window(stylist.id, current_date)
+                if not window:
+                    continue
+                if window == NO_PATTERN:
+                    window = None
+
+                duration = durations[stylist.id]
+                starts = AvailabilityService.find_free_starts(
+                    hours[0], hours[1],
+                    busy_by_day.get((stylist.id, current_date), []),
+                    interval_minutes=interval_minutes,
+                    duration_minutes=duration,
+                    window=window,
+                    must_fit=True
+                )
+                start = next((start for start in starts if start >= earliest), None)
+                if start is None:
+                    continue
+
+                day_options.append({
+                    'stylist_id': stylist.id,
+                    'stylist_name': stylist.full_name,
+                    'date': current_date,
+                    'start_time': AvailabilityService.minutes_to_time(start),
+                    'end_time': AvailabilityService.minutes_to_time(start + duration),
+                    'duration': duration,
+                    'preferred': stylist.id == preferred_stylist_id,
+                    '_sort': (start, stylist.id != preferred_stylist_id, rank)
+                })
+
+            day_options.sort(key=lambda option: option['_sort'])
+            options.extend(day_options)
+            if len(options) >= limit:
+                break
+
+        for option in options:
+            del option['_sort']
+        return options[:limit]
@@ -0,0 +1,163 @@
+from decimal import Decimal
+from sqlalchemy import delete, func, inspect
+from app.models import Appointment, AppointmentCost, AppointmentCostElement, BillingElement
+from app.extensions import db
+
+# Appointments handled per delete/insert round trip
+LEDGER_BATCH_SIZE = 500
+
+
+def _money(value):
+    return Decimal(str(round(float(value or 0), 2)))
+
+
+class BillingLedgerService:
+    """Billing elements applied to each appointment cost, one row per element
+
+    Mirrors AppointmentCost.billing_elements_applied into the narrow, indexed
+    appointment_cost_element table so element performance is a GROUP BY. Rows
+    are rewritten whenever a cost is calculated or its appointment moves, in
+    the same transaction.
+    """
+
+    @staticmethod
+    def element_ids_by_name():
+        """Map element names to IDs, for breakdowns stored before they carried the ID"""
+        ids = {}
+        for element_id, name in db.session.query(BillingElement.id, BillingElement.name).order_by(BillingElement.id):
+            ids.setdefault(name, element_id)
+        return ids
+
+    @staticmethod
+    def ledger_rows(cost_id, stylist_id, appointment_date, elements_applied, element_ids_by_name):
+        """Ledger rows for one cost's billing_elements_applied breakdown"""
+        rows = []
+        for name, element in (elements_applied or {}).items():
+            element_id = element.get('element_id') or element_ids_by_name.get(name)
+            if element_id is None:
+                continue
+            rows.append({
+                'appointment_cost_id': cost_id,
+                'element_id': element_id,
+                'date': appointment_date,
+                'stylist_id': stylist_id,
+                'amount': _money(element.get('amount')),
+                'commission_portion': _money(element.get('commission_portion'))
+            })
+        return rows
+
+    @staticmethod
+    def replace(session, appointment_ids=(), cost_ids=()):
+        """Rewrite the ledger rows for the costs of `appointment_ids` and drop those of `cost_ids`
+
+        Returns the number of ledger rows written.
+        """
+        table = AppointmentCostElement.__table__
+        appointment_ids = sorted(appointment_ids)
+        cost_ids = sorted(cost_ids)
+        if not appointment_ids and not cost_ids:
+            return 0
+
+        element_ids_by_name = BillingLedgerService.element_ids_by_name()
+        written = 0
+        for batch_start in range(0, max(len(appointment_ids), len(cost_ids)), LEDGER_BATCH_SIZE):
+            costs = session.query(
+                AppointmentCost.id,
+                AppointmentCost.stylist_id,
+                Appointment.appointment_date,
+                AppointmentCost.billing_elements_applied
+            ).join(Appointment, Appointment.id == AppointmentCost.appointment_id).filter(
+                AppointmentCost.appointment_id.in_(appointment_ids[batch_start:batch_start + LEDGER_BATCH_SIZE])
+            ).all()
+
+            stale_ids = [cost.id for cost in costs] + cost_ids[batch_start:batch_start + LEDGER_BATCH_SIZE]
+            if stale_ids:
+                session.execute(delete(table).where(table.c.appointment_cost_id.in_(stale_ids)))
+
+            rows = []
+            for cost in costs:
+                rows.extend(BillingLedgerService.ledger_rows(
+                    cost.id, cost.stylist_id, cost.appointment_date, cost.billing_elements_applied,
+                    element_ids_by_name
+                ))
+            if rows:
+                session.execute(table.insert(), rows)
+            written += len(rows)
+        return written
+
+    @staticmethod
+    def mark_dirty(session, appointment_ids=(), cost_ids=()):
+        """Queue appointments (and deleted cost IDs) for a ledger rewrite when `session` commits"""
+        session.info.setdefault('ledger_appointment_ids', set()).update(appointment_ids)
+        session.info.setdefault('ledger_cost_ids', set()).update(cost_ids)
+
+    @staticmethod
+    def backfill(batch_size=LEDGER_BATCH_SIZE, progress=None):
+        """Rebuild the whole ledger from the stored cost breakdowns, without committing
+
+        `progress(done, total)` is called after each batch of appointments.
+        Returns the number of ledger rows written.
+        """
+        appointment_ids = [row.appointment_id for row in db.session.query(AppointmentCost.appointment_id).order_by(
+            AppointmentCost.appointment_id
+        )]
+
+        db.session.execute(delete(AppointmentCostElement.__table__))
+        written = 0
+        for batch_start in range(0, len(appointment_ids), batch_size):
+            written += BillingLedgerService.replace(db.session, appointment_ids[batch_start:batch_start + batch_size])
+            if progress:
+                progress(min(batch_start + batch_size, len(appointment_ids)), len(appointment_ids))
+        return written
+
+    @staticmethod
+    def element_performance(start_date, end_date):
+        """Revenue, commission and appointment count per billing element ID over a period"""
+        return {
+            row.element_id: {
+                'total_revenue': float(row.total_revenue or 0),
+                'commission_generated': float(row.commission_generated or 0),
+                'appointment_count': row.appointment_count
+            }
+            for row in db.session.query(
+                AppointmentCostElement.element_id,
+                func.sum(AppointmentCostElement.amount).label('total_revenue'),
+                func.sum(AppointmentCostElement.commission_portion).label('commission_generated'),
+                func.count(AppointmentCostElement.id).label('appointment_count')
+            ).filter(
+                AppointmentCostElement.date >= start_date,
+                AppointmentCostElement.date <= end_date
+            ).group_by(AppointmentCostElement.element_id)
+        }
+
+    @staticmethod
+    def collect_changes(session):
+        """Note the costs written and the appointments moved in a flush"""
+        appointment_ids = set()
+        cost_ids = set()
+        for instance in list(session.new) + list(session.dirty):
+            if isinstance(instance, AppointmentCost):
+                appointment_ids.add(instance.appointment_id)
+            elif isinstance(instance, Appointment) and instance in session.dirty:
+                state = inspect(instance)
+                if state.attrs.appointment_date.history.has_changes() or state.attrs.stylist_id.history.has_changes():
+                    appointment_ids.add(instance.id)
+        for instance in session.deleted:
+            if isinstance(instance, AppointmentCost):
+                cost_ids.add(instance.id)
+
+        if appointment_ids or cost_ids:
+            BillingLedgerService.mark_dirty(session, appointment_ids, cost_ids)
+
+    @staticmethod
+    def apply_changes(session):
+        """Rewrite the noted ledger rows inside the committing transaction"""
+        appointment_ids = session.info.pop('ledger_appointment_ids', set())
+        cost_ids = session.info.pop('ledger_cost_ids', set())
+        BillingLedgerService.replace(session, {appointment_id for appointment_id in appointment_ids if appointment_id},
+                                     cost_ids)
+
+    @staticmethod
+    def discard_changes(session):
+        session.info.pop('ledger_appointment_ids', None)
+        session.info.pop('ledger_cost_ids', None)
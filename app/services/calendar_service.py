@@ -0,0 +1,174 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import extract, func, or_, select
+from app.models import Appointment, AppointmentStatus, User
+from app.extensions import db
+from app.services.availability_service import ACTIVE_STATUSES
+from app.utils import uk_utcnow
+
+# Time grid shown on the week calendar, in minutes from midnight
+CALENDAR_DAY_START = 9 * 60
+CALENDAR_DAY_END = 18 * 60
+CALENDAR_SLOT_MINUTES = 5
+
+# Change tokens trail the clock by this much, so a write whose transaction commits
+# shortly after a later timestamp was handed out is still picked up next time
+CHANGE_TOKEN_LAG = timedelta(seconds=5)
+
+
+class CalendarService:
+    """Precomputed calendar grids and incremental change feeds for calendar views"""
+
+    @staticmethod
+    def get_slot_minutes(day_start=CALENDAR_DAY_START, day_end=CALENDAR_DAY_END,
+                         slot_minutes=CALENDAR_SLOT_MINUTES):
+        """List the slot start times shown on the grid as (minutes, 'HH:MM') pairs"""
+        return [(minutes, '%02d:%02d' % (minutes // 60, minutes % 60))
+                for minutes in range(day_start, day_end, slot_minutes)]
+
+    @staticmethod
+    def build_week_grid(appointments, start_date, days=7, day_start=CALENDAR_DAY_START,
+                        day_end=CALENDAR_DAY_END, slot_minutes=CALENDAR_SLOT_MINUTES):
+        """Index appointments into a (date, stylist_id, slot) grid in a single pass
+
+        `appointments` must be ordered by date and start time. Each slot covered by
+        an appointment maps to a cell dict holding the appointment, whether the slot
+        is where its block is drawn and the block's row span. When appointments
+        overlap, a slot belongs to the earliest one covering it. Also returns
+        per-(date, stylist) appointment counts and the appointments for each date.
+        """
+        end_date = start_date + timedelta(days=days - 1)
+        cells = {}
+        day_counts = defaultdict(int)
+        by_date = defaultdict(list)
+
+        for appointment in appointments:
+            appointment_date = appointment.appointment_date
+            if appointment_date < start_date or appointment_date > end_date:
+                continue
+
+            stylist_id = appointment.stylist_id
+            day_counts[(appointment_date, stylist_id)] += 1
+            by_date[appointment_date].append(appointment)
+
+            start = appointment.start_time.hour * 60 + appointment.start_time.minute
+            end = appointment.end_time.hour * 60 + appointment.end_time.minute
+            rowspan = (end - start) // slot_minutes
+
+            # First grid slot at or after the start time
+            first_slot = max(day_start, start + (day_start - start) % slot_minutes)
+            for slot in range(first_slot, min(end, day_end), slot_minutes):
+                key = (appointment_date, stylist_id, slot)
+                if key not in cells:
+                    cells[key] = {
+                        'appointment': appointment,
+                        'is_start': slot < start + slot_minutes,
+                        'rowspan': rowspan
+                    }
+
+        return {
+            'cells': cells,
+            'day_counts': day_counts,
+            'by_date': by_date,
+            'slots': CalendarService.get_slot_minutes(day_start, day_end, slot_minutes)
+        }
+
+    @staticmethod
+    def minutes_expression():
+        """SQL expression for an appointment's length in minutes"""
+        return (
+            (extract('hour', Appointment.end_time) * 60 + extract('minute', Appointment.end_time)) -
+            (extract('hour', Appointment.start_time) * 60 + extract('minute', Appointment.start_time))
+        )
+
+    @staticmethod
+    def get_period_summary(start_date, end_date, stylist_id=None, status=None, by_stylist=False):
+        """Summarise appointments per day with one grouped query, without loading rows
+
+        Groups by (date, status), and by stylist too when `by_stylist` is set.
+        Returns a dict with per-day totals under 'days' (count, booked minutes of
+        active appointments, counts per status and, optionally, per stylist) and
+        period totals per status under 'statuses'.
+        """
+        columns = [
+            Appointment.appointment_date,
+            Appointment.status,
+            func.count(Appointment.id).label('count'),
+            func.sum(CalendarService.minutes_expression()).label('minutes')
+        ]
+        group_by = [Appointment.appointment_date, Appointment.status]
+        if by_stylist:
+            stylist_columns = [Appointment.stylist_id, User.first_name, User.last_name]
+            columns.extend(stylist_columns)
+            group_by.extend(stylist_columns)
+
+        query = db.session.query(*columns).filter(
+            Appointment.appointment_date >= start_date,
+            Appointment.appointment_date <= end_date
+        )
+        if by_stylist:
+            query = query.join(User, User.id == Appointment.stylist_id)
+        if stylist_id:
+            query = query.filter(Appointment.stylist_id == stylist_id)
+        if status:
+            query = query.filter(Appointment.status == status)
+
+        days = {}
+        statuses = defaultdict(int)
+        for row in query.group_by(*group_by).all():
+            day = days.setdefault(row.appointment_date, {
+                'count': 0, 'minutes': 0, 'statuses': defaultdict(int), 'stylists': {}
+            })
+            day['count'] += row.count
+            day['statuses'][row.status] += row.count
+            if row.status in ACTIVE_STATUSES:
+                day['minutes'] += int(row.minutes or 0)
+            statuses[row.status] += row.count
+
+            if by_stylist:
+                stylist = day['stylists'].setdefault(row.stylist_id, {
+                    'name': f"{row.first_name} {row.last_name}", 'count': 0
+                })
+                stylist['count'] += row.count
+
+        for day in days.values():
+            day['stylists'] = sorted(day['stylists'].values(), key=lambda stylist: (-stylist['count'], stylist['name']))
+
+        return {'days': days, 'statuses': statuses}
+
+    @staticmethod
+    def current_change_token():
+        """Get a change token for a calendar that has just been loaded in full"""
+        return CalendarService.format_change_token(uk_utcnow() - CHANGE_TOKEN_LAG)
+
+    @staticmethod
+    def format_change_token(moment):
+        """Encode a UTC timestamp as an opaque change token"""
+        return moment.strftime('%Y%m%dT%H%M%S%f')
+
+    @staticmethod
+    def parse_change_token(token):
+        """Decode a change token, raising ValueError if it is malformed"""
+        return datetime.strptime(token, '%Y%m%dT%H%M%S%f')
+
+    @staticmethod
+    def get_changes_since(query, token):
+        """Get appointments from `query` created or changed since a change token
+
+        An appointment counts as changed if its row was updated (creation sets
+        updated_at too) or a status history entry was recorded for it. Returns the
+        appointments and the token to send next time. Appointments near the token
+        may be returned twice, so clients should apply changes idempotently.
+        """
+        since = CalendarService.parse_change_token(token)
+        next_since = max(since, uk_utcnow() - CHANGE_TOKEN_LAG)
+
+        status_changed = select(AppointmentStatus.appointment_id).where(
+            AppointmentStatus.changed_at > since
+        )
+        appointments = query.filter(or_(
+            Appointment.updated_at > since,
+            Appointment.id.in_(status_changed)
+        )).order_by(Appointment.appointment_date, Appointment.start_time).all()
+
+        return appointments, CalendarService.format_change_token(next_since)
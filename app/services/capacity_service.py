@@ -0,0 +1,221 @@
+from collections import defaultdict
+from datetime import timedelta
+from itertools import accumulate
+from app.models import Appointment, Role, User
+from app.extensions import db
+from app.services.availability_service import ACTIVE_STATUSES
+from app.services.holiday_coverage import HolidayCoverageService
+from app.services.schedule_cache import ScheduleCache, NO_PATTERN
+
+# Width of the occupancy bins a day is split into
+CAPACITY_BIN_MINUTES = 5
+BINS_PER_DAY = 24 * 60 // CAPACITY_BIN_MINUTES
+
+# Share of staffed time booked at or above which a period counts as over capacity,
+# and at or below which it counts as under capacity
+CAPACITY_OVER_UTILIZATION = 90
+CAPACITY_UNDER_UTILIZATION = 25
+
+# Shorter over/under capacity windows are not reported
+CAPACITY_MIN_WINDOW_MINUTES = 30
+
+WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def _add_interval(diff, start_minutes, end_minutes, amount=1):
+    """Add `amount` to every bin an interval touches in a difference array"""
+    first_bin = max(start_minutes // CAPACITY_BIN_MINUTES, 0)
+    end_bin = min(-(-end_minutes // CAPACITY_BIN_MINUTES), BINS_PER_DAY)
+    if first_bin < end_bin:
+        diff[first_bin] += amount
+        diff[end_bin] -= amount
+
+
+def _bin_label(bin_index):
+    minutes = bin_index * CAPACITY_BIN_MINUTES
+    return '%02d:%02d' % (minutes // 60, minutes % 60)
+
+
+class CapacityService:
+    """Salon-wide demand against staffed capacity in 5-minute bins
+
+    Booked appointments and staffed shifts are both turned into per-day
+    difference arrays (+1 where an interval starts, -1 where it ends) and
+    prefix-summed, so building the occupancy and capacity of a day costs one
+    pass over its bins however many intervals it has. Staffed capacity comes
+    from work patterns (or opening hours for stylists without one) within
+    opening hours, less approved holidays.
+    """
+
+    @staticmethod
+    def _weekly_shifts(stylist_ids):
+        """Each stylist's (start, end) minutes or None per weekday, clipped to opening hours"""
+        opening_hours = ScheduleCache.get_weekly_opening_minutes()
+        ScheduleCache.preload_stylists(stylist_ids)
+
+        shifts = {}
+        for stylist_id in stylist_ids:
+            schedule = ScheduleCache.get_stylist_schedule(stylist_id)
+            if schedule == NO_PATTERN:
+                schedule = opening_hours
+            shifts[stylist_id] = [
+                (max(window[0], hours[0]), min(window[1], hours[1])) if window and hours else None
+                for window, hours in zip(schedule, opening_hours)
+            ]
+        return shifts
+
+    @staticmethod
+    def analyze(start_date, end_date):
+        """Build occupancy and capacity for a period
+
+        Returns per-day utilisation, a weekday x hour heatmap of average demand
+        and capacity, and over and under capacity windows of at least
+        CAPACITY_MIN_WINDOW_MINUTES.
+        """
+        stylist_ids = [row.id for row in User.query.with_entities(User.id).join(User.roles).filter(
+            Role.name == 'stylist'
+        )]
+        shifts = CapacityService._weekly_shifts(stylist_ids)
+
+        # Staffed capacity for a typical day of each weekday
+        weekday_capacity = [[0] * (BINS_PER_DAY + 1) for _ in range(7)]
+        for weekly in shifts.values():
+            for weekday, window in enumerate(weekly):
+                if window:
+                    _add_interval(weekday_capacity[weekday], window[0], window[1])
+
+        holidays_by_day = defaultdict(list)
+        for user_id, holiday_start, holiday_end in HolidayCoverageService.merge_by_user(
+            HolidayCoverageService.load_ranges(start_date, end_date)
+        ):
+            day = holiday_start
+            while day <= holiday_end:
+                holidays_by_day[day].append(user_id)
+                day += timedelta(days=1)
+
+        demand_by_day = defaultdict(lambda: [0] * (BINS_PER_DAY + 1))
+        for appointment_date, start_time, end_time in db.session.query(
+            Appointment.appointment_date,
+            Appointment.start_time,
+            Appointment.end_time
+        ).filter(
+            Appointment.appointment_date >= start_date,
+            Appointment.appointment_date <= end_date,
+            Appointment.status.in_(ACTIVE_STATUSES)
+        ):
+            _add_interval(demand_by_day[appointment_date], _minutes(start_time), _minutes(end_time))
+
+        demand_totals = [[0] * BINS_PER_DAY for _ in range(7)]
+        capacity_totals = [[0] * BINS_PER_DAY for _ in range(7)]
+        weekday_days = [0] * 7
+        days = []
+        windows = []
+
+        day = start_date
+        while day <= end_date:
+            weekday = day.weekday()
+            capacity_diff = weekday_capacity[weekday]
+            if day in holidays_by_day:
+                capacity_diff = list(capacity_diff)
+                for user_id in holidays_by_day[day]:
+                    window = shifts.get(user_id, [None] * 7)[weekday]
+                    if window:
+                        _add_interval(capacity_diff, window[0], window[1], -1)
+            capacity = list(accumulate(capacity_diff[:BINS_PER_DAY]))
+            demand_diff = demand_by_day.get(day)
+            demand = list(accumulate(demand_diff[:BINS_PER_DAY])) if demand_diff else [0] * BINS_PER_DAY
+
+            weekday_days[weekday] += 1
+            for bin_index in range(BINS_PER_DAY):
+                demand_totals[weekday][bin_index] += demand[bin_index]
+                capacity_totals[weekday][bin_index] += capacity[bin_index]
+
+            booked_minutes = sum(demand) * CAPACITY_BIN_MINUTES
+            staffed_minutes = sum(capacity) * CAPACITY_BIN_MINUTES
+            days.append({
+                'date': day,
+                'booked_hours': booked_minutes / 60.0,
+                'staffed_hours': staffed_minutes / 60.0,
+                'utilization': (booked_minutes / staffed_minutes * 100) if staffed_minutes else 0
+            })
+            windows.extend(CapacityService._find_windows(day, demand, capacity))
+            day += timedelta(days=1)
+
+        return {
+            'days': days,
+            'heatmap': CapacityService._build_heatmap(demand_totals, capacity_totals, weekday_days),
+            'windows': windows
+        }
+
+    @staticmethod
+    def _classify(demand, capacity):
+        if capacity <= 0:
+            return 'over_capacity' if demand > 0 else None
+        utilization = demand / capacity * 100
+        if utilization >= CAPACITY_OVER_UTILIZATION:
+            return 'over_capacity'
+        if utilization <= CAPACITY_UNDER_UTILIZATION:
+            return 'under_capacity'
+        return None
+
+    @staticmethod
+    def _find_windows(day, demand, capacity):
+        """Runs of consecutive bins in the same over or under capacity state"""
+        windows = []
+        run_type = None
+        run_start = 0
+        for bin_index in range(BINS_PER_DAY + 1):
+            bin_type = (CapacityService._classify(demand[bin_index], capacity[bin_index])
+                        if bin_index < BINS_PER_DAY else None)
+            if bin_type == run_type:
+                continue
+            if run_type and (bin_index - run_start) * CAPACITY_BIN_MINUTES >= CAPACITY_MIN_WINDOW_MINUTES:
+                booked = sum(demand[run_start:bin_index])
+                staffed = sum(capacity[run_start:bin_index])
+                windows.append({
+                    'date': day,
+                    'type': run_type,
+                    'start': _bin_label(run_start),
+                    'end': _bin_label(bin_index),
+                    'minutes': (bin_index - run_start) * CAPACITY_BIN_MINUTES,
+                    'utilization': (booked / staffed * 100) if staffed else None
+                })
+            run_type = bin_type
+            run_start = bin_index
+        return windows
+
+    @staticmethod
+    def _build_heatmap(demand_totals, capacity_totals, weekday_days):
+        """Average stylists booked and on shift for each weekday and hour of the day"""
+        bins_per_hour = 60 // CAPACITY_BIN_MINUTES
+
+        def hourly(totals):
+            return [[sum(row[hour * bins_per_hour:(hour + 1) * bins_per_hour]) for hour in range(24)]
+                    for row in totals]
+
+        demand_hours = hourly(demand_totals)
+        capacity_hours = hourly(capacity_totals)
+        # Only hours in which anyone is ever on shift or booked
+        hours = [hour for hour in range(24)
+                 if any(demand_hours[weekday][hour] or capacity_hours[weekday][hour] for weekday in range(7))]
+
+        rows = []
+        for weekday in range(7):
+            samples = weekday_days[weekday] * bins_per_hour
+            cells = []
+            for hour in hours:
+                demand = demand_hours[weekday][hour] / samples if samples else 0
+                capacity = capacity_hours[weekday][hour] / samples if samples else 0
+                cells.append({
+                    'hour': hour,
+                    'demand': demand,
+                    'capacity': capacity,
+                    'utilization': (demand / capacity * 100) if capacity else (100 if demand else 0)
+                })
+            rows.append({'weekday': WEEKDAY_NAMES[weekday], 'cells': cells})
+
+        return {'hours': hours, 'rows': rows}
@@ -0,0 +1,170 @@
+import logging
+import threading
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import CostRecalculationJob
+from app.extensions import db
+from app.services.hr_service import HRService
+from app.utils import uk_utcnow
+
+# Jobs that keep failing are left in the table for inspection after this many attempts
+COST_JOB_MAX_ATTEMPTS = 5
+
+
+class CostQueue:
+    """Database-backed queue of appointments whose costs need recalculating
+
+    Requests enqueue appointment IDs inside their own transaction; a worker
+    thread or process drains the queue in batches through
+    HRService.recalculate_costs. The table holds one row per appointment, so
+    repeated edits before the worker runs collapse into a single calculation.
+    """
+
+    @staticmethod
+    def enqueue(appointment_ids):
+        """Mark appointments' costs as dirty, without committing
+
+        Re-enqueuing an appointment that is already queued moves its request
+        time forward and resets its attempt count.
+        """
+        appointment_ids = sorted(set(appointment_ids))
+        if not appointment_ids:
+            return
+
+        now = uk_utcnow()
+        dialect = db.engine.dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            statement = insert(CostRecalculationJob).values([
+                {'appointment_id': appointment_id, 'requested_at': now, 'attempts': 0}
+                for appointment_id in appointment_ids
+            ])
+            statement = statement.on_conflict_do_update(
+                index_elements=[CostRecalculationJob.appointment_id],
+                set_={'requested_at': now, 'attempts': 0, 'last_error': None}
+            )
+            db.session.execute(statement)
+            return
+
+        queued = {job.appointment_id: job for job in CostRecalculationJob.query.filter(
+            CostRecalculationJob.appointment_id.in_(appointment_ids)
+        )}
+        for appointment_id in appointment_ids:
+            job = queued.get(appointment_id)
+            if job:
+                job.requested_at = now
+                job.attempts = 0
+                job.last_error = None
+            else:
+                db.session.add(CostRecalculationJob(appointment_id=appointment_id, requested_at=now, attempts=0))
+
+    @staticmethod
+    def pending_count():
+        """Count queued jobs that will still be retried"""
+        return CostRecalculationJob.query.filter(CostRecalculationJob.attempts < COST_JOB_MAX_ATTEMPTS).count()
+
+    @staticmethod
+    def _claim(query):
+        """Lock the selected jobs on PostgreSQL, skipping any another worker holds"""
+        if db.engine.dialect.name == 'postgresql':
+            # Let several workers share the queue without taking the same jobs
+            query = query.with_for_update(skip_locked=True)
+        return query.all()
+
+    @staticmethod
+    def _remove(job_ids, claimed_up_to):
+        """Delete finished jobs unless they were re-enqueued after being claimed"""
+        CostRecalculationJob.query.filter(
+            CostRecalculationJob.id.in_(job_ids),
+            CostRecalculationJob.requested_at <= claimed_up_to
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+    @staticmethod
+    def _process_job(job_id):
+        """Recalculate one queued appointment on its own, recording the error if it fails"""
+        jobs = CostQueue._claim(CostRecalculationJob.query.filter(
+            CostRecalculationJob.id == job_id,
+            CostRecalculationJob.attempts < COST_JOB_MAX_ATTEMPTS
+        ))
+        if not jobs:
+            db.session.rollback()
+            return
+        job = jobs[0]
+        claimed_up_to = job.requested_at
+
+        try:
+            HRService.recalculate_costs(appointment_ids=[job.appointment_id])
+        except Exception as e:
+            logging.error(f"Error recalculating queued cost for appointment {job.appointment_id}: {e}")
+            db.session.rollback()
+            CostRecalculationJob.query.filter(CostRecalculationJob.id == job_id).update({
+                CostRecalculationJob.attempts: CostRecalculationJob.attempts + 1,
+                CostRecalculationJob.last_error: str(e)
+            }, synchronize_session=False)
+            db.session.commit()
+            return
+
+        CostQueue._remove([job_id], claimed_up_to)
+
+    @staticmethod
+    def process_batch(batch_size=200):
+        """Recalculate costs for the oldest queued appointments, returning how many were taken
+
+        Jobs are only removed if they were not re-enqueued while the batch was
+        being calculated. If the batch fails it is retried one job at a time, so
+        only the jobs that fail on their own have their attempt count raised and
+        the error recorded.
+        """
+        jobs = CostQueue._claim(CostRecalculationJob.query.filter(
+            CostRecalculationJob.attempts < COST_JOB_MAX_ATTEMPTS
+        ).order_by(CostRecalculationJob.requested_at, CostRecalculationJob.id).limit(batch_size))
+        if not jobs:
+            db.session.rollback()
+            return 0
+
+        job_ids = [job.id for job in jobs]
+        claimed_up_to = max(job.requested_at for job in jobs)
+
+        try:
+            HRService.recalculate_costs(appointment_ids=[job.appointment_id for job in jobs])
+        except Exception as e:
+            logging.error(f"Error recalculating queued appointment costs, retrying one at a time: {e}")
+            db.session.rollback()
+            for job_id in job_ids:
+                CostQueue._process_job(job_id)
+            return len(jobs)
+
+        CostQueue._remove(job_ids, claimed_up_to)
+        return len(jobs)
+
+    @staticmethod
+    def process_pending(batch_size=200):
+        """Drain the queue batch by batch, returning how many jobs were taken"""
+        processed = 0
+        while True:
+            taken = CostQueue.process_batch(batch_size)
+            if taken < batch_size:
+                return processed + taken
+            processed += taken
+
+    @staticmethod
+    def run_worker(app, stop_event, interval=None, batch_size=None):
+        """Drain the queue every `interval` seconds until `stop_event` is set"""
+        interval = interval or app.config['COST_WORKER_INTERVAL']
+        batch_size = batch_size or app.config['COST_WORKER_BATCH_SIZE']
+        while not stop_event.is_set():
+            try:
+                with app.app_context():
+                    CostQueue.process_pending(batch_size)
+            except Exception as e:
+                logging.error(f"Cost worker error: {e}")
+            stop_event.wait(interval)
+
+    @staticmethod
+    def start_worker(app):
+        """Start the queue worker on a daemon thread, returning its stop event"""
+        stop_event = threading.Event()
+        thread = threading.Thread(target=CostQueue.run_worker, args=(app, stop_event),
+                                  name='cost-worker', daemon=True)
+        thread.start()
+        return stop_event
@@ -0,0 +1,65 @@
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import Date
+
+DATE_BUCKET_UNITS = ('day', 'week', 'month', 'quarter')
+
+# SQLite date() modifiers taking a date to the start of its bucket (weeks start on Monday);
+# each placeholder is a separately rendered copy of the date expression
+SQLITE_BUCKETS = {
+    'day': "date({0})",
+    'week': "date({0}, '-6 days', 'weekday 1')",
+    'month': "date({0}, 'start of month')",
+    'quarter': "date({0}, 'start of month', '-' || ((CAST(strftime('%m', {1}) AS INTEGER) - 1) % 3) || ' months')",
+}
+
+
+class _DateBucket(FunctionElement):
+    """First day of the day, week, month or quarter a date falls in, as a date"""
+    type = Date()
+    name = 'date_bucket'
+    inherit_cache = True
+    unit = None
+
+
+# One class per unit, so the unit is part of SQLAlchemy's statement cache key
+_BUCKET_CLASSES = {
+    unit: type(f'_{unit.title()}Bucket', (_DateBucket,), {'unit': unit, 'inherit_cache': True})
+    for unit in DATE_BUCKET_UNITS
+}
+
+
+def date_bucket(unit, expression):
+    """SQL expression for the start of the `unit` bucket containing a date column
+
+    Compiles to date_trunc on PostgreSQL (and other databases with it) and to
+    date() modifiers on SQLite, so it can be grouped and ordered on directly.
+    """
+    if unit not in _BUCKET_CLASSES:
+        raise ValueError(f"Unknown date bucket '{unit}', expected one of {', '.join(DATE_BUCKET_UNITS)}")
+    return _BUCKET_CLASSES[unit](expression)
+
+
+def bucket_label(value, unit):
+    """Display label for a bucket start date: '2024-05-06', '2024-W19', '2024-05' or '2024-Q2'"""
+    if value is None:
+        return None
+    if unit == 'week':
+        year, week, _ = value.isocalendar()
+        return f'{year}-W{week:02d}'
+    if unit == 'month':
+        return value.strftime('%Y-%m')
+    if unit == 'quarter':
+        return f'{value.year}-Q{(value.month - 1) // 3 + 1}'
+    return value.isoformat()
+
+
+@compiles(_DateBucket)
+def _compile_date_bucket(element, compiler, **kw):
+    return "CAST(date_trunc('%s', %s) AS DATE)" % (element.unit, compiler.process(element.clauses, **kw))
+
+
+@compiles(_DateBucket, 'sqlite')
+def _compile_sqlite_date_bucket(element, compiler, **kw):
+    template = SQLITE_BUCKETS[element.unit]
+    return template.format(*[compiler.process(element.clauses, **kw) for _ in range(template.count('{'))])
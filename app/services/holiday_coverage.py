@@ -0,0 +1,192 @@
+from datetime import timedelta
+from itertools import groupby
+from app.models import HolidayRequest, User
+from app.extensions import db
+from app.services.schedule_cache import ScheduleCache, NO_PATTERN
+
+# A day is a conflict when more than this many staff are off on it
+MAX_STAFF_ON_HOLIDAY = 2
+
+ONE_DAY = timedelta(days=1)
+
+
+class HolidayCoverageService:
+    """Exact per-day staff-off headcounts from holiday ranges, by sweep-line
+
+    Holiday ranges are loaded in one query, merged per person, turned into
+    start/end events and swept in date order. The result is a list of segments
+    (consecutive days with the same people off), from which per-day headcounts
+    and maximal conflict windows are read off in O(n log n) for n ranges.
+    """
+
+    @staticmethod
+    def load_ranges(start_date, end_date, statuses=('approved',), exclude_request_id=None):
+        """Get (user_id, start, end) holiday ranges overlapping a period, clipped to it"""
+        query = db.session.query(
+            HolidayRequest.user_id,
+            HolidayRequest.start_date,
+            HolidayRequest.end_date
+        ).filter(
+            HolidayRequest.status.in_(statuses),
+            HolidayRequest.start_date <= end_date,
+            HolidayRequest.end_date >= start_date
+        )
+        if exclude_request_id:
+            query = query.filter(HolidayRequest.id != exclude_request_id)
+
+        return [
+            (row.user_id, max(row.start_date, start_date), min(row.end_date, end_date))
+            for row in query
+        ]
+
+    @staticmethod
+    def merge_by_user(ranges):
+        """Union each person's overlapping or adjacent ranges, so nobody counts twice on a day"""
+        merged = []
+        for user_id, user_ranges in groupby(sorted(ranges), key=lambda item: item[0]):
+            current_start = current_end = None
+            for _, start, end in user_ranges:
+                if current_end is not None and start <= current_end + ONE_DAY:
+                    current_end = max(current_end, end)
+                    continue
+                if current_end is not None:
+                    merged.append((user_id, current_start, current_end))
+                current_start, current_end = start, end
+            merged.append((user_id, current_start, current_end))
+        return merged
+
+    @staticmethod
+    def build_segments(ranges):
+        """Sweep (user_id, start, end) ranges into segments of constant coverage
+
+        Returns a date-ordered list of dicts with 'start', 'end' (inclusive),
+        'count' and 'user_ids' for every stretch of days on which the same
+        people are off. Days with nobody off are left out.
+        """
+        events = []
+        for user_id, start, end in HolidayCoverageService.merge_by_user(ranges):
+            events.append((start, 1, user_id))
+            events.append((end + ONE_DAY, -1, user_id))
+        # Leavers before joiners on the same day
+        events.sort(key=lambda event: (event[0], event[1]))
+
+        segments = []
+        off = set()
+        previous_day = None
+        for day, day_events in groupby(events, key=lambda event: event[0]):
+            if off:
+                segments.append({
+                    'start': previous_day,
+                    'end': day - ONE_DAY,
+                    'count': len(off),
+                    'user_ids': frozenset(off)
+                })
+            for _, change, user_id in day_events:
+                if change > 0:
+                    off.add(user_id)
+                else:
+                    off.discard(user_id)
+            previous_day = day
+        return segments
+
+    @staticmethod
+    def daily_headcount(segments):
+        """Expand segments to a {date: number of staff off} dict"""
+        headcount = {}
+        for segment in segments:
+            day = segment['start']
+            while day <= segment['end']:
+                headcount[day] = segment['count']
+                day += ONE_DAY
+        return headcount
+
+    @staticmethod
+    def conflict_windows(segments, max_staff=MAX_STAFF_ON_HOLIDAY):
+        """Merge consecutive over-limit segments into maximal conflict windows
+
+        Each window has 'start', 'end', the 'peak' number off on any one day and
+        every person off at some point in it as 'user_ids'.
+        """
+        windows = []
+        for segment in segments:
+            if segment['count'] <= max_staff:
+                continue
+            window = windows[-1] if windows else None
+            if window and window['end'] + ONE_DAY == segment['start']:
+                window['end'] = segment['end']
+                window['peak'] = max(window['peak'], segment['count'])
+                window['user_ids'] |= segment['user_ids']
+            else:
+                windows.append({
+                    'start': segment['start'],
+                    'end': segment['end'],
+                    'peak': segment['count'],
+                    'user_ids': set(segment['user_ids'])
+                })
+        return windows
+
+    @staticmethod
+    def get_conflicts(start_date, end_date, max_staff=MAX_STAFF_ON_HOLIDAY):
+        """Conflict windows for approved holidays in a period"""
+        ranges = HolidayCoverageService.load_ranges(start_date, end_date)
+        return HolidayCoverageService.conflict_windows(HolidayCoverageService.build_segments(ranges), max_staff)
+
+    @staticmethod
+    def conflicts_if_approved(holiday_request, max_staff=MAX_STAFF_ON_HOLIDAY):
+        """Conflict windows within a request's dates if it were approved alongside existing ones"""
+        ranges = HolidayCoverageService.load_ranges(holiday_request.start_date, holiday_request.end_date,
+                                                    exclude_request_id=holiday_request.id)
+        ranges.append((holiday_request.user_id, holiday_request.start_date, holiday_request.end_date))
+        return HolidayCoverageService.conflict_windows(HolidayCoverageService.build_segments(ranges), max_staff)
+
+    @staticmethod
+    def scheduled_staff_by_weekday():
+        """Set of stylist IDs scheduled to work on each weekday, Monday first
+
+        Stylists without a work pattern count as working whenever the salon is open.
+        """
+        stylist_ids = [row.id for row in db.session.query(User.id).filter(User.roles.any(name='stylist'))]
+        opening_hours = ScheduleCache.get_weekly_opening_minutes()
+        ScheduleCache.preload_stylists(stylist_ids)
+
+        scheduled = [set() for _ in range(7)]
+        for stylist_id in stylist_ids:
+            schedule = ScheduleCache.get_stylist_schedule(stylist_id)
+            if schedule == NO_PATTERN:
+                schedule = opening_hours
+            for weekday, (window, hours) in enumerate(zip(schedule, opening_hours)):
+                if window and hours:
+                    scheduled[weekday].add(stylist_id)
+        return scheduled
+
+    @staticmethod
+    def staffing_shortfalls(new_ranges, min_staff):
+        """Days on which adding `new_ranges` to the approved holidays leaves fewer than `min_staff` working
+
+        Only days on which one of the new ranges takes a scheduled stylist off
+        are reported, as dicts with 'date', 'working' and 'scheduled' counts.
+        """
+        if not new_ranges or min_staff <= 0:
+            return []
+        start_date = min(start for _, start, _ in new_ranges)
+        end_date = max(end for _, _, end in new_ranges)
+        scheduled = HolidayCoverageService.scheduled_staff_by_weekday()
+
+        new_off = {}
+        for user_id, start, end in HolidayCoverageService.merge_by_user(new_ranges):
+            day = start
+            while day <= end:
+                new_off.setdefault(day, set()).add(user_id)
+                day += ONE_DAY
+
+        shortfalls = []
+        ranges = HolidayCoverageService.load_ranges(start_date, end_date) + list(new_ranges)
+        for segment in HolidayCoverageService.build_segments(ranges):
+            day = segment['start']
+            while day <= segment['end']:
+                staff = scheduled[day.weekday()]
+                working = len(staff - segment['user_ids'])
+                if staff & new_off.get(day, set()) and working < min_staff:
+                    shortfalls.append({'date': day, 'working': working, 'scheduled': len(staff)})
+                day += ONE_DAY
+        return shortfalls
@@ -0,0 +1,156 @@
+from collections import defaultdict
+from datetime import timedelta
+from app.models import Appointment, AppointmentService, StylistServiceAssociation, User, Role
+from app.extensions import db
+from app.services.availability_service import AvailabilityService
+from app.services.cost_queue import CostQueue
+from app.services.holiday_coverage import HolidayCoverageService
+from app.services.schedule_cache import ScheduleCache, NO_PATTERN
+
+# Appointments that still need a stylist when theirs goes on holiday
+REASSIGNABLE_STATUSES = ('confirmed',)
+
+
+class HolidayReassignmentService:
+    """Appointments booked over a holiday and the stylists who could take them
+
+    Affected appointments come from one range query on (stylist_id,
+    appointment_date). Every other stylist who may perform all of an
+    appointment's services, works that day, is not on holiday and is free for
+    its slot is a candidate. The batch is then matched greedily, most
+    constrained appointment first, and each choice is booked into the chosen
+    stylist's busy time so later appointments in the batch see it.
+    """
+
+    @staticmethod
+    def affected_appointments(user_id, start_date, end_date):
+        """Confirmed appointments with `user_id` from start_date to end_date, in time order"""
+        return Appointment.query.filter(
+            Appointment.stylist_id == user_id,
+            Appointment.appointment_date >= start_date,
+            Appointment.appointment_date <= end_date,
+            Appointment.status.in_(REASSIGNABLE_STATUSES)
+        ).order_by(Appointment.appointment_date, Appointment.start_time, Appointment.id).all()
+
+    @staticmethod
+    def _service_ids(appointments):
+        """Service IDs of each appointment, from its service links or the deprecated service_id"""
+        service_ids = defaultdict(set)
+        for row in db.session.query(AppointmentService.appointment_id, AppointmentService.service_id).filter(
+            AppointmentService.appointment_id.in_([appointment.id for appointment in appointments])
+        ):
+            service_ids[row.appointment_id].add(row.service_id)
+        for appointment in appointments:
+            if not service_ids[appointment.id] and appointment.service_id:
+                service_ids[appointment.id].add(appointment.service_id)
+        return service_ids
+
+    @staticmethod
+    def plan(user_id, start_date, end_date, appointments=None):
+        """Suggest a replacement stylist for every appointment a holiday would leave uncovered
+
+        Returns one dict per affected appointment with the 'appointment', its
+        'candidates' (stylist IDs who could take it on its own) and the
+        'stylist_id' chosen for it across the whole batch, or None when nobody
+        is left. Runs a fixed number of queries however many appointments and
+        stylists there are.
+        """
+        if appointments is None:
+            appointments = HolidayReassignmentService.affected_appointments(user_id, start_date, end_date)
+        if not appointments:
+            return []
+
+        stylist_ids = [row.id for row in db.session.query(User.id).join(User.roles).filter(
+            Role.name == 'stylist',
+            User.is_active == True,
+            User.id != user_id
+        ).order_by(User.id)]
+        service_ids = HolidayReassignmentService._service_ids(appointments)
+
+        # A missing association means the stylist is allowed (backward compatibility)
+        blocked = defaultdict(set)
+        for row in db.session.query(StylistServiceAssociation.stylist_id, StylistServiceAssociation.service_id).filter(
+            StylistServiceAssociation.stylist_id.in_(stylist_ids),
+            StylistServiceAssociation.service_id.in_(set().union(*service_ids.values())),
+            StylistServiceAssociation.is_allowed == False
+        ):
+            blocked[row.stylist_id].add(row.service_id)
+
+        days_off = set()
+        for holiday_user_id, holiday_start, holiday_end in HolidayCoverageService.load_ranges(start_date, end_date):
+            day = holiday_start
+            while day <= holiday_end:
+                days_off.add((holiday_user_id, day))
+                day += timedelta(days=1)
+
+        ScheduleCache.preload_stylists(stylist_ids)
+        busy = AvailabilityService.load_busy_intervals_for_range(stylist_ids, start_date, end_date)
+
+        suggestions = []
+        for appointment in appointments:
+            day = appointment.appointment_date
+            start = AvailabilityService.time_to_minutes(appointment.start_time)
+            end = AvailabilityService.time_to_minutes(appointment.end_time)
+            candidates = []
+            for stylist_id in stylist_ids:
+                if (stylist_id, day) in days_off or blocked[stylist_id] & service_ids[appointment.id]:
+                    continue
+                window = ScheduleCache.get_stylist_window(stylist_id, day)
+                if window == NO_PATTERN:
+                    window = ScheduleCache.get_opening_minutes(day)
+                if not window or start < window[0] or end > window[1]:
+                    continue
+                if AvailabilityService.is_free(busy.get((stylist_id, day), []), start, end):
+                    candidates.append(stylist_id)
+            suggestions.append({'appointment': appointment, 'candidates': candidates, 'stylist_id': None})
+
+        # Fewest candidates first, each going to the free candidate given the fewest so far
+        given = defaultdict(int)
+        for suggestion in sorted(suggestions, key=lambda suggestion: len(suggestion['candidates'])):
+            appointment = suggestion['appointment']
+            day = appointment.appointment_date
+            start = AvailabilityService.time_to_minutes(appointment.start_time)
+            end = AvailabilityService.time_to_minutes(appointment.end_time)
+            free = [stylist_id for stylist_id in suggestion['candidates']
+                    if AvailabilityService.is_free(busy.get((stylist_id, day), []), start, end)]
+            if not free:
+                continue
+            stylist_id = min(free, key=lambda candidate: given[candidate])
+            suggestion['stylist_id'] = stylist_id
+            given[stylist_id] += 1
+            busy[(stylist_id, day)] = AvailabilityService.merge_intervals(
+                busy.get((stylist_id, day), []) + [(start, end)]
+            )
+        return suggestions
+
+    @staticmethod
+    def apply(suggestions):
+        """Move appointments to their suggested stylists, without committing
+
+        Each stylist's day is locked and checked for a clash before an
+        appointment moves onto it, and moved appointments are queued for cost
+        recalculation. Returns the (appointment ID, stylist ID) pairs moved and
+        the IDs of appointments left with their original stylist.
+        """
+        reassigned = []
+        unassigned = []
+        # Lock in (stylist, date) order, so concurrent approvals cannot deadlock
+        for suggestion in sorted(suggestions, key=lambda suggestion: (
+            suggestion['stylist_id'] or 0, suggestion['appointment'].appointment_date
+        )):
+            appointment = suggestion['appointment']
+            stylist_id = suggestion['stylist_id']
+            if stylist_id is None:
+                unassigned.append(appointment.id)
+                continue
+            AvailabilityService.lock_stylist_day(stylist_id, appointment.appointment_date)
+            if AvailabilityService.has_conflicting_appointment(stylist_id, appointment.appointment_date,
+                                                               appointment.start_time, appointment.end_time,
+                                                               exclude_id=appointment.id):
+                unassigned.append(appointment.id)
+                continue
+            appointment.stylist_id = stylist_id
+            reassigned.append((appointment.id, stylist_id))
+
+        CostQueue.enqueue([appointment_id for appointment_id, _ in reassigned])
+        return {'reassigned': reassigned, 'unassigned': sorted(unassigned)}
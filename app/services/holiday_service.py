@@ -1,8 +1,18 @@
+from collections import defaultdict
 from datetime import datetime, date, timedelta
 from decimal import Decimal
+from flask import current_app
 from app.models import HolidayRequest, HolidayQuota, WorkPattern, EmploymentDetails, User, Appointment
 from app.extensions import db
-from sqlalchemy import func, and_, or_
+from app.utils import uk_utcnow
+from app.services.holiday_coverage import HolidayCoverageService
+from app.services.holiday_reassignment import HolidayReassignmentService
+from app.services.report_cache import ReportCache
+from app.services.working_days import WorkingDayService
+from sqlalchemy import case, func, and_, or_, update
+
+# Holiday request statuses counted in summaries
+HOLIDAY_REQUEST_STATUSES = ['pending', 'approved', 'rejected']
 
 
 class HolidayService:
@@ -28,6 +38,11 @@ class HolidayService:
         if not employment:
             return None
             
+        return HolidayService.entitlement_for(work_pattern, employment)
+    
+    @staticmethod
+    def entitlement_for(work_pattern, employment):
+        """Holiday entitlement for an already loaded work pattern and employment details"""
         # Calculate weekly hours from work pattern
         weekly_hours = work_pattern.get_weekly_hours()
         
@@ -76,6 +91,124 @@ class HolidayService:
         
         return quota
     
+    @staticmethod
+    def get_holiday_quota(user_id, year=None):
+        """Get the quota for the year, without creating one"""
+        if year is None:
+            year = date.today().year
+            
+        return HolidayQuota.query.filter_by(user_id=user_id, year=year).first()
+    
+    @staticmethod
+    def provision_missing_quotas(year=None):
+        """Create the year's quota for every stylist who has none, without committing
+
+        Returns the number of quotas created, the user IDs skipped for want of
+        an active work pattern or employment details, and the days carried over.
+        """
+        if year is None:
+            year = date.today().year
+            
+        user_ids = [row.id for row in db.session.query(User.id).filter(
+            User.roles.any(name='stylist'),
+            ~HolidayService._has_quota(year)
+        ).order_by(User.id)]
+        return HolidayService._insert_quotas(year, user_ids)
+    
+    @staticmethod
+    def rollover_quotas(year=None, carry_over=False, max_carry_over=None):
+        """Create the year's quotas for every active employee in one pass, without committing
+
+        Employees are active when their employment overlaps the year. With
+        `carry_over`, each new quota also gets the days left on the previous
+        year's quota, up to `max_carry_over` (HOLIDAY_CARRY_OVER_MAX_DAYS by
+        default). Employees who already have a quota for the year are left alone.
+        """
+        if year is None:
+            year = date.today().year + 1
+        if max_carry_over is None:
+            max_carry_over = current_app.config['HOLIDAY_CARRY_OVER_MAX_DAYS']
+            
+        user_ids = [row.user_id for row in db.session.query(EmploymentDetails.user_id).join(
+            User, User.id == EmploymentDetails.user_id
+        ).filter(
+            User.is_active == True,
+            EmploymentDetails.start_date < date(year + 1, 1, 1),
+            or_(EmploymentDetails.end_date.is_(None), EmploymentDetails.end_date >= date(year, 1, 1)),
+            ~HolidayService._has_quota(year)
+        ).order_by(EmploymentDetails.user_id)]
+        return HolidayService._insert_quotas(year, user_ids, max_carry_over if carry_over else 0)
+    
+    @staticmethod
+    def _has_quota(year):
+        """EXISTS clause for a user already having a quota for the year"""
+        return db.session.query(HolidayQuota.id).filter(
+            HolidayQuota.user_id == User.id,
+            HolidayQuota.year == year
+        ).exists()
+    
+    @staticmethod
+    def _insert_quotas(year, user_ids, max_carry_over=0):
+        """Bulk insert quotas for `user_ids`, loading everything they need up front"""
+        if not user_ids:
+            return {'created': 0, 'skipped': [], 'carried_over': 0}
+            
+        work_patterns = {}
+        for work_pattern in WorkPattern.query.filter(
+            WorkPattern.user_id.in_(user_ids),
+            WorkPattern.is_active == True
+        ).order_by(WorkPattern.id):
+            work_patterns.setdefault(work_pattern.user_id, work_pattern)
+        employments = {
+            employment.user_id: employment
+            for employment in EmploymentDetails.query.filter(EmploymentDetails.user_id.in_(user_ids))
+        }
+        days_taken = dict(db.session.query(
+            HolidayRequest.user_id,
+            func.sum(HolidayRequest.days_requested)
+        ).filter(
+            HolidayRequest.user_id.in_(user_ids),
+            HolidayRequest.status == 'approved',
+            HolidayRequest.start_date >= date(year, 1, 1),
+            HolidayRequest.start_date < date(year + 1, 1, 1)
+        ).group_by(HolidayRequest.user_id).all())
+        days_left = {}
+        if max_carry_over > 0:
+            days_left = dict(db.session.query(
+                HolidayQuota.user_id,
+                func.max(HolidayQuota.holiday_days_remaining)
+            ).filter(
+                HolidayQuota.user_id.in_(user_ids),
+                HolidayQuota.year == year - 1
+            ).group_by(HolidayQuota.user_id).all())
+        
+        rows = []
+        skipped = []
+        for user_id in user_ids:
+            if user_id not in work_patterns or user_id not in employments:
+                skipped.append(user_id)
+                continue
+            entitlement_data = HolidayService.entitlement_for(work_patterns[user_id], employments[user_id])
+            taken = days_taken.get(user_id) or 0
+            carried_over = min(max(days_left.get(user_id) or 0, 0), max_carry_over)
+            rows.append({
+                'user_id': user_id,
+                'year': year,
+                'total_hours_per_week': entitlement_data['weekly_hours'],
+                'holiday_days_entitled': entitlement_data['entitlement_days'],
+                'holiday_days_taken': taken,
+                'holiday_days_carried_over': carried_over,
+                'holiday_days_remaining': entitlement_data['entitlement_days'] + carried_over - taken
+            })
+        if rows:
+            db.session.execute(HolidayQuota.__table__.insert(), rows)
+            ReportCache.mark_changed(db.session, 'holidays')
+        return {
+            'created': len(rows),
+            'skipped': skipped,
+            'carried_over': sum(row['holiday_days_carried_over'] for row in rows)
+        }
+    
     @staticmethod
     def validate_holiday_request(user_id, start_date, end_date, notes=None):
         """Validate a holiday request against quotas, work patterns, and conflicts"""
@@ -89,10 +222,13 @@ class HolidayService:
         if start_date < date.today():
             errors.append("Cannot request holidays in the past")
             
-        # Calculate requested days (excluding weekends)
-        requested_days = HolidayService._calculate_working_days(start_date, end_date)
+        # Count the days the user actually works, less bank holidays
+        requested_days, bank_holidays = WorkingDayService.count_working_days(user_id, start_date, end_date)
         if requested_days <= 0:
             errors.append("No working days in the selected date range")
+        if bank_holidays:
+            warnings.append(f"Bank holidays are not taken from your allowance: "
+                            f"{', '.join(day.strftime('%d/%m/%Y') for day in bank_holidays)}")
             
         # Check quota availability
         year = start_date.year
@@ -118,30 +254,23 @@ class HolidayService:
         if overlapping_requests:
             errors.append("You have overlapping holiday requests for this period")
             
-        # Check work pattern conflicts
-        work_pattern = WorkPattern.query.filter_by(user_id=user_id, is_active=True).first()
-        if work_pattern:
-            # Check if requested dates fall on working days
-            working_days = work_pattern.work_schedule.get('working_days', [])
-            requested_weekdays = []
-            current_date = start_date
-            while current_date <= end_date:
-                if current_date.weekday() in working_days:
-                    requested_weekdays.append(current_date)
-                current_date += timedelta(days=1)
-                
-            if not requested_weekdays:
-                warnings.append("Selected dates do not fall on your working days")
-                
-        # Check for appointment conflicts (future enhancement)
-        # This could check for existing appointments in the date range
+        # Check for appointments booked over the holiday, and who could take them
+        reassignments = []
+        if start_date <= end_date:
+            reassignments = HolidayReassignmentService.plan(user_id, start_date, end_date)
+        if reassignments:
+            unassigned = sum(1 for suggestion in reassignments if suggestion['stylist_id'] is None)
+            warnings.append(f"{len(reassignments)} appointments are booked in this period: "
+                            f"{len(reassignments) - unassigned} can be reassigned to other stylists, "
+                            f"{unassigned} would need rescheduling")
         
         return {
             'valid': len(errors) == 0,
             'errors': errors,
             'warnings': warnings,
             'requested_days': requested_days,
-            'quota': quota
+            'quota': quota,
+            'reassignments': reassignments
         }
     
     @staticmethod
@@ -169,8 +298,8 @@ class HolidayService:
         return request, []
     
     @staticmethod
-    def approve_holiday_request(request_id, approved_by_user_id, notes=None):
-        """Approve a holiday request and update quota"""
+    def approve_holiday_request(request_id, approved_by_user_id, notes=None, reassign=False):
+        """Approve a holiday request and update quota, optionally reassigning its appointments"""
         request = HolidayRequest.query.get(request_id)
         if not request:
             return False, "Request not found"
@@ -178,24 +307,144 @@ class HolidayService:
         if request.status != 'pending':
             return False, "Request is not pending"
             
-        # Update request status
-        request.status = 'approved'
-        request.approved_by_id = approved_by_user_id
-        request.approved_at = datetime.now()
-        if notes:
-            request.notes = f"{request.notes or ''}\n\nApproval notes: {notes}"
+        result = HolidayService.decide_holiday_requests([request_id], 'approve', approved_by_user_id, notes,
+                                                        reassign=reassign)
+        if result['shortfalls']:
+            return False, f"Request not approved: {HolidayService.describe_shortfalls(result['shortfalls'])}"
+        if not result['decided']:
+            return False, "Request is not pending"
+            
+        message = "Request approved successfully"
+        if result['reassigned'] or result['unassigned']:
+            message += f". {HolidayService.describe_reassignments(result)}"
+        if result['conflicts']:
+            message += f". Warning: {HolidayService.describe_conflicts(result['conflicts'])}"
+        return True, message
+    
+    @staticmethod
+    def decide_holiday_requests(request_ids, action, decided_by_user_id, notes=None, min_staff=None,
+                                reassign=False):
+        """Approve or reject many pending requests in one transaction
+
+        The pending requests are locked first. Approvals are then checked against
+        minimum staff cover (HOLIDAY_MIN_STAFF_COVERAGE by default): if any day
+        would fall short, nothing changes and the days are returned as
+        'shortfalls'. Otherwise missing quotas are created, the approved days are
+        added to the locked quota rows by a single UPDATE in the database, and
+        everything is committed together. With `reassign`, appointments booked
+        over the approved holidays move to the stylists HolidayReassignmentService
+        suggests in the same transaction. Returns the 'decided' and 'skipped'
+        (missing or no longer pending) request IDs, 'shortfalls', the
+        too-many-off 'conflicts' the approvals cause, and the 'reassigned'
+        (appointment ID, stylist ID) pairs and 'unassigned' appointment IDs.
+        """
+        if min_staff is None:
+            min_staff = current_app.config['HOLIDAY_MIN_STAFF_COVERAGE']
+        request_ids = sorted(set(request_ids))
+        result = {'decided': [], 'skipped': [], 'shortfalls': [], 'conflicts': [], 'reassigned': [], 'unassigned': []}
+        
+        # Locked in ID order, so concurrent batches cannot deadlock
+        requests = HolidayRequest.query.filter(
+            HolidayRequest.id.in_(request_ids),
+            HolidayRequest.status == 'pending'
+        ).order_by(HolidayRequest.id).with_for_update().all()
+        result['decided'] = [request.id for request in requests]
+        result['skipped'] = sorted(set(request_ids) - set(result['decided']))
+        if not requests:
+            db.session.rollback()
+            return result
             
-        # Update quota
-        year = request.start_date.year
-        quota = HolidayService.get_or_create_holiday_quota(request.user_id, year)
-        if quota:
-            quota.holiday_days_taken += request.days_requested
-            quota.holiday_days_remaining = quota.holiday_days_entitled - quota.holiday_days_taken
-            quota.update_remaining_days()
+        decided_at = datetime.now()
+        if action == 'approve':
+            ranges = [(request.user_id, request.start_date, request.end_date) for request in requests]
+            result['shortfalls'] = HolidayCoverageService.staffing_shortfalls(ranges, min_staff)
+            if result['shortfalls']:
+                db.session.rollback()
+                result['decided'] = []
+                return result
+            result['conflicts'] = HolidayCoverageService.conflict_windows(HolidayCoverageService.build_segments(
+                HolidayCoverageService.load_ranges(min(r[1] for r in ranges), max(r[2] for r in ranges)) + ranges
+            ))
             
+            HolidayService._add_days_taken(requests)
+            for request in requests:
+                request.status = 'approved'
+                request.approved_by_id = decided_by_user_id
+                request.approved_at = decided_at
+                if notes:
+                    request.notes = f"{request.notes or ''}\n\nApproval notes: {notes}"
+            if reassign:
+                for request in requests:
+                    moved = HolidayReassignmentService.apply(HolidayReassignmentService.plan(
+                        request.user_id, request.start_date, request.end_date
+                    ))
+                    result['reassigned'].extend(moved['reassigned'])
+                    result['unassigned'].extend(moved['unassigned'])
+        else:
+            for request in requests:
+                request.status = 'rejected'
+                request.approved_by_id = decided_by_user_id  # Using same field for consistency
+                request.approved_at = decided_at
+                if notes:
+                    request.notes = f"{request.notes or ''}\n\nRejection notes: {notes}"
+                    
         db.session.commit()
-        
-        return True, "Request approved successfully"
+        return result
+    
+    @staticmethod
+    def _add_days_taken(requests):
+        """Add the requests' days to their quotas with one UPDATE on the locked quota rows"""
+        days_by_year = defaultdict(lambda: defaultdict(int))
+        for request in requests:
+            days_by_year[request.start_date.year][request.user_id] += request.days_requested
+            
+        for year, days_by_user in days_by_year.items():
+            existing = {row.user_id for row in db.session.query(HolidayQuota.user_id).filter(
+                HolidayQuota.user_id.in_(days_by_user),
+                HolidayQuota.year == year
+            )}
+            HolidayService._insert_quotas(year, sorted(set(days_by_user) - existing))
+            
+        quota_days = {}
+        for quota in db.session.query(HolidayQuota.id, HolidayQuota.user_id, HolidayQuota.year).filter(or_(*[
+            and_(HolidayQuota.year == year, HolidayQuota.user_id.in_(days_by_user))
+            for year, days_by_user in days_by_year.items()
+        ])).order_by(HolidayQuota.id).with_for_update():
+            # The first quota for a user and year is the one get_or_create_holiday_quota returns
+            quota_days.setdefault((quota.user_id, quota.year), (quota.id, days_by_year[quota.year][quota.user_id]))
+        if not quota_days:
+            return
+            
+        days = case(dict(quota_days.values()), value=HolidayQuota.id)
+        db.session.execute(
+            update(HolidayQuota).where(HolidayQuota.id.in_([quota_id for quota_id, _ in quota_days.values()])).values(
+                holiday_days_taken=func.coalesce(HolidayQuota.holiday_days_taken, 0) + days,
+                holiday_days_remaining=HolidayQuota.holiday_days_remaining - days,
+                updated_at=uk_utcnow()
+            ).execution_options(synchronize_session=False)
+        )
+        ReportCache.mark_changed(db.session, 'holidays')
+    
+    @staticmethod
+    def describe_shortfalls(shortfalls):
+        """One line naming the days that would be left short of staff"""
+        days = ', '.join(f"{shortfall['date']} ({shortfall['working']} of {shortfall['scheduled']} working)"
+                         for shortfall in shortfalls[:5])
+        more = f" and {len(shortfalls) - 5} more days" if len(shortfalls) > 5 else ''
+        return f"too few staff would be working on {days}{more}"
+    
+    @staticmethod
+    def describe_reassignments(result):
+        """One line saying how many appointments moved and how many still need rescheduling"""
+        reassigned = len(result['reassigned'])
+        return (f"{reassigned} appointment{'s' if reassigned != 1 else ''} reassigned, "
+                f"{len(result['unassigned'])} still need rescheduling")
+    
+    @staticmethod
+    def describe_conflicts(conflicts):
+        """One line naming the windows with too many staff on holiday"""
+        windows = ', '.join(f"{window['start']} to {window['end']} ({window['peak']} off)" for window in conflicts)
+        return f"too many staff on holiday {windows}"
     
     @staticmethod
     def reject_holiday_request(request_id, rejected_by_user_id, notes=None):
@@ -239,7 +488,7 @@ class HolidayService:
         if year is None:
             year = date.today().year
             
-        quota = HolidayService.get_or_create_holiday_quota(user_id, year)
+        quota = HolidayService.get_holiday_quota(user_id, year)
         if not quota:
             return None
             
@@ -247,7 +496,8 @@ class HolidayService:
         requests = HolidayRequest.query.filter(
             and_(
                 HolidayRequest.user_id == user_id,
-                func.extract('year', HolidayRequest.start_date) == year
+                HolidayRequest.start_date >= date(year, 1, 1),
+                HolidayRequest.start_date < date(year + 1, 1, 1)
             )
         ).all()
         
@@ -260,15 +510,61 @@ class HolidayService:
         }
     
     @staticmethod
-    def _calculate_working_days(start_date, end_date):
-        """Calculate working days between two dates (excluding weekends)"""
-        working_days = 0
-        current_date = start_date
-        
-        while current_date <= end_date:
-            # Monday = 0, Sunday = 6
-            if current_date.weekday() < 5:  # Monday to Friday
-                working_days += 1
-            current_date += timedelta(days=1)
+    def get_team_holiday_summary(year=None):
+        """Quotas and request counts by status for every stylist, for one year
+
+        Reads the stylists with their quotas in one query and the year's
+        requests grouped by (user, status) in another. Quotas are never created
+        here: stylists without one are listed under 'missing_quota' until
+        provision_missing_quotas is run.
+        """
+        if year is None:
+            year = date.today().year
+            
+        request_counts = defaultdict(dict)
+        for user_id, status, count in db.session.query(
+            HolidayRequest.user_id,
+            HolidayRequest.status,
+            func.count(HolidayRequest.id)
+        ).filter(
+            HolidayRequest.start_date >= date(year, 1, 1),
+            HolidayRequest.start_date < date(year + 1, 1, 1)
+        ).group_by(HolidayRequest.user_id, HolidayRequest.status):
+            request_counts[user_id][status] = count
+            
+        summary = {
+            'year': year,
+            'stylists': [],
+            'missing_quota': [],
+            'request_counts': {status: 0 for status in HOLIDAY_REQUEST_STATUSES},
+            'total_entitlement': 0,
+            'total_taken': 0,
+            'total_remaining': 0
+        }
+        seen_user_ids = set()
+        for user, quota in db.session.query(User, HolidayQuota).outerjoin(
+            HolidayQuota,
+            and_(HolidayQuota.user_id == User.id, HolidayQuota.year == year)
+        ).filter(User.roles.any(name='stylist')).order_by(User.first_name, User.last_name, User.id, HolidayQuota.id):
+            # Only the first quota for the year counts, as in get_or_create_holiday_quota
+            if user.id in seen_user_ids:
+                continue
+            seen_user_ids.add(user.id)
+            
+            counts = {status: request_counts[user.id].get(status, 0) for status in HOLIDAY_REQUEST_STATUSES}
+            for status, count in counts.items():
+                summary['request_counts'][status] += count
+            if not quota:
+                summary['missing_quota'].append(user)
+                continue
+                
+            summary['total_entitlement'] += quota.holiday_days_entitled
+            summary['total_taken'] += quota.holiday_days_taken or 0
+            summary['total_remaining'] += quota.holiday_days_remaining
+            summary['stylists'].append({
+                'user': user,
+                'quota': quota,
+                'request_counts': counts
+            })
             
-        return working_days 
\ No newline at end of file
+        return summary
@@ -1,9 +1,15 @@
+from collections import defaultdict
 from datetime import datetime, date
 from decimal import Decimal
-from app.models import Appointment, AppointmentCost, EmploymentDetails, User, Service, HolidayRequest, HolidayQuota, BillingElement
+from app.models import Appointment, AppointmentCost, AppointmentService, EmploymentDetails, User, Service, HolidayRequest, HolidayQuota, BillingElement, DailyStylistRollup
 from app.extensions import db
-from sqlalchemy import func, and_
+from app.services.billing_ledger import BillingLedgerService
+from app.services.rollup_service import DailyRollupService
+from app.services.report_cache import ReportCache
+from app.services.staff_directory import StaffDirectory
+from sqlalchemy import case, func, and_, select
 import json
+import time as timer
 
 
 class HRService:
@@ -21,11 +27,34 @@ class HRService:
         if not employment:
             return None
             
+        cost_fields = HRService.compute_cost_fields(
+            employment,
+            [service_link.service.price for service_link in appointment.services_link],
+            appointment.duration_minutes,
+            BillingElement.get_active_elements()
+        )
+        
+        # Create or update appointment cost record
+        cost_record = AppointmentCost.query.filter_by(appointment_id=appointment_id).first()
+        if not cost_record:
+            cost_record = AppointmentCost(
+                appointment_id=appointment_id,
+                stylist_id=appointment.stylist_id
+            )
+        
+        for field, value in cost_fields.items():
+            setattr(cost_record, field, value)
+        
+        db.session.add(cost_record)
+        db.session.commit()
+        
+        return cost_record
+    
+    @staticmethod
+    def compute_cost_fields(employment, service_prices, duration_minutes, billing_elements):
+        """Work out an appointment's AppointmentCost fields from preloaded data, without queries"""
         # Calculate total service revenue
-        total_revenue = 0
-        for service_link in appointment.services_link:
-            service = service_link.service
-            total_revenue += float(service.price)
+        total_revenue = sum(float(price) for price in service_prices)
         
         # Calculate stylist cost based on employment type
         stylist_cost = 0
@@ -38,77 +67,191 @@ class HRService:
         
         if employment.is_employed and employment.hourly_rate:
             # Hourly calculation
-            hours = appointment.duration_minutes / 60.0
+            hours = duration_minutes / 60.0
             stylist_cost = employment.calculate_hourly_cost(hours)
             calculation_method = 'hourly'
             hours_worked = hours
         elif employment.is_self_employed and employment.commission_rate:
             # Enhanced commission calculation with billing elements
-            commission_data = HRService.calculate_commission_with_billing_elements(appointment_id)
-            if commission_data:
-                stylist_cost = commission_data['total_commission']
-                calculation_method = 'commission'
-                commission_amount = stylist_cost
-                commission_breakdown = commission_data['commission_breakdown']
-                billing_elements_applied = commission_data['billing_elements_applied']
-                billing_method = commission_data['billing_method']
-        
-        # Calculate salon profit
-        salon_profit = total_revenue - stylist_cost
-        
-        # Create or update appointment cost record
-        cost_record = AppointmentCost.query.filter_by(appointment_id=appointment_id).first()
-        if not cost_record:
-            cost_record = AppointmentCost(
-                appointment_id=appointment_id,
-                stylist_id=appointment.stylist_id
-            )
+            commission_data = HRService._commission_with_billing_elements(employment, total_revenue, billing_elements)
+            stylist_cost = commission_data['total_commission']
+            calculation_method = 'commission'
+            commission_amount = stylist_cost
+            commission_breakdown = commission_data['commission_breakdown']
+            billing_elements_applied = commission_data['billing_elements_applied']
+            billing_method = commission_data['billing_method']
         
-        cost_record.service_revenue = total_revenue
-        cost_record.stylist_cost = stylist_cost
-        cost_record.salon_profit = salon_profit
-        cost_record.calculation_method = calculation_method
-        cost_record.hours_worked = hours_worked
-        cost_record.commission_amount = commission_amount
-        cost_record.commission_breakdown = commission_breakdown
-        cost_record.billing_elements_applied = billing_elements_applied
-        cost_record.billing_method = billing_method
+        return {
+            'service_revenue': total_revenue,
+            'stylist_cost': stylist_cost,
+            'salon_profit': total_revenue - stylist_cost,
+            'calculation_method': calculation_method,
+            'hours_worked': hours_worked,
+            'commission_amount': commission_amount,
+            'commission_breakdown': commission_breakdown,
+            'billing_elements_applied': billing_elements_applied,
+            'billing_method': billing_method
+        }
         
-        db.session.add(cost_record)
-        db.session.commit()
+    @staticmethod
+    def recalculate_costs(start_date=None, end_date=None, stylist_ids=None, appointment_ids=None,
+                          batch_size=500, progress=None):
+        """Recalculate AppointmentCost rows for many appointments in one transaction
+        
+        Selects appointments by date range, stylists and/or explicit IDs. Employment
+        details, service prices and billing elements are loaded once, costs are
+        computed in memory and rows are inserted or updated in batches of
+        `batch_size`. `progress(done, total)` is called after each batch. Stylists
+        without employment details are skipped, as with calculate_appointment_cost.
+        Returns counts and the elapsed time.
+        """
+        started = timer.perf_counter()
+        
+        query = db.session.query(
+            Appointment.id,
+            Appointment.stylist_id,
+            Appointment.appointment_date,
+            Appointment.start_time,
+            Appointment.end_time
+        )
+        if start_date:
+            query = query.filter(Appointment.appointment_date >= start_date)
+        if end_date:
+            query = query.filter(Appointment.appointment_date <= end_date)
+        if stylist_ids is not None:
+            query = query.filter(Appointment.stylist_id.in_(stylist_ids))
+        if appointment_ids is not None:
+            query = query.filter(Appointment.id.in_(appointment_ids))
+        appointments = query.order_by(Appointment.id).all()
+        
+        result = {'total': len(appointments), 'created': 0, 'updated': 0, 'skipped': 0}
+        if not appointments:
+            result['elapsed_seconds'] = timer.perf_counter() - started
+            return result
+        
+        # Preload everything the calculation needs
+        appointment_filter = query.with_entities(Appointment.id).subquery()
+        employment_by_stylist = {
+            employment.user_id: employment for employment in EmploymentDetails.query.filter(
+                EmploymentDetails.user_id.in_({appointment.stylist_id for appointment in appointments})
+            )
+        }
+        billing_elements = BillingElement.get_active_elements()
         
-        return cost_record
+        links = defaultdict(list)
+        for link in db.session.query(
+            AppointmentService.appointment_id,
+            AppointmentService.duration,
+            AppointmentService.waiting_time,
+            Service.price
+        ).join(Service, Service.id == AppointmentService.service_id).filter(
+            AppointmentService.appointment_id.in_(select(appointment_filter.c.id))
+        ):
+            links[link.appointment_id].append(link)
+        
+        existing_costs = dict(db.session.query(AppointmentCost.appointment_id, AppointmentCost.id).filter(
+            AppointmentCost.appointment_id.in_(select(appointment_filter.c.id))
+        ).all())
+        
+        try:
+            for batch_start in range(0, len(appointments), batch_size):
+                inserts = []
+                updates = []
+                for appointment in appointments[batch_start:batch_start + batch_size]:
+                    employment = employment_by_stylist.get(appointment.stylist_id)
+                    if not employment:
+                        result['skipped'] += 1
+                        continue
+                    
+                    appointment_links = links.get(appointment.id, [])
+                    if appointment_links:
+                        duration_minutes = sum(link.duration + (link.waiting_time or 0) for link in appointment_links)
+                    else:
+                        duration_minutes = (
+                            (appointment.end_time.hour * 60 + appointment.end_time.minute) -
+                            (appointment.start_time.hour * 60 + appointment.start_time.minute)
+                        )
+                    
+                    cost_fields = HRService.compute_cost_fields(
+                        employment, [link.price for link in appointment_links], duration_minutes, billing_elements
+                    )
+                    cost_fields['stylist_id'] = appointment.stylist_id
+                    
+                    if appointment.id in existing_costs:
+                        cost_fields['id'] = existing_costs[appointment.id]
+                        updates.append(cost_fields)
+                    else:
+                        cost_fields['appointment_id'] = appointment.id
+                        inserts.append(cost_fields)
+                
+                if inserts:
+                    db.session.bulk_insert_mappings(AppointmentCost, inserts)
+                if updates:
+                    db.session.bulk_update_mappings(AppointmentCost, updates)
+                db.session.flush()
+                result['created'] += len(inserts)
+                result['updated'] += len(updates)
+                
+                if progress:
+                    progress(min(batch_start + batch_size, len(appointments)), len(appointments))
+            
+            # Bulk writes skip the session hooks, so name the rollup rows to refresh
+            DailyRollupService.mark_dirty(db.session, {
+                (appointment.appointment_date, appointment.stylist_id) for appointment in appointments
+            })
+            BillingLedgerService.mark_dirty(db.session, [appointment.id for appointment in appointments])
+            ReportCache.mark_changed(db.session, 'costs')
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        
+        result['elapsed_seconds'] = timer.perf_counter() - started
+        return result
     
     @staticmethod
     def calculate_stylist_earnings(stylist_id, start_date=None, end_date=None):
         """Calculate stylist earnings for a date range"""
+        return HRService.calculate_earnings_by_stylist(start_date, end_date, stylist_ids=[stylist_id])[stylist_id]
+    
+    @staticmethod
+    def calculate_earnings_by_stylist(start_date=None, end_date=None, stylist_ids=None):
+        """Calculate earnings for every stylist with completed appointments in one grouped query
+        
+        Returns a dict of stylist ID to the calculate_stylist_earnings totals.
+        Stylists in `stylist_ids` without costed appointments get zero totals;
+        without `stylist_ids`, only stylists with costed appointments are included.
+        """
         if not start_date:
             start_date = date.today().replace(day=1)  # First day of current month
         if not end_date:
             end_date = date.today()
             
-        # Get appointments in date range
-        appointments = Appointment.query.filter(
+        query = db.session.query(
+            Appointment.stylist_id,
+            func.sum(AppointmentCost.stylist_cost).label('total_earnings'),
+            func.sum(AppointmentCost.hours_worked).label('total_hours'),
+            func.count(AppointmentCost.id).label('appointment_count')
+        ).join(AppointmentCost, AppointmentCost.appointment_id == Appointment.id).filter(
             and_(
-                Appointment.stylist_id == stylist_id,
                 Appointment.appointment_date >= start_date,
                 Appointment.appointment_date <= end_date,
                 Appointment.status == 'completed'
             )
-        ).all()
-        
-        total_earnings = 0
-        total_hours = 0
-        appointment_count = 0
-        
-        for appointment in appointments:
-            cost_record = AppointmentCost.query.filter_by(appointment_id=appointment.id).first()
-            if cost_record:
-                total_earnings += float(cost_record.stylist_cost)
-                if cost_record.hours_worked:
-                    total_hours += float(cost_record.hours_worked)
-                appointment_count += 1
+        )
+        if stylist_ids is not None:
+            query = query.filter(Appointment.stylist_id.in_(stylist_ids))
+        
+        earnings = {stylist_id: HRService._earnings_totals(0, 0, 0) for stylist_id in stylist_ids or []}
+        for row in query.group_by(Appointment.stylist_id):
+            earnings[row.stylist_id] = HRService._earnings_totals(
+                float(row.total_earnings or 0), float(row.total_hours or 0), row.appointment_count
+            )
+        return earnings
         
+    @staticmethod
+    def _earnings_totals(total_earnings, total_hours, appointment_count):
+        """Build the earnings dict, with averages, from summed totals"""
         return {
             'total_earnings': total_earnings,
             'total_hours': total_hours,
@@ -118,6 +261,7 @@ class HRService:
         }
     
     @staticmethod
+    @ReportCache.cached('appointments', 'costs')
     def calculate_salon_profit(start_date=None, end_date=None):
         """Calculate salon profit for a date range"""
         if not start_date:
@@ -125,17 +269,16 @@ class HRService:
         if not end_date:
             end_date = date.today()
             
-        # Get cost records in date range
+        # Sum the daily rollups in date range
         cost_records = db.session.query(
-            func.sum(AppointmentCost.service_revenue).label('total_revenue'),
-            func.sum(AppointmentCost.stylist_cost).label('total_stylist_cost'),
-            func.sum(AppointmentCost.salon_profit).label('total_profit'),
-            func.count(AppointmentCost.id).label('appointment_count')
-        ).join(Appointment).filter(
+            func.sum(DailyStylistRollup.revenue).label('total_revenue'),
+            func.sum(DailyStylistRollup.stylist_cost).label('total_stylist_cost'),
+            func.sum(DailyStylistRollup.salon_profit).label('total_profit'),
+            func.sum(DailyStylistRollup.costed_count).label('appointment_count')
+        ).filter(
             and_(
-                Appointment.appointment_date >= start_date,
-                Appointment.appointment_date <= end_date,
-                Appointment.status == 'completed'
+                DailyStylistRollup.date >= start_date,
+                DailyStylistRollup.date <= end_date
             )
         ).first()
         
@@ -165,8 +308,14 @@ class HRService:
             'employment_details': []
         }
         
+        employment_by_user = {
+            employment.user_id: employment for employment in EmploymentDetails.query.filter(
+                EmploymentDetails.user_id.in_([stylist.id for stylist in stylists])
+            )
+        }
+        
         for stylist in stylists:
-            employment = EmploymentDetails.query.filter_by(user_id=stylist.id).first()
+            employment = employment_by_user.get(stylist.id)
             if employment:
                 summary['total_stylists'] += 1
                 
@@ -246,35 +395,56 @@ class HRService:
     @staticmethod
     def calculate_stylist_commission_performance(stylist_id, start_date=None, end_date=None):
         """Calculate stylist commission performance metrics"""
+        return HRService.calculate_commission_performance_by_stylist(
+            start_date, end_date, stylist_ids=[stylist_id]
+        )[stylist_id]
+    
+    @staticmethod
+    def calculate_commission_performance_by_stylist(start_date=None, end_date=None, stylist_ids=None):
+        """Calculate commission performance for every stylist in one grouped query
+        
+        Completed appointments are outer-joined to their costs, so appointments
+        that have not been costed yet still count towards the commission rate.
+        Returns a dict of stylist ID to calculate_stylist_commission_performance
+        metrics, with zero metrics for requested stylists without appointments.
+        """
         if not start_date:
             start_date = date.today().replace(day=1)  # First day of current month
         if not end_date:
             end_date = date.today()
             
-        # Get appointments in date range
-        appointments = Appointment.query.filter(
+        is_commission = AppointmentCost.calculation_method == 'commission'
+        query = db.session.query(
+            Appointment.stylist_id,
+            func.sum(case((is_commission, func.coalesce(AppointmentCost.commission_amount, 0)), else_=0)).label('total_commission'),
+            func.sum(case((is_commission, AppointmentCost.service_revenue), else_=0)).label('total_revenue'),
+            func.count(func.distinct(Appointment.id)).label('appointment_count'),
+            func.count(case((is_commission, AppointmentCost.id))).label('commission_appointments')
+        ).outerjoin(AppointmentCost, AppointmentCost.appointment_id == Appointment.id).filter(
             and_(
-                Appointment.stylist_id == stylist_id,
                 Appointment.appointment_date >= start_date,
                 Appointment.appointment_date <= end_date,
                 Appointment.status == 'completed'
             )
-        ).all()
+        )
+        if stylist_ids is not None:
+            query = query.filter(Appointment.stylist_id.in_(stylist_ids))
         
-        total_commission = 0
-        total_revenue = 0
-        appointment_count = 0
-        commission_appointments = 0
-        
-        for appointment in appointments:
-            cost_record = AppointmentCost.query.filter_by(appointment_id=appointment.id).first()
-            if cost_record and cost_record.calculation_method == 'commission':
-                total_commission += float(cost_record.commission_amount or 0)
-                total_revenue += float(cost_record.service_revenue)
-                commission_appointments += 1
-            appointment_count += 1
-        
-        # Calculate performance metrics
+        performance = {
+            stylist_id: HRService._commission_performance_totals(0, 0, 0, 0, start_date, end_date)
+            for stylist_id in stylist_ids or []
+        }
+        for row in query.group_by(Appointment.stylist_id):
+            performance[row.stylist_id] = HRService._commission_performance_totals(
+                float(row.total_commission or 0), float(row.total_revenue or 0),
+                row.appointment_count, row.commission_appointments, start_date, end_date
+            )
+        return performance
+        
+    @staticmethod
+    def _commission_performance_totals(total_commission, total_revenue, appointment_count,
+                                       commission_appointments, start_date, end_date):
+        """Build the commission performance dict, with derived metrics, from summed totals"""
         avg_commission_per_appointment = total_commission / commission_appointments if commission_appointments > 0 else 0
         commission_efficiency = (total_commission / total_revenue * 100) if total_revenue > 0 else 0
         commission_rate = (commission_appointments / appointment_count * 100) if appointment_count > 0 else 0
@@ -294,6 +464,7 @@ class HRService:
         }
     
     @staticmethod
+    @ReportCache.cached('appointments', 'costs')
     def calculate_salon_commission_summary(start_date=None, end_date=None):
         """Calculate salon-wide commission summary and analytics"""
         if not start_date:
@@ -301,43 +472,36 @@ class HRService:
         if not end_date:
             end_date = date.today()
             
-        # Get all commission-based cost records in date range
+        # Sum the commission columns of the daily rollups in date range
+        in_range = and_(
+            DailyStylistRollup.date >= start_date,
+            DailyStylistRollup.date <= end_date
+        )
         cost_records = db.session.query(
-            func.sum(AppointmentCost.service_revenue).label('total_revenue'),
-            func.sum(AppointmentCost.commission_amount).label('total_commission'),
-            func.sum(AppointmentCost.salon_profit).label('total_salon_profit'),
-            func.count(AppointmentCost.id).label('appointment_count'),
-            func.avg(AppointmentCost.commission_amount).label('avg_commission')
-        ).join(Appointment).filter(
-            and_(
-                Appointment.appointment_date >= start_date,
-                Appointment.appointment_date <= end_date,
-                Appointment.status == 'completed',
-                AppointmentCost.calculation_method == 'commission'
-            )
-        ).first()
+            func.sum(DailyStylistRollup.commission_revenue).label('total_revenue'),
+            func.sum(DailyStylistRollup.commission_amount).label('total_commission'),
+            func.sum(DailyStylistRollup.commission_salon_profit).label('total_salon_profit'),
+            func.sum(DailyStylistRollup.commission_count).label('appointment_count')
+        ).filter(in_range).first()
         
         # Get stylist breakdown
         stylist_breakdown = db.session.query(
-            AppointmentCost.stylist_id,
-            func.sum(AppointmentCost.service_revenue).label('stylist_revenue'),
-            func.sum(AppointmentCost.commission_amount).label('stylist_commission'),
-            func.count(AppointmentCost.id).label('appointment_count')
-        ).join(Appointment).filter(
-            and_(
-                Appointment.appointment_date >= start_date,
-                Appointment.appointment_date <= end_date,
-                Appointment.status == 'completed',
-                AppointmentCost.calculation_method == 'commission'
-            )
-        ).group_by(AppointmentCost.stylist_id).all()
+            DailyStylistRollup.stylist_id,
+            func.sum(DailyStylistRollup.commission_revenue).label('stylist_revenue'),
+            func.sum(DailyStylistRollup.commission_amount).label('stylist_commission'),
+            func.sum(DailyStylistRollup.commission_count).label('appointment_count')
+        ).filter(in_range).group_by(DailyStylistRollup.stylist_id).having(
+            func.sum(DailyStylistRollup.commission_count) > 0
+        ).all()
+        
+        stylist_names = StaffDirectory.get_names([record.stylist_id for record in stylist_breakdown])
         
         # Calculate summary metrics
         total_revenue = float(cost_records.total_revenue or 0)
         total_commission = float(cost_records.total_commission or 0)
         total_salon_profit = float(cost_records.total_salon_profit or 0)
         appointment_count = cost_records.appointment_count or 0
-        avg_commission = float(cost_records.avg_commission or 0)
+        avg_commission = total_commission / appointment_count if appointment_count > 0 else 0
         
         commission_efficiency = (total_commission / total_revenue * 100) if total_revenue > 0 else 0
         profit_margin = (total_salon_profit / total_revenue * 100) if total_revenue > 0 else 0
@@ -353,7 +517,7 @@ class HRService:
             'stylist_breakdown': [
                 {
                     'stylist_id': record.stylist_id,
-                    'stylist_name': User.query.get(record.stylist_id).first_name + ' ' + User.query.get(record.stylist_id).last_name,
+                    'stylist_name': stylist_names.get(record.stylist_id, 'Unknown'),
                     'revenue': float(record.stylist_revenue),
                     'commission': float(record.stylist_commission),
                     'appointment_count': record.appointment_count,
@@ -385,9 +549,13 @@ class HRService:
             service = service_link.service
             total_revenue += float(service.price)
         
-        # Get billing elements
-        billing_elements = BillingElement.get_active_elements()
+        return HRService._commission_with_billing_elements(
+            employment, total_revenue, BillingElement.get_active_elements()
+        )
         
+    @staticmethod
+    def _commission_with_billing_elements(employment, total_revenue, billing_elements):
+        """Commission and billing element breakdown for a revenue total, without queries"""
         # Calculate commission
         commission_percentage = float(employment.commission_rate) if employment.commission_rate else 0
         total_commission = total_revenue * (commission_percentage / 100)
@@ -397,6 +565,7 @@ class HRService:
         for element in billing_elements:
             element_amount = total_revenue * (float(element.percentage) / 100)
             elements_applied[element.name] = {
+                'element_id': element.id,
                 'percentage': float(element.percentage),
                 'amount': element_amount,
                 'commission_portion': element_amount * (commission_percentage / 100)
@@ -435,18 +604,21 @@ class HRService:
         if not stylist or not employment:
             return None
             
-        # Get appointments and costs
-        appointments = Appointment.query.filter(
+        # Count appointments by status
+        status_counts = dict(db.session.query(
+            Appointment.status,
+            func.count(Appointment.id)
+        ).filter(
             and_(
                 Appointment.stylist_id == stylist_id,
                 Appointment.appointment_date >= start_date,
                 Appointment.appointment_date <= end_date
             )
-        ).all()
+        ).group_by(Appointment.status).all())
         
-        total_appointments = len(appointments)
-        completed_appointments = len([a for a in appointments if a.status == 'completed'])
-        cancelled_appointments = len([a for a in appointments if a.status == 'cancelled'])
+        total_appointments = sum(status_counts.values())
+        completed_appointments = status_counts.get('completed', 0)
+        cancelled_appointments = status_counts.get('cancelled', 0)
         
         # Calculate earnings
         earnings_data = HRService.calculate_stylist_earnings(stylist_id, start_date, end_date)
@@ -469,19 +641,17 @@ class HRService:
         """Get holiday summary for all staff"""
         from app.services.holiday_service import HolidayService
         
-        # Get all stylists
-        stylists = User.query.join(User.roles).filter(
-            User.roles.any(name='stylist')
-        ).all()
+        team = HolidayService.get_team_holiday_summary()
         
         summary = {
-            'total_stylists': len(stylists),
+            'total_stylists': len(team['stylists']) + len(team['missing_quota']),
             'pending_requests': 0,
-            'approved_requests': 0,
-            'rejected_requests': 0,
-            'total_entitlement': 0,
-            'total_taken': 0,
-            'total_remaining': 0,
+            'approved_requests': team['request_counts']['approved'],
+            'rejected_requests': team['request_counts']['rejected'],
+            'total_entitlement': team['total_entitlement'],
+            'total_taken': team['total_taken'],
+            'total_remaining': team['total_remaining'],
+            'missing_quotas': len(team['missing_quota']),
             'stylist_holidays': []
         }
         
@@ -489,23 +659,18 @@ class HRService:
         pending_requests = HolidayRequest.query.filter_by(status='pending').count()
         summary['pending_requests'] = pending_requests
         
-        for stylist in stylists:
-            holiday_data = HolidayService.get_holiday_summary(stylist.id)
-            if holiday_data and holiday_data['quota']:
-                quota = holiday_data['quota']
-                summary['total_entitlement'] += quota.holiday_days_entitled
-                summary['total_taken'] += quota.holiday_days_taken
-                summary['total_remaining'] += quota.holiday_days_remaining
-                
-                summary['stylist_holidays'].append({
-                    'user_id': stylist.id,
-                    'name': f"{stylist.first_name} {stylist.last_name}",
-                    'entitled': quota.holiday_days_entitled,
-                    'taken': quota.holiday_days_taken,
-                    'remaining': quota.holiday_days_remaining,
-                    'pending_requests': len(holiday_data['pending_requests']),
-                    'approved_requests': len(holiday_data['approved_requests']),
-                    'rejected_requests': len(holiday_data['rejected_requests'])
-                })
+        for stylist in team['stylists']:
+            user = stylist['user']
+            quota = stylist['quota']
+            summary['stylist_holidays'].append({
+                'user_id': user.id,
+                'name': f"{user.first_name} {user.last_name}",
+                'entitled': quota.holiday_days_entitled,
+                'taken': quota.holiday_days_taken,
+                'remaining': quota.holiday_days_remaining,
+                'pending_requests': stylist['request_counts']['pending'],
+                'approved_requests': stylist['request_counts']['approved'],
+                'rejected_requests': stylist['request_counts']['rejected']
+            })
         
         return summary 
\ No newline at end of file
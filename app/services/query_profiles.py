@@ -0,0 +1,70 @@
+from sqlalchemy.orm import joinedload, selectinload
+from app.models import Appointment, AppointmentCost, AppointmentService, User
+
+
+class QueryProfiles:
+    """Named eager-loading option bundles, one per view shape
+
+    Each bundle loads exactly the relationships its views touch, so rendering a
+    list of appointments costs a fixed number of queries however long it is.
+    Apply with `query.options(*QueryProfiles.<profile>())`.
+    """
+
+    @staticmethod
+    def appointment_calendar():
+        """Calendars: customer, stylist and every service name on each appointment"""
+        return (
+            joinedload(Appointment.customer),
+            joinedload(Appointment.stylist),
+            joinedload(Appointment.service),
+            selectinload(Appointment.services_link).joinedload(AppointmentService.service)
+        )
+
+    @staticmethod
+    def appointment_events():
+        """Calendar event feed: customer name and the primary service"""
+        return (
+            joinedload(Appointment.customer),
+            joinedload(Appointment.service)
+        )
+
+    @staticmethod
+    def customer_dashboard():
+        """Customer dashboard: who the appointment is with and for what"""
+        return (
+            joinedload(Appointment.stylist),
+            joinedload(Appointment.service)
+        )
+
+    @staticmethod
+    def stylist_dashboard():
+        """Stylist dashboard: customer details, service and duration"""
+        return (
+            joinedload(Appointment.customer),
+            joinedload(Appointment.service),
+            selectinload(Appointment.services_link)
+        )
+
+    @staticmethod
+    def calendar_stylists():
+        """Calendar stylist columns, coloured by role"""
+        return (
+            selectinload(User.roles),
+        )
+
+    @staticmethod
+    def staff_employment():
+        """Staff reports: each user's employment details"""
+        return (
+            selectinload(User.employment_details),
+        )
+
+    @staticmethod
+    def appointment_costs():
+        """Cost reports: appointment time, customer, stylist and service names"""
+        return (
+            joinedload(AppointmentCost.stylist),
+            joinedload(AppointmentCost.appointment).joinedload(Appointment.customer),
+            joinedload(AppointmentCost.appointment).selectinload(Appointment.services_link)
+            .joinedload(AppointmentService.service)
+        )
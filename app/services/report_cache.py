@@ -0,0 +1,395 @@
+from collections import Counter, OrderedDict
+from datetime import date, timedelta
+from functools import wraps
+import hashlib
+import hmac
+import inspect as pyinspect
+import logging
+import pickle
+import threading
+import time as timer
+from flask import current_app, has_app_context
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import (
+    Appointment, AppointmentService, AppointmentCost, BillingElement, EmploymentDetails,
+    HolidayQuota, HolidayRequest, ReportCacheEntry, ReportCacheGeneration, SalonSettings, WorkPattern
+)
+from app.extensions import db
+from app.utils import uk_utcnow
+
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_MAX_ENTRIES = 256
+# Length of the HMAC-SHA256 signature stored before each pickled database entry
+SIGNATURE_BYTES = 32
+
+# Which cached results a write to each model makes stale
+TAGS_BY_MODEL = {
+    Appointment: 'appointments',
+    AppointmentService: 'appointments',
+    AppointmentCost: 'costs',
+    BillingElement: 'costs',
+    HolidayRequest: 'holidays',
+    HolidayQuota: 'holidays',
+    EmploymentDetails: 'employment',
+    WorkPattern: 'employment',
+    SalonSettings: 'employment',
+}
+
+
+class MemoryReportCache:
+    """Per-process LRU cache of pickled results with a TTL"""
+
+    # Invalidated after the writing transaction commits
+    transactional = False
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.counts = Counter()
+        self.generations = Counter()
+
+    def generation(self, tags):
+        """Snapshot of how often each of `tags` has been invalidated"""
+        with self.lock:
+            return tuple(self.generations[tag] for tag in sorted(tags))
+
+    def get(self, key):
+        """Get (True, value) for a live entry or (False, None)"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= timer.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.counts['misses'] += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.counts['hits'] += 1
+            return True, pickle.loads(entry[2])
+
+    def set(self, key, value, tags, generation=None):
+        """Store a result, unless a tag was invalidated since `generation` was taken"""
+        with self.lock:
+            if generation is not None and generation != tuple(self.generations[tag] for tag in sorted(tags)):
+                self.counts['stale'] += 1
+                return
+            self.entries[key] = (timer.monotonic() + self.ttl_seconds, frozenset(tags), pickle.dumps(value))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counts['evictions'] += 1
+
+    def invalidate(self, tags):
+        """Drop entries depending on any of `tags`"""
+        tags = set(tags)
+        with self.lock:
+            for tag in tags:
+                self.generations[tag] += 1
+            stale = [key for key, entry in self.entries.items() if entry[1] & tags]
+            for key in stale:
+                del self.entries[key]
+            self.counts['invalidations'] += len(stale)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def entry_count(self):
+        return len(self.entries)
+
+
+class DatabaseReportCache:
+    """LRU cache of pickled results with a TTL in the report_cache_entry table
+
+    Shared by every worker process. Reads and stores use their own connection
+    and transaction, so caching never commits or rolls back the caller's work.
+    Values are signed with SECRET_KEY and only unpickled once the signature
+    checks out, so rows written by anything else are never loaded. Invalidation
+    runs inside the transaction that changed the data and bumps each tag's row
+    in report_cache_generation. A store locks those rows, so it waits for an
+    invalidating transaction to finish and then sees that it ran.
+    Hit and miss counts are per process.
+    """
+
+    # Invalidated inside the writing transaction
+    transactional = True
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+    def generation(self, tags):
+        """Snapshot of how often each of `tags` has been invalidated"""
+        with db.engine.connect() as connection:
+            return self._generation(connection, tags)
+
+    @staticmethod
+    def _sign(payload):
+        """HMAC-SHA256 of a pickled value under the app's SECRET_KEY"""
+        secret = current_app.config['SECRET_KEY'].encode('utf-8')
+        return hmac.new(secret, payload, hashlib.sha256).digest()
+
+    def _dumps(self, value):
+        payload = pickle.dumps(value)
+        return self._sign(payload) + payload
+
+    def _loads(self, value):
+        """Unpickle a stored value, or raise ValueError if its signature does not match"""
+        signature, payload = value[:SIGNATURE_BYTES], value[SIGNATURE_BYTES:]
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise ValueError('report cache entry signature mismatch')
+        return pickle.loads(payload)
+
+    @staticmethod
+    def _generation(connection, tags, lock=False):
+        table = ReportCacheGeneration.__table__
+        query = select(table.c.tag, table.c.generation).where(table.c.tag.in_(sorted(tags)))
+        if lock and connection.dialect.name == 'postgresql':
+            query = query.with_for_update()
+        generations = dict(connection.execute(query).all())
+        return tuple(generations.get(tag, 0) for tag in sorted(tags))
+
+    def get(self, key):
+        """Get (True, value) for a live entry or (False, None)"""
+        table = ReportCacheEntry.__table__
+        now = uk_utcnow()
+        with db.engine.begin() as connection:
+            value = connection.execute(
+                select(table.c.value).where(table.c.key == key, table.c.expires_at > now)
+            ).scalar()
+            if value is not None:
+                connection.execute(update(table).where(table.c.key == key).values(last_used_at=now))
+
+        if value is not None:
+            try:
+                value = self._loads(value)
+            except ValueError as e:
+                logging.warning(f"Ignoring report cache entry {key}: {e}")
+                value = None
+        if value is None:
+            self._count('misses')
+            return False, None
+        self._count('hits')
+        return True, value
+
+    def set(self, key, value, tags, generation=None):
+        """Store a result, unless a tag was invalidated since `generation` was taken"""
+        table = ReportCacheEntry.__table__
+        now = uk_utcnow()
+        row = {
+            'key': key,
+            'value': self._dumps(value),
+            'tags': ',' + ','.join(sorted(tags)) + ',',
+            'expires_at': now + timedelta(seconds=self.ttl_seconds),
+            'last_used_at': now
+        }
+
+        with db.engine.begin() as connection:
+            dialect = connection.dialect.name
+            if generation is not None:
+                if dialect in ('postgresql', 'sqlite'):
+                    # Give every tag a row to lock, waiting on one being inserted by an invalidation
+                    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+                    connection.execute(insert(ReportCacheGeneration.__table__).values([
+                        {'tag': tag, 'generation': 0} for tag in sorted(tags)
+                    ]).on_conflict_do_nothing())
+                if self._generation(connection, tags, lock=True) != generation:
+                    self._count('stale')
+                    return
+
+            if dialect in ('postgresql', 'sqlite'):
+                insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+                statement = insert(table).values(**row)
+                connection.execute(statement.on_conflict_do_update(
+                    index_elements=[table.c.key],
+                    set_={column: statement.excluded[column] for column in row if column != 'key'}
+                ))
+            else:
+                connection.execute(delete(table).where(table.c.key == key))
+                connection.execute(table.insert().values(**row))
+
+            connection.execute(delete(table).where(table.c.expires_at <= now))
+            excess = connection.execute(select(func.count()).select_from(table)).scalar() - self.max_entries
+            if excess > 0:
+                oldest = [row.key for row in connection.execute(
+                    select(table.c.key).order_by(table.c.last_used_at).limit(excess)
+                )]
+                connection.execute(delete(table).where(table.c.key.in_(oldest)))
+                self._count('evictions', excess)
+
+    def invalidate(self, tags, session=None):
+        """Drop entries depending on any of `tags`, inside `session`'s transaction when given"""
+        table = ReportCacheEntry.__table__
+        statement = delete(table).where(or_(*[table.c.tags.contains(f',{tag},') for tag in tags]))
+        if session is None:
+            with db.engine.begin() as connection:
+                removed = connection.execute(statement).rowcount
+                self._bump(connection, tags)
+        else:
+            removed = session.execute(statement).rowcount
+            self._bump(session, tags)
+        self._count('invalidations', max(removed or 0, 0))
+
+    @staticmethod
+    def _bump(executor, tags):
+        """Count an invalidation of each of `tags`, through a connection or session"""
+        table = ReportCacheGeneration.__table__
+        dialect = db.engine.dialect.name
+        for tag in sorted(tags):
+            if dialect in ('postgresql', 'sqlite'):
+                insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+                statement = insert(table).values(tag=tag, generation=1)
+                executor.execute(statement.on_conflict_do_update(
+                    index_elements=[table.c.tag],
+                    set_={'generation': table.c.generation + 1}
+                ))
+            elif not executor.execute(
+                update(table).where(table.c.tag == tag).values(generation=table.c.generation + 1)
+            ).rowcount:
+                executor.execute(table.insert().values(tag=tag, generation=1))
+
+    def clear(self):
+        with db.engine.begin() as connection:
+            connection.execute(delete(ReportCacheEntry.__table__))
+
+    def entry_count(self):
+        with db.engine.connect() as connection:
+            return connection.execute(select(func.count()).select_from(ReportCacheEntry.__table__)).scalar()
+
+
+BACKENDS = {
+    'memory': MemoryReportCache,
+    'database': DatabaseReportCache,
+}
+
+
+class ReportCache:
+    """Cache of report results keyed by method, arguments and day
+
+    Results are tagged with the data they are built from ('appointments',
+    'costs', 'holidays', 'employment') and dropped when a committed transaction
+    writes to a model with that tag, or after REPORT_CACHE_TTL seconds. Bulk
+    writes that skip the session hooks call mark_changed themselves.
+    """
+
+    @staticmethod
+    def _instance():
+        """Get the cache backend for the current app, or None when caching is off"""
+        if not has_app_context():
+            return None
+        extensions = current_app.extensions
+        if 'report_cache' not in extensions:
+            backend = BACKENDS.get(current_app.config.get('REPORT_CACHE_BACKEND', 'memory'))
+            extensions.setdefault('report_cache', backend(
+                current_app.config.get('REPORT_CACHE_TTL', DEFAULT_TTL_SECONDS),
+                current_app.config.get('REPORT_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+            ) if backend else None)
+        return extensions['report_cache']
+
+    @staticmethod
+    def make_key(function, args, kwargs):
+        """Stable key for a call, including today's date for methods that default to it"""
+        bound = pyinspect.signature(function).bind(*args, **kwargs)
+        bound.apply_defaults()
+        call = f"{function.__module__}.{function.__qualname__}{sorted(bound.arguments.items())!r}@{date.today()}"
+        return hashlib.sha256(call.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def cached(*tags):
+        """Decorate a report method to cache its result until `tags` data changes"""
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                cache = ReportCache._instance()
+                if cache is None:
+                    return function(*args, **kwargs)
+
+                key = ReportCache.make_key(function, args, kwargs)
+                # Taken before the lookup, so a result built from data changed meanwhile is not stored
+                generation = cache.generation(tags)
+                found, value = cache.get(key)
+                if found:
+                    return value
+                value = function(*args, **kwargs)
+                cache.set(key, value, tags, generation)
+                return value
+            wrapper.uncached = function
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def mark_changed(session, *tags):
+        """Invalidate results depending on `tags` when `session` commits"""
+        session.info.setdefault('report_cache_tags', set()).update(tags)
+
+    @staticmethod
+    def invalidate(*tags):
+        """Invalidate results depending on any of `tags` now"""
+        cache = ReportCache._instance()
+        if cache is not None:
+            cache.invalidate(tags)
+
+    @staticmethod
+    def clear():
+        cache = ReportCache._instance()
+        if cache is not None:
+            cache.clear()
+
+    @staticmethod
+    def stats():
+        """Backend name, hit/miss/eviction/invalidation counts and hit rate for this process"""
+        cache = ReportCache._instance()
+        if cache is None:
+            return {'backend': 'none'}
+        with cache.lock:
+            counts = dict(cache.counts)
+        lookups = counts.get('hits', 0) + counts.get('misses', 0)
+        return {
+            'backend': current_app.config.get('REPORT_CACHE_BACKEND', 'memory'),
+            'entries': cache.entry_count(),
+            'hits': counts.get('hits', 0),
+            'misses': counts.get('misses', 0),
+            'evictions': counts.get('evictions', 0),
+            'invalidations': counts.get('invalidations', 0),
+            'stale': counts.get('stale', 0),
+            'hit_rate': (counts.get('hits', 0) / lookups * 100) if lookups else 0
+        }
+
+    @staticmethod
+    def collect_changes(session):
+        """Note which report tags the models written in a flush affect"""
+        tags = {
+            TAGS_BY_MODEL[type(instance)]
+            for instance in list(session.new) + list(session.dirty) + list(session.deleted)
+            if type(instance) in TAGS_BY_MODEL and (instance not in session.dirty or session.is_modified(instance))
+        }
+        if tags:
+            ReportCache.mark_changed(session, *tags)
+
+    @staticmethod
+    def apply_changes(session):
+        """Let a shared backend drop stale results in the same transaction as the writes"""
+        tags = session.info.get('report_cache_tags')
+        cache = ReportCache._instance()
+        if tags and cache is not None and cache.transactional:
+            cache.invalidate(tags, session)
+
+    @staticmethod
+    def apply_committed_changes(session):
+        """Drop stale results from a per-process backend once the writes are committed"""
+        tags = session.info.pop('report_cache_tags', None)
+        cache = ReportCache._instance()
+        if tags and cache is not None and not cache.transactional:
+            cache.invalidate(tags)
+
+    @staticmethod
+    def discard_changes(session):
+        session.info.pop('report_cache_tags', None)
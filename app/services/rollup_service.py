@@ -0,0 +1,188 @@
+from sqlalchemy import and_, case, exists, func, inspect, literal, true, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import Appointment, AppointmentCost, DailyStylistRollup
+from app.extensions import db
+from app.services.availability_service import ACTIVE_STATUSES
+from app.services.calendar_service import CalendarService
+from app.services.report_cache import ReportCache
+from app.utils import uk_utcnow
+
+# Appointment columns that move an appointment between rollup rows or change its totals
+ROLLUP_APPOINTMENT_FIELDS = ('appointment_date', 'stylist_id', 'status', 'start_time', 'end_time')
+
+# (date, stylist) pairs refreshed per statement, keeping bound parameters well under database limits
+REFRESH_CHUNK_SIZE = 500
+
+# Rollup columns, in the order the aggregate query selects them
+ROLLUP_COLUMNS = [
+    'date', 'stylist_id', 'appointment_count', 'completed_count', 'booked_minutes',
+    'costed_count', 'revenue', 'stylist_cost', 'salon_profit', 'hours_worked',
+    'commission_count', 'commission_revenue', 'commission_amount', 'commission_salon_profit',
+    'booked_commission_count', 'booked_commission_revenue', 'booked_commission_amount', 'updated_at'
+]
+
+
+def _total(condition, column):
+    return func.coalesce(func.sum(case((condition, column), else_=0)), 0)
+
+
+def _tally(condition, column):
+    return func.count(case((condition, column)))
+
+
+class DailyRollupService:
+    """Maintain the (date, stylist) DailyStylistRollup table that HR reports read
+
+    Rows are recomputed from Appointment and AppointmentCost rather than
+    adjusted by deltas, so they cannot drift. Session hooks note which
+    (date, stylist) pairs a flush touched and refresh them just before the
+    transaction commits; bulk writes that bypass the ORM call mark_dirty.
+    """
+
+    @staticmethod
+    def aggregate_query(session):
+        """Grouped query computing rollup columns for every (date, stylist) with appointments"""
+        completed = Appointment.status == 'completed'
+        commission = and_(completed, AppointmentCost.calculation_method == 'commission')
+        booked_commission = AppointmentCost.commission_amount > 0
+
+        return session.query(
+            Appointment.appointment_date,
+            Appointment.stylist_id,
+            func.count(func.distinct(Appointment.id)),
+            func.count(func.distinct(case((completed, Appointment.id)))),
+            _total(Appointment.status.in_(ACTIVE_STATUSES), CalendarService.minutes_expression()),
+            _tally(completed, AppointmentCost.id),
+            _total(completed, AppointmentCost.service_revenue),
+            _total(completed, AppointmentCost.stylist_cost),
+            _total(completed, AppointmentCost.salon_profit),
+            _total(completed, func.coalesce(AppointmentCost.hours_worked, 0)),
+            _tally(commission, AppointmentCost.id),
+            _total(commission, AppointmentCost.service_revenue),
+            _total(commission, func.coalesce(AppointmentCost.commission_amount, 0)),
+            _total(commission, AppointmentCost.salon_profit),
+            _tally(booked_commission, AppointmentCost.id),
+            _total(booked_commission, AppointmentCost.service_revenue),
+            _total(booked_commission, AppointmentCost.commission_amount),
+            literal(uk_utcnow())
+        ).outerjoin(
+            AppointmentCost, AppointmentCost.appointment_id == Appointment.id
+        ).group_by(Appointment.appointment_date, Appointment.stylist_id)
+
+    @staticmethod
+    def _replace(session, date_filter, stylist_ids=None):
+        """Delete and recompute the rollup rows matching a date filter (and stylists)"""
+        table = DailyStylistRollup.__table__
+        delete = table.delete().where(date_filter(table.c.date))
+        query = DailyRollupService.aggregate_query(session).filter(date_filter(Appointment.appointment_date))
+        if stylist_ids is not None:
+            delete = delete.where(table.c.stylist_id.in_(stylist_ids))
+            query = query.filter(Appointment.stylist_id.in_(stylist_ids))
+
+        session.execute(delete)
+        return session.execute(table.insert().from_select(ROLLUP_COLUMNS, query.statement)).rowcount
+
+    @staticmethod
+    def _upsert(session, query):
+        """Write rollup rows from an aggregate query, overwriting any already stored for their (date, stylist)
+
+        Two transactions refreshing the same pair cannot both insert it: the
+        second waits for the first and then updates its row.
+        """
+        table = DailyStylistRollup.__table__
+        dialect = db.engine.dialect.name
+        if dialect not in ('postgresql', 'sqlite'):
+            session.execute(table.delete().where(
+                tuple_(table.c.date, table.c.stylist_id).in_(query.with_entities(
+                    Appointment.appointment_date, Appointment.stylist_id
+                ).statement)
+            ))
+            return session.execute(table.insert().from_select(ROLLUP_COLUMNS, query.statement)).rowcount
+
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        statement = insert(table).from_select(ROLLUP_COLUMNS, query.statement)
+        return session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.date, table.c.stylist_id],
+            set_={column: statement.excluded[column] for column in ROLLUP_COLUMNS[2:]}
+        )).rowcount
+
+    @staticmethod
+    def refresh(keys, session=None):
+        """Recompute the rollup rows for exactly the given (date, stylist_id) pairs, without committing
+
+        Pairs with no appointments left lose their row; the others are upserted.
+        """
+        session = session or db.session
+        keys = sorted(set(keys))
+        table = DailyStylistRollup.__table__
+        written = 0
+        for start in range(0, len(keys), REFRESH_CHUNK_SIZE):
+            chunk = keys[start:start + REFRESH_CHUNK_SIZE]
+            session.execute(table.delete().where(
+                tuple_(table.c.date, table.c.stylist_id).in_(chunk),
+                ~exists().where(Appointment.appointment_date == table.c.date,
+                                Appointment.stylist_id == table.c.stylist_id)
+            ))
+            written += DailyRollupService._upsert(session, DailyRollupService.aggregate_query(session).filter(
+                tuple_(Appointment.appointment_date, Appointment.stylist_id).in_(chunk)
+            ))
+        return written
+
+    @staticmethod
+    def rebuild(start_date=None, end_date=None):
+        """Recompute every rollup row in a date range (all dates by default), without committing"""
+        def date_filter(column):
+            conditions = []
+            if start_date:
+                conditions.append(column >= start_date)
+            if end_date:
+                conditions.append(column <= end_date)
+            return and_(true(), *conditions)
+
+        # Reports read the rollups, so drop their cached results with the rebuild
+        ReportCache.mark_changed(db.session, 'appointments', 'costs')
+        return DailyRollupService._replace(db.session, date_filter)
+
+    @staticmethod
+    def mark_dirty(session, keys=(), appointment_ids=()):
+        """Queue (date, stylist_id) pairs and/or appointments for refresh when `session` commits"""
+        session.info.setdefault('rollup_keys', set()).update(keys)
+        session.info.setdefault('rollup_appointment_ids', set()).update(appointment_ids)
+
+    @staticmethod
+    def collect_changes(session):
+        """Note the rollup rows affected by the appointments and costs in a flush"""
+        keys = set()
+        appointment_ids = set()
+        for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(instance, Appointment):
+                state = inspect(instance)
+                histories = {field: state.attrs[field].history for field in ROLLUP_APPOINTMENT_FIELDS}
+                if instance in session.dirty and not any(history.has_changes() for history in histories.values()):
+                    continue
+                keys.add((instance.appointment_date, instance.stylist_id))
+                # An appointment moved to another day or stylist also changes the rows it left
+                for old_date in histories['appointment_date'].deleted or [instance.appointment_date]:
+                    for old_stylist_id in histories['stylist_id'].deleted or [instance.stylist_id]:
+                        keys.add((old_date, old_stylist_id))
+            elif isinstance(instance, AppointmentCost):
+                appointment_ids.add(instance.appointment_id)
+
+        if keys or appointment_ids:
+            DailyRollupService.mark_dirty(session, keys, appointment_ids)
+
+    @staticmethod
+    def apply_changes(session):
+        """Bring the noted rollup rows up to date inside the committing transaction"""
+        keys = session.info.pop('rollup_keys', set())
+        appointment_ids = session.info.pop('rollup_appointment_ids', set())
+        if appointment_ids:
+            keys.update(tuple(row) for row in session.query(Appointment.appointment_date, Appointment.stylist_id).filter(
+                Appointment.id.in_(appointment_ids)
+            ).distinct())
+        DailyRollupService.refresh({key for key in keys if None not in key}, session)
+
+    @staticmethod
+    def discard_changes(session):
+        session.info.pop('rollup_keys', None)
+        session.info.pop('rollup_appointment_ids', None)
@@ -0,0 +1,172 @@
+from datetime import datetime
+import threading
+import time as timer
+from flask import current_app
+from app.models import SalonSettings, WorkPattern
+
+DAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+# Safety net so other worker processes pick up changes they were not told about
+DEFAULT_TTL_SECONDS = 300
+
+# Marker for a stylist without an active work pattern (available whenever the salon is open)
+NO_PATTERN = 'no_pattern'
+
+
+def _parse_minutes(value):
+    """Parse an 'HH:MM' string into minutes from midnight"""
+    parsed = datetime.strptime(value, '%H:%M')
+    return parsed.hour * 60 + parsed.minute
+
+
+class ScheduleCache:
+    """Process-level cache of compiled opening hours and stylist work patterns
+
+    Opening hours are compiled to a (open, close) minute pair per weekday and work
+    patterns to a (start, end) minute pair per weekday, so availability checks do
+    no JSON parsing or settings queries. The cache lives on the Flask app and is
+    invalidated by the salon settings and work pattern admin routes.
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.salon = None
+        self.salon_loaded_at = 0
+        self.stylists = {}
+
+    @staticmethod
+    def _instance():
+        """Get the cache for the current app, creating it on first use"""
+        cache = current_app.extensions.get('schedule_cache')
+        if cache is None:
+            ttl = current_app.config.get('SCHEDULE_CACHE_TTL', DEFAULT_TTL_SECONDS)
+            cache = current_app.extensions.setdefault('schedule_cache', ScheduleCache(ttl))
+        return cache
+
+    def _expired(self, loaded_at):
+        return timer.monotonic() - loaded_at > self.ttl_seconds
+
+    @staticmethod
+    def compile_opening_hours(opening_hours):
+        """Compile an opening_hours dict to a list of (open, close) minutes or None per weekday"""
+        compiled = []
+        for day_name in DAY_NAMES:
+            day_hours = (opening_hours or {}).get(day_name)
+            if not day_hours or day_hours.get('closed', False):
+                compiled.append(None)
+                continue
+            try:
+                compiled.append((_parse_minutes(day_hours['open']), _parse_minutes(day_hours['close'])))
+            except (ValueError, KeyError, TypeError):
+                compiled.append(None)
+        return compiled
+
+    @staticmethod
+    def compile_work_schedule(work_schedule):
+        """Compile a work_schedule dict to a list of (start, end) minutes or None per weekday"""
+        compiled = []
+        for day_name in DAY_NAMES:
+            day_schedule = (work_schedule or {}).get(day_name)
+            if not day_schedule or not day_schedule.get('working', False):
+                compiled.append(None)
+                continue
+            try:
+                compiled.append((_parse_minutes(day_schedule['start']), _parse_minutes(day_schedule['end'])))
+            except (ValueError, KeyError, TypeError):
+                compiled.append(None)
+        return compiled
+
+    @staticmethod
+    def _salon():
+        cache = ScheduleCache._instance()
+        salon = cache.salon
+        if salon is None or cache._expired(cache.salon_loaded_at):
+            settings = SalonSettings.get_settings()
+            salon = {
+                'hours': ScheduleCache.compile_opening_hours(settings.opening_hours),
+                'emergency_extension_enabled': bool(settings.emergency_extension_enabled)
+            }
+            with cache.lock:
+                cache.salon = salon
+                cache.salon_loaded_at = timer.monotonic()
+        return salon
+
+    @staticmethod
+    def get_opening_minutes(appointment_date):
+        """Get (open, close) minutes for a date, or None if the salon is closed"""
+        return ScheduleCache._salon()['hours'][appointment_date.weekday()]
+
+    @staticmethod
+    def get_weekly_opening_minutes():
+        """Get the (open, close) minutes or None for each weekday, Monday first"""
+        return ScheduleCache._salon()['hours']
+
+    @staticmethod
+    def is_emergency_extension_allowed():
+        """Check if emergency extensions are enabled"""
+        return ScheduleCache._salon()['emergency_extension_enabled']
+
+    @staticmethod
+    def preload_stylists(stylist_ids):
+        """Compile the active work patterns for several stylists in one query"""
+        cache = ScheduleCache._instance()
+        missing = [stylist_id for stylist_id in set(stylist_ids)
+                   if stylist_id not in cache.stylists or cache._expired(cache.stylists[stylist_id][1])]
+        if not missing:
+            return
+
+        patterns = WorkPattern.query.filter(
+            WorkPattern.user_id.in_(missing),
+            WorkPattern.is_active == True
+        ).order_by(WorkPattern.id).all()
+
+        compiled = {stylist_id: NO_PATTERN for stylist_id in missing}
+        for pattern in patterns:
+            # Keep the first active pattern, matching query.first() elsewhere
+            if compiled[pattern.user_id] == NO_PATTERN:
+                compiled[pattern.user_id] = ScheduleCache.compile_work_schedule(pattern.work_schedule)
+
+        loaded_at = timer.monotonic()
+        with cache.lock:
+            for stylist_id, schedule in compiled.items():
+                cache.stylists[stylist_id] = (schedule, loaded_at)
+
+    @staticmethod
+    def get_stylist_schedule(stylist_id):
+        """Get a stylist's compiled weekly schedule, or NO_PATTERN if they have none"""
+        cache = ScheduleCache._instance()
+        entry = cache.stylists.get(stylist_id)
+        if entry is None or cache._expired(entry[1]):
+            ScheduleCache.preload_stylists([stylist_id])
+            entry = cache.stylists[stylist_id]
+        return entry[0]
+
+    @staticmethod
+    def get_stylist_window(stylist_id, appointment_date):
+        """Get a stylist's working (start, end) minutes for a date
+
+        Returns NO_PATTERN if the stylist has no active work pattern and None
+        if they do not work that day.
+        """
+        schedule = ScheduleCache.get_stylist_schedule(stylist_id)
+        if schedule == NO_PATTERN:
+            return NO_PATTERN
+        return schedule[appointment_date.weekday()]
+
+    @staticmethod
+    def invalidate_salon_hours():
+        """Drop the compiled opening hours after salon settings change"""
+        cache = ScheduleCache._instance()
+        with cache.lock:
+            cache.salon = None
+
+    @staticmethod
+    def invalidate_work_patterns(user_id=None):
+        """Drop compiled work patterns for one stylist, or all stylists"""
+        cache = ScheduleCache._instance()
+        with cache.lock:
+            if user_id is None:
+                cache.stylists.clear()
+            else:
+                cache.stylists.pop(user_id, None)
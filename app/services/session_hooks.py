@@ -0,0 +1,42 @@
+from sqlalchemy import event
+from app.services.billing_ledger import BillingLedgerService
+from app.services.report_cache import ReportCache
+from app.services.rollup_service import DailyRollupService
+
+# Services that keep derived data in step with written models. Each notes what
+# a flush touched in collect_changes, brings its data up to date inside the
+# committing transaction in apply_changes and forgets it in discard_changes.
+# The report cache goes last, so results built from the rollups and ledger are
+# dropped after those are rewritten.
+CHANGE_HANDLERS = (DailyRollupService, BillingLedgerService, ReportCache)
+
+
+def _collect_changes(session, flush_context):
+    for handler in CHANGE_HANDLERS:
+        handler.collect_changes(session)
+
+
+def _apply_changes(session):
+    """Flush pending writes once, then let every handler apply what they changed"""
+    session.flush()
+    for handler in CHANGE_HANDLERS:
+        handler.apply_changes(session)
+
+
+def _apply_committed_changes(session):
+    ReportCache.apply_committed_changes(session)
+
+
+def _discard_changes(session):
+    for handler in CHANGE_HANDLERS:
+        handler.discard_changes(session)
+
+
+def register(session):
+    """Listen for flushes, commits and rollbacks on `session`, once however often it is called"""
+    if event.contains(session, 'after_flush', _collect_changes):
+        return
+    event.listen(session, 'after_flush', _collect_changes)
+    event.listen(session, 'before_commit', _apply_changes)
+    event.listen(session, 'after_commit', _apply_committed_changes)
+    event.listen(session, 'after_rollback', _discard_changes)
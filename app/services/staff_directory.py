@@ -0,0 +1,37 @@
+from flask import g, has_app_context
+from app.models import User
+
+
+class StaffDirectory:
+    """Resolve user IDs to display names in batches
+
+    Names are fetched with one IN query for all IDs that are not yet known and
+    remembered for the rest of the request, so report builders can name every
+    row without a query per row.
+    """
+
+    @staticmethod
+    def _known_names():
+        """Names already resolved during this request (or a throwaway dict outside one)"""
+        if not has_app_context():
+            return {}
+        if 'staff_names' not in g:
+            g.staff_names = {}
+        return g.staff_names
+
+    @staticmethod
+    def get_names(user_ids):
+        """Map each user ID to 'First Last', leaving out IDs with no user"""
+        known = StaffDirectory._known_names()
+        missing = {user_id for user_id in user_ids if user_id not in known}
+        if missing:
+            for user_id, first_name, last_name in User.query.with_entities(
+                User.id, User.first_name, User.last_name
+            ).filter(User.id.in_(missing)):
+                known[user_id] = f"{first_name} {last_name}"
+        return {user_id: known[user_id] for user_id in user_ids if user_id in known}
+
+    @staticmethod
+    def get_name(user_id, default='Unknown'):
+        """Display name for a single user"""
+        return StaffDirectory.get_names([user_id]).get(user_id, default)
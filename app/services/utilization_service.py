@@ -0,0 +1,112 @@
+from sqlalchemy import func
+from app.models import Appointment, AppointmentCost, Role, User
+from app.extensions import db
+from app.services.availability_service import ACTIVE_STATUSES
+from app.services.calendar_service import CalendarService
+from app.services.holiday_coverage import HolidayCoverageService
+from app.services.schedule_cache import ScheduleCache, NO_PATTERN
+
+
+class UtilizationService:
+    """Scheduled versus booked hours for the whole team
+
+    A stylist's scheduled minutes are their weekly minutes per weekday, weighted
+    by how often each weekday falls in the period, less the same for each
+    approved holiday. This is closed-form per range, so the cost does not grow
+    with the length of the period. Stylists without an active work pattern are
+    scheduled whenever the salon is open, as for booking availability.
+    """
+
+    @staticmethod
+    def weekday_counts(start_date, end_date):
+        """Count how many of each weekday (Monday first) fall between two dates inclusive"""
+        days = (end_date - start_date).days + 1
+        if days <= 0:
+            return [0] * 7
+        full_weeks, extra_days = divmod(days, 7)
+        counts = [full_weeks] * 7
+        for offset in range(extra_days):
+            counts[(start_date.weekday() + offset) % 7] += 1
+        return counts
+
+    @staticmethod
+    def weekly_minutes(schedule):
+        """Minutes worked on each weekday from a compiled (start, end)-or-None schedule"""
+        return [max(window[1] - window[0], 0) if window else 0 for window in schedule]
+
+    @staticmethod
+    def scheduled_minutes(weekly_minutes, start_date, end_date, holidays=()):
+        """Scheduled minutes over a period, less (start, end) holiday ranges within it"""
+        def minutes_between(first, last):
+            counts = UtilizationService.weekday_counts(first, last)
+            return sum(count * minutes for count, minutes in zip(counts, weekly_minutes))
+
+        total = minutes_between(start_date, end_date)
+        for holiday_start, holiday_end in holidays:
+            total -= minutes_between(max(holiday_start, start_date), min(holiday_end, end_date))
+        return total
+
+    @staticmethod
+    def calculate_team_utilization(start_date, end_date):
+        """Utilisation, booked hours and revenue per hour for every stylist
+
+        Runs a fixed number of queries: stylists, work patterns, approved
+        holidays and one grouped query for booked minutes and revenue of
+        confirmed and completed appointments.
+        """
+        opening_minutes = UtilizationService.weekly_minutes(ScheduleCache.get_weekly_opening_minutes())
+        stylists = User.query.join(User.roles).filter(Role.name == 'stylist').order_by(User.id).all()
+        stylist_ids = [stylist.id for stylist in stylists]
+        ScheduleCache.preload_stylists(stylist_ids)
+
+        holidays = {}
+        for user_id, holiday_start, holiday_end in HolidayCoverageService.merge_by_user(
+            HolidayCoverageService.load_ranges(start_date, end_date)
+        ):
+            holidays.setdefault(user_id, []).append((holiday_start, holiday_end))
+
+        bookings = {
+            row.stylist_id: row for row in db.session.query(
+                Appointment.stylist_id,
+                func.count(func.distinct(Appointment.id)).label('appointment_count'),
+                func.sum(CalendarService.minutes_expression()).label('booked_minutes'),
+                func.sum(AppointmentCost.service_revenue).label('revenue')
+            ).outerjoin(
+                AppointmentCost, AppointmentCost.appointment_id == Appointment.id
+            ).filter(
+                Appointment.stylist_id.in_(stylist_ids),
+                Appointment.appointment_date >= start_date,
+                Appointment.appointment_date <= end_date,
+                Appointment.status.in_(ACTIVE_STATUSES)
+            ).group_by(Appointment.stylist_id)
+        }
+
+        utilization = []
+        for stylist in stylists:
+            schedule = ScheduleCache.get_stylist_schedule(stylist.id)
+            weekly_minutes = (opening_minutes if schedule == NO_PATTERN
+                              else UtilizationService.weekly_minutes(schedule))
+            scheduled_hours = UtilizationService.scheduled_minutes(
+                weekly_minutes, start_date, end_date, holidays.get(stylist.id, ())
+            ) / 60.0
+
+            booking = bookings.get(stylist.id)
+            appointment_count = booking.appointment_count if booking else 0
+            actual_hours = float(booking.booked_minutes or 0) / 60.0 if booking else 0
+            total_revenue = float(booking.revenue or 0) if booking else 0
+
+            utilization.append({
+                'user_id': stylist.id,
+                'username': stylist.username,
+                'name': f"{stylist.first_name} {stylist.last_name}",
+                'scheduled_hours': scheduled_hours,
+                'holiday_days': sum((end - start).days + 1 for start, end in holidays.get(stylist.id, ())),
+                'actual_hours': actual_hours,
+                'utilization_rate': (actual_hours / scheduled_hours * 100) if scheduled_hours > 0 else 0,
+                'appointment_count': appointment_count,
+                'total_revenue': total_revenue,
+                'revenue_per_hour': (total_revenue / actual_hours) if actual_hours > 0 else 0,
+                'avg_appointment_duration': (actual_hours / appointment_count) if appointment_count else 0
+            })
+
+        return utilization
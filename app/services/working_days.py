@@ -0,0 +1,118 @@
+from datetime import date
+from app.models import BankHoliday
+from app.extensions import db
+from app.services.schedule_cache import ScheduleCache, NO_PATTERN
+
+# Weekdays counted for staff without a work pattern, Monday = 0
+DEFAULT_WORKING_WEEKDAYS = frozenset(range(5))
+
+# Region of the bank holidays subtracted from holiday requests
+BANK_HOLIDAY_REGION = 'england-and-wales'
+
+# England and Wales bank holidays, including substitute days
+UK_BANK_HOLIDAYS = [
+    (date(2024, 1, 1), "New Year's Day"),
+    (date(2024, 3, 29), 'Good Friday'),
+    (date(2024, 4, 1), 'Easter Monday'),
+    (date(2024, 5, 6), 'Early May bank holiday'),
+    (date(2024, 5, 27), 'Spring bank holiday'),
+    (date(2024, 8, 26), 'Summer bank holiday'),
+    (date(2024, 12, 25), 'Christmas Day'),
+    (date(2024, 12, 26), 'Boxing Day'),
+    (date(2025, 1, 1), "New Year's Day"),
+    (date(2025, 4, 18), 'Good Friday'),
+    (date(2025, 4, 21), 'Easter Monday'),
+    (date(2025, 5, 5), 'Early May bank holiday'),
+    (date(2025, 5, 26), 'Spring bank holiday'),
+    (date(2025, 8, 25), 'Summer bank holiday'),
+    (date(2025, 12, 25), 'Christmas Day'),
+    (date(2025, 12, 26), 'Boxing Day'),
+    (date(2026, 1, 1), "New Year's Day"),
+    (date(2026, 4, 3), 'Good Friday'),
+    (date(2026, 4, 6), 'Easter Monday'),
+    (date(2026, 5, 4), 'Early May bank holiday'),
+    (date(2026, 5, 25), 'Spring bank holiday'),
+    (date(2026, 8, 31), 'Summer bank holiday'),
+    (date(2026, 12, 25), 'Christmas Day'),
+    (date(2026, 12, 28), 'Boxing Day (substitute day)'),
+    (date(2027, 1, 1), "New Year's Day"),
+    (date(2027, 3, 26), 'Good Friday'),
+    (date(2027, 3, 29), 'Easter Monday'),
+    (date(2027, 5, 3), 'Early May bank holiday'),
+    (date(2027, 5, 31), 'Spring bank holiday'),
+    (date(2027, 8, 30), 'Summer bank holiday'),
+    (date(2027, 12, 27), 'Christmas Day (substitute day)'),
+    (date(2027, 12, 28), 'Boxing Day (substitute day)'),
+    (date(2028, 1, 3), "New Year's Day (substitute day)"),
+    (date(2028, 4, 14), 'Good Friday'),
+    (date(2028, 4, 17), 'Easter Monday'),
+    (date(2028, 5, 1), 'Early May bank holiday'),
+    (date(2028, 5, 29), 'Spring bank holiday'),
+    (date(2028, 8, 28), 'Summer bank holiday'),
+    (date(2028, 12, 25), 'Christmas Day'),
+    (date(2028, 12, 26), 'Boxing Day'),
+]
+
+
+class WorkingDayService:
+    """Days a member of staff works in a date range, less bank holidays
+
+    Days are counted from the compiled weekly work pattern as full weeks times
+    days worked per week plus the leftover days, so the cost does not grow with
+    the length of the range. Bank holidays come from the bank_holiday table.
+    """
+
+    @staticmethod
+    def count_weekdays(weekdays, start_date, end_date):
+        """Dates from start_date to end_date inclusive that fall on `weekdays` (Monday = 0)"""
+        if end_date < start_date:
+            return 0
+        full_weeks, leftover_days = divmod((end_date - start_date).days + 1, 7)
+        first_weekday = start_date.weekday()
+        return full_weeks * len(weekdays) + sum(
+            1 for offset in range(leftover_days) if (first_weekday + offset) % 7 in weekdays
+        )
+
+    @staticmethod
+    def working_weekdays(user_id):
+        """Weekdays (Monday = 0) worked in the user's active work pattern, Monday to Friday without one"""
+        schedule = ScheduleCache.get_stylist_schedule(user_id)
+        if schedule == NO_PATTERN:
+            return DEFAULT_WORKING_WEEKDAYS
+        return frozenset(weekday for weekday, window in enumerate(schedule) if window)
+
+    @staticmethod
+    def bank_holidays(start_date, end_date, region=BANK_HOLIDAY_REGION):
+        """Bank holiday dates from start_date to end_date inclusive"""
+        return [row.date for row in db.session.query(BankHoliday.date).filter(
+            BankHoliday.region == region,
+            BankHoliday.date >= start_date,
+            BankHoliday.date <= end_date
+        )]
+
+    @staticmethod
+    def count_working_days(user_id, start_date, end_date):
+        """Days the user would work from start_date to end_date inclusive, less bank holidays
+
+        Returns the number of working days and the bank holidays that fell on
+        days the user works, which are not counted.
+        """
+        weekdays = WorkingDayService.working_weekdays(user_id)
+        bank_holidays = [day for day in WorkingDayService.bank_holidays(start_date, end_date)
+                         if day.weekday() in weekdays]
+        return WorkingDayService.count_weekdays(weekdays, start_date, end_date) - len(bank_holidays), bank_holidays
+
+    @staticmethod
+    def seed_bank_holidays():
+        """Add the England and Wales bank holidays not stored yet, without committing
+
+        Returns how many were added.
+        """
+        stored = {row.date for row in db.session.query(BankHoliday.date).filter(
+            BankHoliday.region == BANK_HOLIDAY_REGION
+        )}
+        missing = [{'date': day, 'name': name, 'region': BANK_HOLIDAY_REGION}
+                   for day, name in UK_BANK_HOLIDAYS if day not in stored]
+        if missing:
+            db.session.execute(BankHoliday.__table__.insert(), missing)
+        return len(missing)
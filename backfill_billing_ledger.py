@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Backfill the billing element ledger from the breakdowns stored on appointment costs.
+Run once after upgrading to fill the new appointment_cost_element table, or
+whenever the ledger is suspected to be out of step with the costs. New and
+recalculated costs keep the ledger up to date by themselves.
+Usage: python backfill_billing_ledger.py [--batch-size N]
+"""
+
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.extensions import db
+from app.services.billing_ledger import BillingLedgerService, LEDGER_BATCH_SIZE
+
+def backfill_billing_ledger(batch_size=LEDGER_BATCH_SIZE):
+    """Rebuild the whole ledger in one transaction"""
+    app = create_app()
+
+    with app.app_context():
+        print("Backfilling the billing element ledger...")
+
+        def report_progress(done, total):
+            print(f"  {done}/{total} appointment costs")
+
+        try:
+            rows = BillingLedgerService.backfill(batch_size=batch_size, progress=report_progress)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Backfill failed, the ledger was not changed: {e}")
+            raise
+
+        print(f"✓ {rows} ledger rows written")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill the billing element ledger')
+    parser.add_argument('--batch-size', type=int, default=LEDGER_BATCH_SIZE,
+                        help='Appointment costs rewritten per round trip')
+    args = parser.parse_args()
+
+    backfill_billing_ledger(args.batch_size)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the analytics trend queries.
+Seeds an in-memory SQLite database with years of holiday requests and daily
+stylist rollups, then times the per-period trend queries grouped in SQL with
+date_bucket against loading the rows and grouping them in Python, checks both
+and the analytics reports give the same periods and totals, and reports the
+time of each along with the time of the whole reports.
+"""
+
+import sys
+import os
+import time as timer
+from collections import defaultdict
+from decimal import Decimal
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.extensions import db
+from app.models import User, Role, HolidayRequest, DailyStylistRollup
+from app.services.analytics_service import AnalyticsService
+from app.services.date_buckets import DATE_BUCKET_UNITS, bucket_label, date_bucket
+from sqlalchemy import case, func
+from datetime import date, timedelta
+
+STATUSES = ['approved', 'approved', 'rejected', 'pending']
+
+def bucket_start(value, unit):
+    """Python equivalent of date_bucket, for the baseline"""
+    if unit == 'week':
+        return value - timedelta(days=value.weekday())
+    if unit == 'month':
+        return value.replace(day=1)
+    if unit == 'quarter':
+        return value.replace(month=(value.month - 1) // 3 * 3 + 1, day=1)
+    return value
+
+def seed_data(start_date, days, stylist_count=60):
+    """Create a team of stylists with daily rollups and holiday requests over `days` days"""
+    stylist_role = Role.query.filter_by(name='stylist').first()
+    stylists = []
+    for index in range(stylist_count):
+        stylist = User(username=f'bench_stylist_{index}', email=f'bench_stylist_{index}@example.com',
+                       first_name='Bench', last_name=f'Stylist {index}')
+        stylist.roles.append(stylist_role)
+        stylists.append(stylist)
+    db.session.add_all(stylists)
+    db.session.flush()
+
+    rollups = []
+    holidays = []
+    for offset in range(days):
+        day = start_date + timedelta(days=offset)
+        for index, stylist in enumerate(stylists):
+            if (offset + index) % 7 == 6:
+                continue
+            count = 1 + (offset + index) % 6
+            rollups.append({
+                'date': day,
+                'stylist_id': stylist.id,
+                'appointment_count': count,
+                'booked_commission_count': count if index % 2 else 0,
+                'booked_commission_revenue': Decimal(count * 45) if index % 2 else 0,
+                'booked_commission_amount': Decimal(count * 27) if index % 2 else 0
+            })
+            if (offset * stylist_count + index) % 11 == 0:
+                length = 1 + index % 10
+                holidays.append({
+                    'user_id': stylist.id,
+                    'start_date': day,
+                    'end_date': day + timedelta(days=length - 1),
+                    'days_requested': length,
+                    'status': STATUSES[(offset + index) % len(STATUSES)]
+                })
+
+    db.session.bulk_insert_mappings(DailyStylistRollup, rollups)
+    db.session.bulk_insert_mappings(HolidayRequest, holidays)
+    db.session.commit()
+    return len(rollups), len(holidays)
+
+def sql_holiday_trends(start_date, end_date, unit):
+    """Holiday request counts per period, grouped in SQL"""
+    period = date_bucket(unit, HolidayRequest.start_date).label('period')
+    return [(bucket_label(row.period, unit), row.total, row.approved) for row in db.session.query(
+        period,
+        func.count(HolidayRequest.id).label('total'),
+        func.count(case((HolidayRequest.status == 'approved', 1))).label('approved')
+    ).filter(
+        HolidayRequest.start_date >= start_date,
+        HolidayRequest.start_date <= end_date
+    ).group_by(period).order_by(period)]
+
+def sql_commission_trends(start_date, end_date, unit):
+    """Commission totals per period, grouped in SQL"""
+    period = date_bucket(unit, DailyStylistRollup.date).label('period')
+    return [(bucket_label(row.period, unit), round(float(row.total_commission), 2)) for row in db.session.query(
+        period,
+        func.sum(DailyStylistRollup.booked_commission_amount).label('total_commission')
+    ).filter(
+        DailyStylistRollup.date >= start_date,
+        DailyStylistRollup.date <= end_date,
+        DailyStylistRollup.booked_commission_count > 0
+    ).group_by(period).order_by(period)]
+
+def python_holiday_trends(start_date, end_date, unit):
+    """Holiday request counts per period, grouped in Python"""
+    totals = defaultdict(lambda: [0, 0])
+    for start, status in db.session.query(HolidayRequest.start_date, HolidayRequest.status).filter(
+        HolidayRequest.start_date >= start_date,
+        HolidayRequest.start_date <= end_date
+    ):
+        period = totals[bucket_start(start, unit)]
+        period[0] += 1
+        period[1] += status == 'approved'
+    return [(bucket_label(period, unit), *totals[period]) for period in sorted(totals)]
+
+def python_commission_trends(start_date, end_date, unit):
+    """Commission totals per period, grouped in Python"""
+    totals = defaultdict(lambda: [0, 0])
+    for day, amount, count in db.session.query(
+        DailyStylistRollup.date,
+        DailyStylistRollup.booked_commission_amount,
+        DailyStylistRollup.booked_commission_count
+    ).filter(
+        DailyStylistRollup.date >= start_date,
+        DailyStylistRollup.date <= end_date,
+        DailyStylistRollup.booked_commission_count > 0
+    ):
+        period = totals[bucket_start(day, unit)]
+        period[0] += float(amount)
+        period[1] += count
+    return [(bucket_label(period, unit), round(totals[period][0], 2)) for period in sorted(totals)]
+
+def time_call(function, iterations):
+    started = timer.perf_counter()
+    for _ in range(iterations):
+        result = function()
+    return result, (timer.perf_counter() - started) * 1000 / iterations
+
+def run_benchmark(years=3, iterations=3):
+    """Run the trend queries both ways for every bucket and print timings"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        end_date = date.today()
+        start_date = end_date - timedelta(days=365 * years)
+        rollup_count, holiday_count = seed_data(start_date, (end_date - start_date).days + 1)
+        print(f"{rollup_count} daily rollups, {holiday_count} holiday requests over {years} years\n")
+
+        # Time the queries themselves rather than the report cache
+        holiday_trends = AnalyticsService.analyze_holiday_trends.uncached
+        commission_trends = AnalyticsService.analyze_commission_trends.uncached
+
+        all_match = True
+        for unit in DATE_BUCKET_UNITS:
+            sql_holidays, sql_holiday_ms = time_call(
+                lambda: sql_holiday_trends(start_date, end_date, unit), iterations)
+            python_holidays, python_holiday_ms = time_call(
+                lambda: python_holiday_trends(start_date, end_date, unit), iterations)
+            sql_commission, sql_commission_ms = time_call(
+                lambda: sql_commission_trends(start_date, end_date, unit), iterations)
+            python_commission, python_commission_ms = time_call(
+                lambda: python_commission_trends(start_date, end_date, unit), iterations)
+            holiday_report, holiday_report_ms = time_call(
+                lambda: holiday_trends(start_date, end_date, unit), iterations)
+            commission_report, commission_report_ms = time_call(
+                lambda: commission_trends(start_date, end_date, unit), iterations)
+
+            matches = (
+                sql_holidays == python_holidays == [
+                    (trend['month'], trend['total_requests'], trend['approved'])
+                    for trend in holiday_report['monthly_trends']
+                ] and
+                sql_commission == python_commission == [
+                    (trend['month'], round(trend['total_commission'], 2))
+                    for trend in commission_report['monthly_trends']
+                ]
+            )
+            all_match = all_match and matches
+
+            print(f"{unit} ({len(sql_holidays)} holiday periods, {len(sql_commission)} commission periods)")
+            print(f"{'holiday trend, SQL':>26}: {sql_holiday_ms:9.2f} ms   {'Python':>6}: {python_holiday_ms:9.2f} ms")
+            print(f"{'commission trend, SQL':>26}: {sql_commission_ms:9.2f} ms   {'Python':>6}: {python_commission_ms:9.2f} ms")
+            print(f"{'whole reports':>26}: {holiday_report_ms:9.2f} ms holidays, {commission_report_ms:.2f} ms commission")
+            print(f"{'same periods and totals':>26}: {'✅' if matches else '❌'}\n")
+
+        print(f"All buckets identical: {'✅' if all_match else '❌'}")
+        db.drop_all()
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the analytics trend queries on SQLite')
+    parser.add_argument('--years', type=int, default=3, help='Years of data to seed')
+    parser.add_argument('--iterations', type=int, default=3, help='Runs of each query to average')
+    args = parser.parse_args()
+
+    run_benchmark(args.years, args.iterations)
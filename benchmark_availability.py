@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Benchmark for available time slot generation.
+Compares the original per-slot conflict queries with the interval-based
+availability engine on a seeded in-memory database and reports query counts.
+"""
+
+import sys
+import os
+import time as timer
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.extensions import db
+from app.models import User, Role, Appointment, SalonSettings, WorkPattern
+from app.services.salon_hours_service import SalonHoursService
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import event
+
+class QueryCounter:
+    """Count SQL statements executed against an engine"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _callback(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self.engine, 'before_cursor_execute', self._callback)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._callback)
+
+def legacy_stylist_available(work_pattern, day_name, time_obj):
+    """Original work pattern check for a single start time"""
+    if not work_pattern.work_schedule or day_name not in work_pattern.work_schedule:
+        return False
+    day_schedule = work_pattern.work_schedule[day_name]
+    if not day_schedule.get('working', False):
+        return False
+    try:
+        start_time = datetime.strptime(day_schedule['start'], '%H:%M').time()
+        end_time = datetime.strptime(day_schedule['end'], '%H:%M').time()
+        return start_time <= time_obj < end_time
+    except (ValueError, KeyError):
+        return False
+
+def legacy_add_minutes(time_obj, minutes):
+    return (datetime.combine(date.today(), time_obj) + timedelta(minutes=minutes)).time()
+
+def legacy_has_conflict(appointment_date, start_time, stylist_id):
+    """Original conflict query for a 30 minute slot"""
+    end_time = legacy_add_minutes(start_time, 30)
+    return Appointment.query.filter(
+        Appointment.stylist_id == stylist_id,
+        Appointment.appointment_date == appointment_date,
+        Appointment.status.in_(['confirmed', 'completed']),
+        db.or_(
+            db.and_(Appointment.start_time <= start_time, Appointment.end_time > start_time),
+            db.and_(Appointment.start_time < end_time, Appointment.end_time >= end_time),
+            db.and_(Appointment.start_time >= start_time, Appointment.end_time <= end_time)
+        )
+    ).first() is not None
+
+def legacy_generate_slots(appointment_date, stylist_id, interval_minutes=5):
+    """Original implementation: one conflict query per candidate slot"""
+    hours = SalonHoursService.get_opening_hours_for_date(appointment_date)
+    if not hours:
+        return []
+
+    work_pattern = WorkPattern.query.filter_by(user_id=stylist_id, is_active=True).first()
+    day_name = SalonHoursService.get_day_name(appointment_date)
+
+    slots = []
+    current_time = hours['open']
+    while current_time < hours['close']:
+        if work_pattern and not legacy_stylist_available(work_pattern, day_name, current_time):
+            current_time = legacy_add_minutes(current_time, interval_minutes)
+            continue
+        if not legacy_has_conflict(appointment_date, current_time, stylist_id):
+            slots.append(current_time.strftime('%H:%M'))
+        current_time = legacy_add_minutes(current_time, interval_minutes)
+
+    return slots
+
+def seed_data(appointment_date):
+    """Create a stylist with a busy day of appointments"""
+    opening_hours = {
+        day: {'open': '09:00', 'close': '18:00', 'closed': False}
+        for day in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+    }
+    db.session.add(SalonSettings(salon_name='Benchmark Salon', opening_hours=opening_hours))
+
+    stylist_role = Role.query.filter_by(name='stylist').first()
+    customer_role = Role.query.filter_by(name='customer').first()
+    stylist = User(username='bench_stylist', email='bench_stylist@example.com',
+                   first_name='Bench', last_name='Stylist')
+    stylist.roles.append(stylist_role)
+    customer = User(username='bench_customer', email='bench_customer@example.com',
+                    first_name='Bench', last_name='Customer')
+    customer.roles.append(customer_role)
+    db.session.add_all([stylist, customer])
+    db.session.flush()
+
+    # A 45 minute appointment every 75 minutes through the day
+    start_minutes = 9 * 60 + 10
+    while start_minutes + 45 <= 18 * 60:
+        db.session.add(Appointment(
+            customer_id=customer.id,
+            stylist_id=stylist.id,
+            appointment_date=appointment_date,
+            start_time=time(start_minutes // 60, start_minutes % 60),
+            end_time=time((start_minutes + 45) // 60, (start_minutes + 45) % 60),
+            status='confirmed'
+        ))
+        start_minutes += 75
+
+    db.session.commit()
+    return stylist.id
+
+def run_benchmark(iterations=20):
+    """Run both implementations and print query counts and timings"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        appointment_date = date.today() + timedelta(days=1)
+        stylist_id = seed_data(appointment_date)
+
+        results = {}
+        for name, generate in [('per-slot queries', legacy_generate_slots),
+                               ('interval engine', SalonHoursService.generate_available_time_slots)]:
+            with QueryCounter(db.engine) as counter:
+                slots = generate(appointment_date, stylist_id)
+            queries = counter.count
+
+            started = timer.perf_counter()
+            for _ in range(iterations):
+                generate(appointment_date, stylist_id)
+            elapsed_ms = (timer.perf_counter() - started) * 1000 / iterations
+
+            results[name] = slots
+            print(f"{name:>18}: {queries:4d} queries, {elapsed_ms:8.2f} ms per call, {len(slots)} slots")
+
+        legacy, engine = results.values()
+        print(f"\nSlot lists identical: {'✅' if legacy == engine else '❌'}")
+
+        db.drop_all()
+
+if __name__ == '__main__':
+    run_benchmark()
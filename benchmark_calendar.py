@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the admin week calendar.
+Renders the week grid with the original nested template loops (every slot scans
+every appointment) and with the precomputed (date, stylist, slot) grid on a
+seeded in-memory database, checks both produce the same cells and reports the
+render time of each.
+"""
+
+import sys
+import os
+import time as timer
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.extensions import db
+from app.models import User, Role, Appointment
+from app.services.calendar_service import CalendarService
+from datetime import date, time, timedelta
+
+# The original week grid loops, reduced to the per-cell decisions they make
+LEGACY_GRID_TEMPLATE = """
+{%- for i in range(7) %}{% set current_date = start_date + timedelta(days=i) %}
+{%- for stylist in stylists %}[{{ appointments|selectattr("appointment_date", "equalto", current_date)|selectattr("stylist_id", "equalto", stylist.id)|list|length }}]{% endfor %}
+{%- for hour in range(9, 18) %}{% for minute in range(0, 60, 5) %}
+{%- for stylist in stylists %}
+{%- set slot_appointments = [] %}
+{%- for appointment in appointments %}
+{%- if appointment.appointment_date == current_date and appointment.stylist_id == stylist.id %}
+{%- set appointment_start = appointment.start_time.hour * 60 + appointment.start_time.minute %}
+{%- set appointment_end = appointment.end_time.hour * 60 + appointment.end_time.minute %}
+{%- set current_time = hour * 60 + minute %}
+{%- if current_time >= appointment_start and current_time < appointment_end %}{% set _ = slot_appointments.append(appointment) %}{% endif %}
+{%- endif %}
+{%- endfor %}
+{%- for appointment in slot_appointments %}{% if loop.first %}
+{%- set appointment_start = appointment.start_time.hour * 60 + appointment.start_time.minute %}
+{%- set rowspan = (appointment.end_time.hour * 60 + appointment.end_time.minute - appointment_start) // 5 %}
+{%- set current_time = hour * 60 + minute %}
+{%- if current_time >= appointment_start and current_time < appointment_start + 5 %}S{{ appointment.id }}:{{ rowspan }}{% else %}C{% endif %}
+{%- endif %}{% endfor %}
+{%- if slot_appointments|length == 0 %}E{% endif %};
+{%- endfor %}{% endfor %}{% endfor %}{% endfor %}
+"""
+
+# The same decisions made with lookups into the precomputed grid
+GRID_TEMPLATE = """
+{%- for i in range(7) %}{% set current_date = start_date + timedelta(days=i) %}
+{%- for stylist in stylists %}[{{ calendar_grid.day_counts.get((current_date, stylist.id), 0) }}]{% endfor %}
+{%- for slot, slot_label in calendar_grid.slots %}
+{%- for stylist in stylists %}
+{%- set cell = calendar_grid.cells.get((current_date, stylist.id, slot)) %}
+{%- if cell %}{% if cell.is_start %}S{{ cell.appointment.id }}:{{ cell.rowspan }}{% else %}C{% endif %}{% else %}E{% endif %};
+{%- endfor %}{% endfor %}{% endfor %}
+"""
+
+def seed_data(start_date, stylist_count=12, appointments_per_day=5):
+    """Create a team of stylists with a busy week of appointments"""
+    stylist_role = Role.query.filter_by(name='stylist').first()
+    customer_role = Role.query.filter_by(name='customer').first()
+    customer = User(username='bench_customer', email='bench_customer@example.com',
+                    first_name='Bench', last_name='Customer')
+    customer.roles.append(customer_role)
+    db.session.add(customer)
+
+    stylists = []
+    for index in range(stylist_count):
+        stylist = User(username=f'bench_stylist_{index}', email=f'bench_stylist_{index}@example.com',
+                       first_name='Bench', last_name=f'Stylist {index}')
+        stylist.roles.append(stylist_role)
+        stylists.append(stylist)
+    db.session.add_all(stylists)
+    db.session.flush()
+
+    for offset in range(7):
+        appointment_date = start_date + timedelta(days=offset)
+        for index, stylist in enumerate(stylists):
+            # Stagger start times so blocks begin on and off the 5 minute grid
+            start_minutes = 9 * 60 + (index * 7) % 30
+            for _ in range(appointments_per_day):
+                end_minutes = start_minutes + 45 + (index % 3) * 15
+                if end_minutes > 18 * 60:
+                    break
+                db.session.add(Appointment(
+                    customer_id=customer.id,
+                    stylist_id=stylist.id,
+                    appointment_date=appointment_date,
+                    start_time=time(start_minutes // 60, start_minutes % 60),
+                    end_time=time(end_minutes // 60, end_minutes % 60),
+                    status='confirmed'
+                ))
+                start_minutes = end_minutes + 30
+
+    db.session.commit()
+    return stylists
+
+def run_benchmark(iterations=3):
+    """Render the week grid both ways and print timings"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        today = date.today()
+        start_date = today - timedelta(days=today.weekday())
+        stylists = seed_data(start_date)
+        end_date = start_date + timedelta(days=6)
+        appointments = Appointment.query.filter(
+            Appointment.appointment_date >= start_date,
+            Appointment.appointment_date <= end_date
+        ).order_by(Appointment.appointment_date, Appointment.start_time).all()
+        print(f"{len(stylists)} stylists, {len(appointments)} appointments in the week\n")
+
+        legacy_template = app.jinja_env.from_string(LEGACY_GRID_TEMPLATE)
+        grid_template = app.jinja_env.from_string(GRID_TEMPLATE)
+
+        started = timer.perf_counter()
+        for _ in range(iterations):
+            legacy_output = legacy_template.render(appointments=appointments, stylists=stylists,
+                                                   start_date=start_date, timedelta=timedelta)
+        legacy_ms = (timer.perf_counter() - started) * 1000 / iterations
+
+        started = timer.perf_counter()
+        for _ in range(iterations):
+            calendar_grid = CalendarService.build_week_grid(appointments, start_date)
+            grid_output = grid_template.render(calendar_grid=calendar_grid, stylists=stylists,
+                                               start_date=start_date, timedelta=timedelta)
+        grid_ms = (timer.perf_counter() - started) * 1000 / iterations
+
+        print(f"{'nested loops':>18}: {legacy_ms:9.2f} ms per render")
+        print(f"{'precomputed grid':>18}: {grid_ms:9.2f} ms per render (including grid build)")
+        print(f"{'speed-up':>18}: {legacy_ms / grid_ms:9.1f}x")
+        print(f"\nGrid cells identical: {'✅' if legacy_output == grid_output else '❌'}")
+
+        db.drop_all()
+
+if __name__ == '__main__':
+    run_benchmark()
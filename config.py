@@ -38,6 +38,33 @@ class Config:
     WTF_CSRF_ENABLED = True
     WTF_CSRF_TIME_LIMIT = 3600  # 1 hour
     
+    # Seconds before compiled opening hours/work patterns are reloaded from the database
+    SCHEDULE_CACHE_TTL = int(os.environ.get('SCHEDULE_CACHE_TTL') or 300)
+    
+    # Live calendar updates: how long one event stream stays open and how often it polls
+    CALENDAR_STREAM_SECONDS = int(os.environ.get('CALENDAR_STREAM_SECONDS') or 55)
+    CALENDAR_STREAM_POLL_SECONDS = int(os.environ.get('CALENDAR_STREAM_POLL_SECONDS') or 5)
+    
+    # Background appointment cost queue: run a worker thread alongside the
+    # development server (run.py only), how often it drains the queue and how
+    # many appointments it costs at once
+    COST_WORKER_ENABLED = os.environ.get('COST_WORKER_ENABLED', 'false').lower() in ['true', 'on', '1']
+    COST_WORKER_INTERVAL = int(os.environ.get('COST_WORKER_INTERVAL') or 10)
+    COST_WORKER_BATCH_SIZE = int(os.environ.get('COST_WORKER_BATCH_SIZE') or 200)
+    
+    # Analytics and HR report results: 'memory' (per process), 'database' (shared
+    # by all workers) or 'none', how long a result lives and how many are kept
+    REPORT_CACHE_BACKEND = os.environ.get('REPORT_CACHE_BACKEND') or 'memory'
+    REPORT_CACHE_TTL = int(os.environ.get('REPORT_CACHE_TTL') or 300)
+    REPORT_CACHE_MAX_ENTRIES = int(os.environ.get('REPORT_CACHE_MAX_ENTRIES') or 256)
+    
+    # Most unused holiday days a year-end rollover carries into the next year
+    HOLIDAY_CARRY_OVER_MAX_DAYS = int(os.environ.get('HOLIDAY_CARRY_OVER_MAX_DAYS') or 5)
+    
+    # Fewest scheduled stylists who must still be working on a day for holidays covering it to be approved
+    # (0, the default, turns the check off so a lone stylist can still take holidays)
+    HOLIDAY_MIN_STAFF_COVERAGE = int(os.environ.get('HOLIDAY_MIN_STAFF_COVERAGE') or 0)
+    
     # Role hierarchy
     ROLES = {
         'guest': 0,
@@ -59,6 +86,8 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    CALENDAR_STREAM_SECONDS = 0
+    COST_WORKER_ENABLED = False
 
 config = {
     'development': DevelopmentConfig,
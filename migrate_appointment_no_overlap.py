@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the appointment no-overlap exclusion constraint.
+On PostgreSQL this makes the database reject overlapping confirmed/completed
+appointments for the same stylist, so double bookings cannot slip through
+concurrent requests. Other databases are left unchanged.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.extensions import db
+from app.models import APPOINTMENT_NO_OVERLAP_DDL
+from sqlalchemy import text
+
+def constraint_exists(constraint_name):
+    """Check if a constraint exists in the database"""
+    result = db.session.execute(
+        text('SELECT 1 FROM pg_constraint WHERE conname = :name'),
+        {'name': constraint_name}
+    ).first()
+    return result is not None
+
+def find_overlapping_appointments():
+    """List existing overlapping active appointments that would block the constraint"""
+    return db.session.execute(text("""
+        SELECT a.id, b.id, a.stylist_id, a.appointment_date, a.start_time, a.end_time, b.start_time, b.end_time
+        FROM appointment a
+        JOIN appointment b
+          ON a.stylist_id = b.stylist_id
+         AND a.appointment_date = b.appointment_date
+         AND a.id < b.id
+         AND a.start_time < b.end_time
+         AND a.end_time > b.start_time
+        WHERE a.status IN ('confirmed', 'completed')
+          AND b.status IN ('confirmed', 'completed')
+        ORDER BY a.appointment_date, a.stylist_id
+    """)).fetchall()
+
+def migrate_appointment_no_overlap():
+    """Add the appointment_no_overlap exclusion constraint on PostgreSQL"""
+    app = create_app()
+
+    with app.app_context():
+        print("Starting migration for appointment no-overlap constraint...")
+
+        if db.engine.dialect.name != 'postgresql':
+            print(f"Database is {db.engine.dialect.name}; exclusion constraints need PostgreSQL. Nothing to do.")
+            return
+
+        try:
+            if constraint_exists('appointment_no_overlap'):
+                print("appointment_no_overlap constraint already exists")
+                return
+
+            overlaps = find_overlapping_appointments()
+            if overlaps:
+                print(f"❌ Found {len(overlaps)} overlapping appointment pairs. Resolve these first:")
+                for row in overlaps:
+                    print(f"   Stylist {row[2]} on {row[3]}: appointment {row[0]} ({row[4]}-{row[5]}) "
+                          f"overlaps appointment {row[1]} ({row[6]}-{row[7]})")
+                return
+
+            print("Enabling btree_gist extension...")
+            db.session.execute(text('CREATE EXTENSION IF NOT EXISTS btree_gist'))
+            print("Adding appointment_no_overlap constraint...")
+            db.session.execute(text(APPOINTMENT_NO_OVERLAP_DDL))
+            db.session.commit()
+            print("✓ Migration completed successfully!")
+
+        except Exception as e:
+            print(f"❌ Migration failed: {e}")
+            db.session.rollback()
+            raise
+
+if __name__ == '__main__':
+    migrate_appointment_no_overlap()
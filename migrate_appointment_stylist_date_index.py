@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the (stylist_id, appointment_date) index on appointment.
+Holiday validation and approval look up every appointment a stylist has over
+the holiday's dates in one range query, which this index serves.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.extensions import db
+from app.models import Appointment
+from sqlalchemy import inspect
+
+def migrate_appointment_stylist_date_index():
+    """Create ix_appointment_stylist_date if it is missing"""
+    app = create_app()
+
+    with app.app_context():
+        print("Starting migration for the appointment stylist/date index...")
+
+        try:
+            index = next(index for index in Appointment.__table__.indexes
+                         if index.name == 'ix_appointment_stylist_date')
+            existing = {row['name'] for row in inspect(db.engine).get_indexes('appointment')}
+            if index.name in existing:
+                print(f"{index.name} already exists")
+                return
+
+            print(f"Creating index {index.name} on appointment...")
+            index.create(db.engine)
+            print("✓ Migration completed successfully!")
+
+        except Exception as e:
+            print(f"❌ Migration failed: {e}")
+            raise
+
+if __name__ == '__main__':
+    migrate_appointment_stylist_date_index()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the indexes used by live calendar updates.
+The calendar change feed looks up appointments by updated_at and status
+history by changed_at on every poll, so both columns are indexed.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.extensions import db
+from app.models import Appointment, AppointmentStatus
+from sqlalchemy import inspect
+
+def migrate_calendar_change_indexes():
+    """Create the updated_at and changed_at indexes if they are missing"""
+    app = create_app()
+
+    with app.app_context():
+        print("Starting migration for calendar change indexes...")
+
+        try:
+            inspector = inspect(db.engine)
+            for model in [Appointment, AppointmentStatus]:
+                table_name = model.__table__.name
+                existing = {index['name'] for index in inspector.get_indexes(table_name)}
+                for index in model.__table__.indexes:
+                    if index.name in existing:
+                        print(f"{index.name} already exists")
+                        continue
+                    print(f"Creating index {index.name} on {table_name}...")
+                    index.create(db.engine)
+
+            print("✓ Migration completed successfully!")
+
+        except Exception as e:
+            print(f"❌ Migration failed: {e}")
+            raise
+
+if __name__ == '__main__':
+    migrate_calendar_change_indexes()
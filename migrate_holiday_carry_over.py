@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the holiday_days_carried_over column to holiday_quota.
+Year-end rollovers can carry unused days into the next year's quota; existing
+quotas start with none carried over.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.extensions import db
+from sqlalchemy import inspect, text
+
+def migrate_holiday_carry_over():
+    """Add holiday_quota.holiday_days_carried_over if it is missing"""
+    app = create_app()
+
+    with app.app_context():
+        print("Starting migration for holiday carry-over...")
+
+        try:
+            columns = {column['name'] for column in inspect(db.engine).get_columns('holiday_quota')}
+            if 'holiday_days_carried_over' in columns:
+                print("holiday_days_carried_over column already exists")
+                return
+
+            print("Adding holiday_days_carried_over column...")
+            db.session.execute(text(
+                'ALTER TABLE holiday_quota ADD COLUMN holiday_days_carried_over INTEGER NOT NULL DEFAULT 0'
+            ))
+            db.session.commit()
+            print("✓ Migration completed successfully!")
+
+        except Exception as e:
+            print(f"❌ Migration failed: {e}")
+            db.session.rollback()
+            raise
+
+if __name__ == '__main__':
+    migrate_holiday_carry_over()
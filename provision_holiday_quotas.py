@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Create the holiday quotas that are missing for a year.
+Holiday pages no longer create quotas while they render, so run this at the
+start of each year and after adding stylists, or use the Create Missing Quotas
+button on the Holiday Quotas page. Existing quotas are left unchanged.
+Usage: python provision_holiday_quotas.py [--year YYYY]
+"""
+
+import sys
+import os
+import argparse
+from datetime import date
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.extensions import db
+from app.services.holiday_service import HolidayService
+
+def provision_holiday_quotas(year):
+    """Create every missing quota for the year in one transaction"""
+    app = create_app()
+
+    with app.app_context():
+        print(f"Creating missing holiday quotas for {year}...")
+
+        try:
+            result = HolidayService.provision_missing_quotas(year)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Provisioning failed, no quotas were created: {e}")
+            raise
+
+        print(f"✓ {result['created']} holiday quotas created")
+        if result['skipped']:
+            print(f"❌ No active work pattern or employment details for user IDs: "
+                  f"{', '.join(str(user_id) for user_id in result['skipped'])}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create the missing holiday quotas for a year')
+    parser.add_argument('--year', type=int, default=date.today().year, help='Holiday year to provision')
+    args = parser.parse_args()
+
+    provision_holiday_quotas(args.year)
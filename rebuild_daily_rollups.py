@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Rebuild the daily (date, stylist) rollups that HR and analytics reports read.
+Run once after upgrading to fill the new table, or whenever rollups are suspected
+to be out of step with appointments and their costs.
+Usage: python rebuild_daily_rollups.py [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+Without dates every day is rebuilt.
+"""
+
+import sys
+import os
+import argparse
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.extensions import db
+from app.services.rollup_service import DailyRollupService
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def rebuild_daily_rollups(start_date=None, end_date=None):
+    """Recompute the daily rollups for a date range in one transaction"""
+    app = create_app()
+
+    with app.app_context():
+        print(f"Rebuilding daily rollups from {start_date or 'the first appointment'} "
+              f"to {end_date or 'the last appointment'}...")
+
+        try:
+            rows = DailyRollupService.rebuild(start_date, end_date)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Rebuild failed, no rollups were changed: {e}")
+            raise
+
+        print(f"✓ {rows} daily rollup rows written")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild the daily stylist rollups')
+    parser.add_argument('--start', type=parse_date, help='First date to rebuild')
+    parser.add_argument('--end', type=parse_date, help='Last date to rebuild')
+    args = parser.parse_args()
+
+    rebuild_daily_rollups(args.start, args.end)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Recalculate appointment costs in bulk, e.g. after a rate or billing element change.
+Usage: python recalculate_appointment_costs.py [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+                                               [--stylist ID ...] [--batch-size N]
+Without dates the current month is recalculated.
+"""
+
+import sys
+import os
+import argparse
+from datetime import date, datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.services.hr_service import HRService
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def recalculate_appointment_costs(start_date, end_date, stylist_ids=None, batch_size=500):
+    """Recalculate AppointmentCost rows for a date range, printing progress"""
+    app = create_app()
+
+    with app.app_context():
+        print(f"Recalculating appointment costs from {start_date} to {end_date}...")
+        if stylist_ids:
+            print(f"  Stylists: {', '.join(str(stylist_id) for stylist_id in stylist_ids)}")
+
+        def report_progress(done, total):
+            print(f"  {done}/{total} appointments processed")
+
+        try:
+            result = HRService.recalculate_costs(
+                start_date=start_date,
+                end_date=end_date,
+                stylist_ids=stylist_ids,
+                batch_size=batch_size,
+                progress=report_progress
+            )
+        except Exception as e:
+            print(f"❌ Recalculation failed, no costs were changed: {e}")
+            raise
+
+        print(f"✓ {result['total']} appointments in {result['elapsed_seconds']:.2f}s: "
+              f"{result['created']} created, {result['updated']} updated, "
+              f"{result['skipped']} skipped (no employment details)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recalculate appointment costs in bulk')
+    parser.add_argument('--start', type=parse_date, default=date.today().replace(day=1),
+                        help='First appointment date (default: start of this month)')
+    parser.add_argument('--end', type=parse_date, default=date.today(),
+                        help='Last appointment date (default: today)')
+    parser.add_argument('--stylist', type=int, action='append', dest='stylist_ids',
+                        help='Only recalculate this stylist (repeatable)')
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help='Rows written per batch (default: 500)')
+    args = parser.parse_args()
+
+    recalculate_appointment_costs(args.start, args.end, args.stylist_ids, args.batch_size)
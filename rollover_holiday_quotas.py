@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Year-end rollover of holiday quotas.
+Creates the next year's quota for every active employee in one transaction,
+so nobody waits for quotas to be worked out in January. With --carry-over,
+days left on this year's quota move into the new one, up to
+HOLIDAY_CARRY_OVER_MAX_DAYS or --max-carry-over. Existing quotas are left
+unchanged, so the rollover can safely be run more than once.
+Usage: python rollover_holiday_quotas.py [--year YYYY] [--carry-over] [--max-carry-over N]
+"""
+
+import sys
+import os
+import argparse
+from datetime import date
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.extensions import db
+from app.services.holiday_service import HolidayService
+
+def rollover_holiday_quotas(year, carry_over=False, max_carry_over=None):
+    """Create the year's quotas for every active employee in one transaction"""
+    app = create_app()
+
+    with app.app_context():
+        print(f"Rolling holiday quotas over into {year}"
+              f"{' with carry-over' if carry_over else ''}...")
+
+        try:
+            result = HolidayService.rollover_quotas(year, carry_over=carry_over, max_carry_over=max_carry_over)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Rollover failed, no quotas were created: {e}")
+            raise
+
+        print(f"✓ {result['created']} holiday quotas created, {result['carried_over']} days carried over")
+        if result['skipped']:
+            print(f"❌ No active work pattern for user IDs: "
+                  f"{', '.join(str(user_id) for user_id in result['skipped'])}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create next year\'s holiday quotas for all active employees')
+    parser.add_argument('--year', type=int, default=date.today().year + 1, help='Holiday year to create')
+    parser.add_argument('--carry-over', action='store_true', help='Carry unused days over from the year before')
+    parser.add_argument('--max-carry-over', type=int, help='Most days carried over per employee')
+    args = parser.parse_args()
+
+    rollover_holiday_quotas(args.year, args.carry_over, args.max_carry_over)
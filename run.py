@@ -8,4 +8,8 @@ app.static_folder = static_folder
 app.static_url_path = '/static'
 
 if __name__ == '__main__':
+    # Recalculate queued appointment costs on a thread, but not in the reloader's parent process
+    if app.config['COST_WORKER_ENABLED'] and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from app.services.cost_queue import CostQueue
+        CostQueue.start_worker(app)
     app.run(debug=True, host='0.0.0.0', port=5010) 
\ No newline at end of file
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Run the appointment cost queue worker as its own process.
+Usage: python run_cost_worker.py [--once] [--interval SECONDS] [--batch-size N]
+Use this in production; COST_WORKER_ENABLED=true only starts a worker thread
+alongside the development server in run.py.
+"""
+
+import sys
+import os
+import argparse
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.services.cost_queue import CostQueue
+
+def run_cost_worker(once=False, interval=None, batch_size=None):
+    """Drain the cost queue once, or keep draining it until interrupted"""
+    app = create_app()
+
+    if once:
+        with app.app_context():
+            print(f"Processing {CostQueue.pending_count()} queued appointment costs...")
+            processed = CostQueue.process_pending(batch_size or app.config['COST_WORKER_BATCH_SIZE'])
+            print(f"✓ {processed} appointments processed, {CostQueue.pending_count()} still queued")
+        return
+
+    print("Cost worker started, press Ctrl+C to stop")
+    stop_event = threading.Event()
+    try:
+        CostQueue.run_worker(app, stop_event, interval, batch_size)
+    except KeyboardInterrupt:
+        stop_event.set()
+        print("✓ Cost worker stopped")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recalculate queued appointment costs')
+    parser.add_argument('--once', action='store_true',
+                        help='Drain the queue once and exit')
+    parser.add_argument('--interval', type=int,
+                        help='Seconds between queue checks (default: COST_WORKER_INTERVAL)')
+    parser.add_argument('--batch-size', type=int,
+                        help='Appointments costed per batch (default: COST_WORKER_BATCH_SIZE)')
+    args = parser.parse_args()
+
+    run_cost_worker(args.once, args.interval, args.batch_size)
@@ -0,0 +1,316 @@
+import pytest
+from datetime import date, datetime, time, timedelta
+from app import create_app
+from app.extensions import db
+from app.models import (
+    User, Role, Appointment, SalonSettings, WorkPattern, Service, StylistServiceTiming,
+    StylistServiceAssociation, UserProfile, HolidayRequest
+)
+from app.services.availability_service import AvailabilityService
+from app.services.salon_hours_service import SalonHoursService
+from app.services.schedule_cache import ScheduleCache
+
+OPENING_HOURS = {
+    day: {'open': '09:00', 'close': '18:00', 'closed': False}
+    for day in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+}
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    return app
+
+@pytest.fixture
+def init_database(app):
+    with app.app_context():
+        db.create_all()
+
+        for role_name in ['customer', 'stylist']:
+            if not Role.query.filter_by(name=role_name).first():
+                db.session.add(Role(name=role_name, description=f'Test {role_name} role'))
+        db.session.add(SalonSettings(salon_name='Test Salon', opening_hours=OPENING_HOURS))
+        db.session.commit()
+        yield db
+        db.drop_all()
+
+@pytest.fixture
+def booking_users(app, init_database):
+    """Create a stylist and a customer, returning their IDs."""
+    with app.app_context():
+        stylist = User(username='stylist', email='stylist@example.com',
+                       first_name='Test', last_name='Stylist')
+        stylist.roles.append(Role.query.filter_by(name='stylist').first())
+        customer = User(username='customer', email='customer@example.com',
+                        first_name='Test', last_name='Customer')
+        customer.roles.append(Role.query.filter_by(name='customer').first())
+        db.session.add_all([stylist, customer])
+        db.session.commit()
+        return stylist.id, customer.id
+
+def add_appointment(stylist_id, customer_id, day, start, end, status='confirmed'):
+    appointment = Appointment(
+        customer_id=customer_id,
+        stylist_id=stylist_id,
+        appointment_date=day,
+        start_time=start,
+        end_time=end,
+        status=status
+    )
+    db.session.add(appointment)
+    db.session.commit()
+    return appointment
+
+def legacy_stylist_available(work_pattern, day_name, time_obj):
+    """Original work pattern check for a single start time"""
+    if not work_pattern.work_schedule or day_name not in work_pattern.work_schedule:
+        return False
+    day_schedule = work_pattern.work_schedule[day_name]
+    if not day_schedule.get('working', False):
+        return False
+    try:
+        start_time = datetime.strptime(day_schedule['start'], '%H:%M').time()
+        end_time = datetime.strptime(day_schedule['end'], '%H:%M').time()
+        return start_time <= time_obj < end_time
+    except (ValueError, KeyError):
+        return False
+
+def legacy_add_minutes(time_obj, minutes):
+    return (datetime.combine(date.today(), time_obj) + timedelta(minutes=minutes)).time()
+
+def legacy_has_conflict(appointment_date, start_time, stylist_id):
+    """Original conflict query for a 30 minute slot"""
+    end_time = legacy_add_minutes(start_time, 30)
+    return Appointment.query.filter(
+        Appointment.stylist_id == stylist_id,
+        Appointment.appointment_date == appointment_date,
+        Appointment.status.in_(['confirmed', 'completed']),
+        db.or_(
+            db.and_(Appointment.start_time <= start_time, Appointment.end_time > start_time),
+            db.and_(Appointment.start_time < end_time, Appointment.end_time >= end_time),
+            db.and_(Appointment.start_time >= start_time, Appointment.end_time <= end_time)
+        )
+    ).first() is not None
+
+def legacy_slots(appointment_date, stylist_id, interval_minutes=5):
+    """The original per-slot implementation, one conflict query per slot."""
+    hours = SalonHoursService.get_opening_hours_for_date(appointment_date)
+    work_pattern = WorkPattern.query.filter_by(user_id=stylist_id, is_active=True).first()
+    day_name = SalonHoursService.get_day_name(appointment_date)
+    slots = []
+    current_time = hours['open']
+    while current_time < hours['close']:
+        if work_pattern and not legacy_stylist_available(work_pattern, day_name, current_time):
+            current_time = legacy_add_minutes(current_time, interval_minutes)
+            continue
+        if not legacy_has_conflict(appointment_date, current_time, stylist_id):
+            slots.append(current_time.strftime('%H:%M'))
+        current_time = legacy_add_minutes(current_time, interval_minutes)
+    return slots
+
+class TestIntervalHelpers:
+    """Test the in-memory interval operations."""
+
+    def test_merge_intervals(self):
+        merged = AvailabilityService.merge_intervals([(600, 630), (540, 570), (570, 600), (700, 690), (620, 660)])
+        assert merged == [(540, 660)]
+
+    def test_is_free(self):
+        busy = [(540, 600), (660, 720)]
+        assert AvailabilityService.is_free(busy, 600, 660)
+        assert not AvailabilityService.is_free(busy, 590, 610)
+        assert not AvailabilityService.is_free(busy, 650, 730)
+        assert AvailabilityService.is_free(busy, 720, 750)
+        assert AvailabilityService.is_free([], 0, 10)
+
+    def test_find_free_starts_with_window(self):
+        starts = AvailabilityService.find_free_starts(540, 600, [(560, 570)], interval_minutes=10,
+                                                      duration_minutes=10, window=(550, 590))
+        assert starts == [550, 570, 580]
+
+class TestSlotGeneration:
+    """Test slot generation against the original per-slot behaviour."""
+
+    def test_matches_legacy_slots(self, app, booking_users):
+        stylist_id, customer_id = booking_users
+        with app.app_context():
+            day = date.today() + timedelta(days=7)
+            add_appointment(stylist_id, customer_id, day, time(9, 30), time(10, 15))
+            add_appointment(stylist_id, customer_id, day, time(10, 15), time(11, 0))
+            add_appointment(stylist_id, customer_id, day, time(13, 5), time(13, 20))
+            add_appointment(stylist_id, customer_id, day, time(15, 0), time(16, 0), status='cancelled')
+            add_appointment(stylist_id, customer_id, day, time(17, 40), time(18, 0), status='completed')
+
+            slots = SalonHoursService.generate_available_time_slots(day, stylist_id)
+
+            assert slots == legacy_slots(day, stylist_id)
+            assert '09:00' in slots
+            assert '09:05' not in slots
+            assert '15:00' in slots
+
+    def test_matches_legacy_slots_with_work_pattern(self, app, booking_users):
+        stylist_id, customer_id = booking_users
+        with app.app_context():
+            day = date.today() + timedelta(days=7)
+            schedule = {name: {'working': True, 'start': '10:00', 'end': '14:00'} for name in OPENING_HOURS}
+            db.session.add(WorkPattern(user_id=stylist_id, pattern_name='Short days',
+                                       work_schedule=schedule, is_active=True))
+            db.session.commit()
+            add_appointment(stylist_id, customer_id, day, time(11, 0), time(12, 0))
+
+            slots = SalonHoursService.generate_available_time_slots(day, stylist_id)
+
+            assert slots == legacy_slots(day, stylist_id)
+            assert slots[0] == '10:00'
+            assert slots[-1] == '13:55'
+
+class TestDurationAwareSlots:
+    """Test slot generation for the real length of the chosen services."""
+
+    def test_required_duration_uses_stylist_timings(self, app, booking_users):
+        stylist_id, customer_id = booking_users
+        with app.app_context():
+            cut = Service(name='Cut', duration=45, waiting_time=None, price=30)
+            colour = Service(name='Colour', duration=60, waiting_time=30, price=80)
+            db.session.add_all([cut, colour])
+            db.session.flush()
+            db.session.add(StylistServiceTiming(stylist_id=stylist_id, service_id=colour.id,
+                                                custom_duration=50, custom_waiting_time=20))
+            db.session.commit()
+
+            assert AvailabilityService.calculate_required_duration([cut.id, colour.id]) == 135
+            assert AvailabilityService.calculate_required_duration([cut.id, colour.id], stylist_id) == 115
+            assert AvailabilityService.calculate_required_duration([cut.id, cut.id], stylist_id) == 90
+            assert AvailabilityService.calculate_required_duration([999]) is None
+
+    def test_whole_block_must_fit(self, app, booking_users):
+        stylist_id, customer_id = booking_users
+        with app.app_context():
+            day = date.today() + timedelta(days=7)
+            add_appointment(stylist_id, customer_id, day, time(12, 0), time(13, 0))
+
+            slots = SalonHoursService.generate_available_time_slots(day, stylist_id, duration_minutes=90)
+
+            assert '10:30' in slots
+            assert '10:35' not in slots
+            assert '13:00' in slots
+            assert slots[-1] == '16:30'
+
+class TestScheduleCache:
+    """Test the compiled opening hours and work pattern cache."""
+
+    def test_opening_hours_cached_until_invalidated(self, app, init_database):
+        with app.app_context():
+            day = date.today() + timedelta(days=7)
+            assert SalonHoursService.get_opening_hours_for_date(day)['open'] == time(9, 0)
+
+            settings = SalonSettings.query.first()
+            settings.opening_hours = dict(OPENING_HOURS, **{
+                SalonHoursService.get_day_name(day): {'open': '10:00', 'close': '16:00', 'closed': False}
+            })
+            db.session.commit()
+            assert SalonHoursService.get_opening_hours_for_date(day)['open'] == time(9, 0)
+
+            ScheduleCache.invalidate_salon_hours()
+            assert SalonHoursService.get_opening_hours_for_date(day)['open'] == time(10, 0)
+
+    def test_validate_appointment_time_uses_work_pattern(self, app, booking_users):
+        stylist_id, customer_id = booking_users
+        with app.app_context():
+            day = date.today() + timedelta(days=7)
+            schedule = {name: {'working': True, 'start': '12:00', 'end': '17:00'} for name in OPENING_HOURS}
+            db.session.add(WorkPattern(user_id=stylist_id, pattern_name='Afternoons',
+                                       work_schedule=schedule, is_active=True))
+            db.session.commit()
+
+            assert SalonHoursService.validate_appointment_time(day, time(13, 0), time(14, 0), stylist_id)['valid']
+            result = SalonHoursService.validate_appointment_time(day, time(10, 0), time(11, 0), stylist_id)
+            assert not result['valid']
+            assert result['reason'] == 'Stylist is not available at this time'
+
+class TestEarliestAvailability:
+    """Test the team-wide earliest availability search."""
+
+    def add_stylist(self, username, first_name):
+        stylist = User(username=username, email=f'{username}@example.com',
+                       first_name=first_name, last_name='Stylist')
+        stylist.roles.append(Role.query.filter_by(name='stylist').first())
+        db.session.add(stylist)
+        db.session.commit()
+        return stylist.id
+
+    def test_ranks_options_and_honours_restrictions(self, app, booking_users):
+        stylist_id, customer_id = booking_users
+        with app.app_context():
+            day = date.today() + timedelta(days=7)
+            busy_id = self.add_stylist('busy', 'Busy')
+            blocked_id = self.add_stylist('blocked', 'Blocked')
+            away_id = self.add_stylist('away', 'Away')
+
+            service = Service(name='Colour and cut', duration=60, price=90)
+            db.session.add(service)
+            db.session.flush()
+            db.session.add(StylistServiceAssociation(stylist_id=blocked_id, service_id=service.id, is_allowed=False))
+            db.session.add(HolidayRequest(user_id=away_id, start_date=day, end_date=day,
+                                          days_requested=1, status='approved'))
+            db.session.add(UserProfile(user_id=customer_id, preferred_stylist_id=busy_id))
+            db.session.commit()
+            add_appointment(busy_id, customer_id, day, time(9, 0), time(9, 30))
+
+            options = AvailabilityService.find_earliest_availability(
+                [service.id], day, days=1, limit=10, customer_id=customer_id
+            )
+
+            assert [(option['stylist_id'], option['start_time']) for option in options] == [
+                (stylist_id, time(9, 0)),
+                (busy_id, time(9, 30)),
+            ]
+
+            # On a tie the preferred stylist comes first
+            add_appointment(stylist_id, customer_id, day, time(9, 0), time(9, 30))
+            options = AvailabilityService.find_earliest_availability(
+                [service.id], day, days=1, limit=10, customer_id=customer_id
+            )
+            assert [option['stylist_id'] for option in options] == [busy_id, stylist_id]
+            assert options[0]['preferred']
+
+class TestBookingConflicts:
+    """Test the conflict check used while a stylist-day is locked."""
+
+    def test_has_conflicting_appointment(self, app, booking_users):
+        stylist_id, customer_id = booking_users
+        with app.app_context():
+            day = date.today() + timedelta(days=7)
+            existing = add_appointment(stylist_id, customer_id, day, time(10, 0), time(11, 0))
+            add_appointment(stylist_id, customer_id, day, time(14, 0), time(15, 0), status='cancelled')
+
+            AvailabilityService.lock_stylist_day(stylist_id, day)
+
+            assert AvailabilityService.has_conflicting_appointment(stylist_id, day, time(10, 30), time(11, 30))
+            assert not AvailabilityService.has_conflicting_appointment(stylist_id, day, time(11, 0), time(12, 0))
+            assert not AvailabilityService.has_conflicting_appointment(stylist_id, day, time(14, 0), time(15, 0))
+            assert not AvailabilityService.has_conflicting_appointment(
+                stylist_id, day, time(10, 0), time(11, 0), exclude_id=existing.id
+            )
+
+    def test_reactivating_clashing_appointment_is_refused(self, app, booking_users):
+        stylist_id, customer_id = booking_users
+        with app.app_context():
+            stylist = db.session.get(User, stylist_id)
+            stylist.set_password('stylistpass123')
+            day = date.today() + timedelta(days=7)
+            add_appointment(stylist_id, customer_id, day, time(10, 0), time(11, 0))
+            cancelled = add_appointment(stylist_id, customer_id, day, time(10, 30), time(11, 30), status='cancelled')
+            free = add_appointment(stylist_id, customer_id, day, time(14, 0), time(15, 0), status='cancelled')
+            cancelled_id, free_id = cancelled.id, free.id
+
+        client = app.test_client()
+        client.post('/auth/login', data={'username': 'stylist', 'password': 'stylistpass123'})
+
+        response = client.post(f'/appointments/appointment/{cancelled_id}/edit',
+                               data={'status': 'confirmed', 'notes': ''}, follow_redirects=True)
+        assert b'conflicts with an existing appointment' in response.data
+        client.post(f'/appointments/appointment/{free_id}/edit', data={'status': 'confirmed', 'notes': ''})
+
+        with app.app_context():
+            assert db.session.get(Appointment, cancelled_id).status == 'cancelled'
+            assert db.session.get(Appointment, free_id).status == 'confirmed'
@@ -0,0 +1,288 @@
+import pytest
+from datetime import date, time, timedelta
+from types import SimpleNamespace
+from app import create_app
+from app.extensions import db
+from app.models import User, Role, Appointment, AppointmentStatus, Service
+from app.services.calendar_service import CalendarService
+from sqlalchemy import event
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def init_database(app):
+    with app.app_context():
+        db.create_all()
+
+        for role_name in ['customer', 'stylist', 'manager']:
+            if not Role.query.filter_by(name=role_name).first():
+                db.session.add(Role(name=role_name, description=f'Test {role_name} role'))
+        db.session.commit()
+        yield db
+        db.drop_all()
+
+@pytest.fixture
+def calendar_users(app, init_database):
+    """Create a manager, a stylist and a customer, returning the stylist and customer IDs."""
+    with app.app_context():
+        users = []
+        for username in ['manager', 'stylist', 'customer']:
+            user = User(username=username, email=f'{username}@example.com',
+                        first_name=username.title(), last_name='User',
+                        is_active=True, email_verified=True)
+            user.set_password('password123')
+            user.roles.append(Role.query.filter_by(name=username).first())
+            users.append(user)
+        db.session.add_all(users)
+        db.session.commit()
+        return users[1].id, users[2].id
+
+def count_queries(app, client, url):
+    """Count the SQL statements executed while requesting a URL."""
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+    assert response.status_code == 200
+    return len(statements)
+
+def add_appointments(stylist_id, customer_id, day, count, first_index=0):
+    """Book `count` back-to-back 30 minute appointments, each for a new service."""
+    for index in range(first_index, first_index + count):
+        service = Service(name=f'Service {day} {index}', duration=30, price=20)
+        db.session.add(service)
+        db.session.flush()
+        start = 9 * 60 + index * 30
+        db.session.add(Appointment(customer_id=customer_id, stylist_id=stylist_id,
+                                   service_id=service.id, appointment_date=day,
+                                   start_time=time(start // 60, start % 60),
+                                   end_time=time((start + 30) // 60, (start + 30) % 60),
+                                   status='confirmed'))
+    db.session.commit()
+
+def make_appointment(appointment_id, stylist_id, day, start, end):
+    return SimpleNamespace(id=appointment_id, stylist_id=stylist_id, appointment_date=day,
+                           start_time=start, end_time=end)
+
+class TestCalendarGrid:
+    """Test the precomputed (date, stylist, slot) calendar grid."""
+
+    def test_cells_cover_each_appointment_once(self):
+        monday = date(2024, 1, 1)
+        appointments = [
+            make_appointment(1, 7, monday, time(8, 50), time(9, 10)),
+            make_appointment(2, 7, monday, time(9, 32), time(10, 2)),
+            make_appointment(3, 7, monday, time(9, 45), time(10, 30)),
+            make_appointment(4, 8, monday + timedelta(days=2), time(17, 30), time(18, 30)),
+            make_appointment(5, 8, monday + timedelta(days=7), time(10, 0), time(11, 0)),
+        ]
+
+        grid = CalendarService.build_week_grid(appointments, monday)
+        cells = grid['cells']
+
+        # Started before opening: covers the first slots but is never drawn
+        assert cells[(monday, 7, 540)]['appointment'].id == 1
+        assert not cells[(monday, 7, 540)]['is_start']
+        assert (monday, 7, 550) not in cells
+
+        # Off-grid start is drawn in the first slot after it
+        assert (monday, 7, 570) not in cells
+        assert cells[(monday, 7, 575)]['is_start']
+        assert cells[(monday, 7, 575)]['rowspan'] == 6
+
+        # Overlapping slots stay with the earliest appointment, later ones are never drawn
+        assert cells[(monday, 7, 595)]['appointment'].id == 2
+        assert cells[(monday, 7, 600)]['appointment'].id == 2
+        assert cells[(monday, 7, 605)]['appointment'].id == 3
+        assert not cells[(monday, 7, 605)]['is_start']
+
+        # Blocks are clipped to the grid and the next week is ignored
+        assert (monday + timedelta(days=2), 8, 1075) in cells
+        assert (monday + timedelta(days=2), 8, 1080) not in cells
+        assert not any(key[0] == monday + timedelta(days=7) for key in cells)
+
+        assert grid['day_counts'][(monday, 7)] == 3
+        assert [appointment.id for appointment in grid['by_date'][monday]] == [1, 2, 3]
+        assert grid['slots'][0] == (540, '09:00')
+        assert grid['slots'][-1] == (1075, '17:55')
+        assert len(grid['slots']) == 108
+
+class TestAdminCalendarPage:
+    """Test the admin calendar renders from the grid."""
+
+    def test_week_and_month_views(self, app, client, calendar_users):
+        stylist_id, customer_id = calendar_users
+        with app.app_context():
+            day = date.today()
+            service = Service(name='Cut', duration=30, price=20)
+            db.session.add(service)
+            db.session.flush()
+            appointment = Appointment(customer_id=customer_id, stylist_id=stylist_id,
+                                      service_id=service.id, appointment_date=day,
+                                      start_time=time(10, 0), end_time=time(10, 30),
+                                      status='confirmed')
+            db.session.add(appointment)
+            db.session.commit()
+            appointment_id = appointment.id
+
+        client.post('/auth/login', data={'username': 'manager', 'password': 'password123'})
+
+        response = client.get(f'/appointments/admin-appointments?view_type=week&date={day.isoformat()}')
+        assert response.status_code == 200
+        assert f'data-appointment-id="{appointment_id}"'.encode() in response.data
+        assert b'calc(6 * 20px)' in response.data
+
+        response = client.get(f'/appointments/admin-appointments?view_type=month&date={day.isoformat()}')
+        assert response.status_code == 200
+        assert b'Customer' in response.data
+
+class TestAppointmentQueryProfiles:
+    """Test appointment views run a fixed number of queries however many rows they show."""
+
+    def test_query_count_does_not_grow(self, app, client, calendar_users):
+        stylist_id, customer_id = calendar_users
+        day = date.today() + timedelta(days=1)
+        urls = [
+            f'/appointments/admin-appointments?view_type=week&date={day.isoformat()}',
+            f'/appointments/api/appointments?start={day.isoformat()}&end={day.isoformat()}',
+        ]
+        client.post('/auth/login', data={'username': 'manager', 'password': 'password123'})
+
+        with app.app_context():
+            add_appointments(stylist_id, customer_id, day, 2)
+        few = [count_queries(app, client, url) for url in urls]
+
+        with app.app_context():
+            add_appointments(stylist_id, customer_id, day, 6, first_index=2)
+        many = [count_queries(app, client, url) for url in urls]
+
+        assert few == many
+
+    def test_customer_dashboard_query_count_does_not_grow(self, app, client, calendar_users):
+        stylist_id, customer_id = calendar_users
+        day = date.today() + timedelta(days=1)
+        client.post('/auth/login', data={'username': 'customer', 'password': 'password123'})
+
+        with app.app_context():
+            add_appointments(stylist_id, customer_id, day, 1)
+        few = count_queries(app, client, '/dashboard')
+
+        with app.app_context():
+            add_appointments(stylist_id, customer_id, day, 4, first_index=1)
+        many = count_queries(app, client, '/dashboard')
+
+        assert few == many
+
+class TestCalendarChanges:
+    """Test the incremental calendar change feed."""
+
+    def test_changes_since_token(self, app, client, calendar_users):
+        stylist_id, customer_id = calendar_users
+        day = date.today() + timedelta(days=1)
+        window = f'start={day.isoformat()}&end={day.isoformat()}'
+        client.post('/auth/login', data={'username': 'manager', 'password': 'password123'})
+
+        with app.app_context():
+            add_appointments(stylist_id, customer_id, day, 2)
+            appointments = Appointment.query.order_by(Appointment.id).all()
+            unchanged_id, changed_id = appointments[0].id, appointments[1].id
+            for appointment in appointments:
+                appointment.updated_at = appointment.updated_at - timedelta(hours=1)
+            db.session.commit()
+
+        response = client.get(f'/appointments/api/appointments/changes?{window}')
+        token = response.get_json()['token']
+        assert response.get_json()['events'] == []
+
+        with app.app_context():
+            # A status history entry counts as a change even without a row update
+            db.session.add(AppointmentStatus(appointment_id=changed_id, status='cancelled',
+                                             changed_by_id=customer_id))
+            add_appointments(stylist_id, customer_id, day, 1, first_index=4)
+            add_appointments(stylist_id, customer_id, day + timedelta(days=1), 1)
+            new_id = Appointment.query.filter_by(appointment_date=day).order_by(Appointment.id.desc()).first().id
+
+        response = client.get(f'/appointments/api/appointments/changes?{window}&since={token}')
+        data = response.get_json()
+        assert sorted(event['id'] for event in data['events']) == sorted([changed_id, new_id])
+        assert unchanged_id not in [event['id'] for event in data['events']]
+        assert data['token'] >= token
+
+        response = client.get(f'/appointments/api/appointments/changes?{window}&since=yesterday')
+        assert response.status_code == 400
+
+    def test_event_stream(self, app, client, calendar_users):
+        stylist_id, customer_id = calendar_users
+        day = date.today() + timedelta(days=1)
+        client.post('/auth/login', data={'username': 'manager', 'password': 'password123'})
+
+        with app.app_context():
+            add_appointments(stylist_id, customer_id, day, 1)
+            appointment_id = Appointment.query.first().id
+
+        response = client.get(f'/appointments/api/appointments/stream?start={day.isoformat()}'
+                              f'&end={day.isoformat()}&since=20000101T000000000000')
+        body = response.get_data(as_text=True)
+        assert response.mimetype == 'text/event-stream'
+        assert 'event: changes' in body
+        assert f'"id": {appointment_id}' in body
+
+class TestMonthSummary:
+    """Test the grouped month view summary."""
+
+    def test_period_summary(self, app, calendar_users):
+        stylist_id, customer_id = calendar_users
+        with app.app_context():
+            day = date(2024, 3, 5)
+            add_appointments(stylist_id, customer_id, day, 3)
+            add_appointments(stylist_id, customer_id, day + timedelta(days=1), 1)
+            Appointment.query.filter_by(appointment_date=day).order_by(Appointment.id).first().status = 'cancelled'
+            db.session.commit()
+
+            summary = CalendarService.get_period_summary(date(2024, 3, 1), date(2024, 3, 31), by_stylist=True)
+
+            assert summary['days'][day]['count'] == 3
+            assert summary['days'][day]['statuses'] == {'cancelled': 1, 'confirmed': 2}
+            assert summary['days'][day]['minutes'] == 60
+            assert summary['days'][day]['stylists'] == [{'name': 'Stylist User', 'count': 3}]
+            assert summary['statuses'] == {'cancelled': 1, 'confirmed': 3}
+
+            summary = CalendarService.get_period_summary(date(2024, 3, 1), date(2024, 3, 31),
+                                                         stylist_id=customer_id)
+            assert summary['days'] == {}
+
+    def test_month_views_load_only_the_expanded_day(self, app, client, calendar_users):
+        stylist_id, customer_id = calendar_users
+        day = date.today().replace(day=1)
+        urls = [
+            f'/appointments/admin-appointments?view_type=month&date={day.isoformat()}',
+            f'/appointments/stylist-appointments?view_type=month&calendar_view=global&date={day.isoformat()}',
+        ]
+        client.post('/auth/login', data={'username': 'manager', 'password': 'password123'})
+        with app.app_context():
+            manager = User.query.filter_by(username='manager').first()
+            manager.roles.append(Role.query.filter_by(name='stylist').first())
+            db.session.commit()
+            add_appointments(stylist_id, customer_id, day, 2)
+            add_appointments(stylist_id, customer_id, day + timedelta(days=1), 3)
+            other_day_ids = [appointment.id for appointment in
+                             Appointment.query.filter_by(appointment_date=day + timedelta(days=1))]
+
+        for url in urls:
+            response = client.get(url)
+            assert response.status_code == 200
+            assert b'<span class="fw-bold">3</span> appointments' in response.data
+            for appointment_id in other_day_ids:
+                assert f'/appointments/appointment/{appointment_id}"'.encode() not in response.data
@@ -0,0 +1,424 @@
+import pytest
+from datetime import date, time, timedelta
+from app import create_app
+from app.extensions import db
+from app.models import (User, Role, HolidayRequest, HolidayQuota, WorkPattern, EmploymentDetails, Service,
+                        Appointment, AppointmentService, StylistServiceAssociation, CostRecalculationJob)
+from sqlalchemy import Date, event, literal, select, update
+from sqlalchemy.dialects import postgresql
+from app.services.analytics_service import AnalyticsService
+from app.services.date_buckets import DATE_BUCKET_UNITS, bucket_label, date_bucket
+from app.services.holiday_coverage import HolidayCoverageService
+from app.services.holiday_reassignment import HolidayReassignmentService
+from app.services.holiday_service import HolidayService
+from app.services.working_days import WorkingDayService
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    return app
+
+@pytest.fixture
+def init_database(app):
+    with app.app_context():
+        db.create_all()
+
+        for role_name in ['stylist', 'manager']:
+            if not Role.query.filter_by(name=role_name).first():
+                db.session.add(Role(name=role_name, description=f'Test {role_name} role'))
+        db.session.commit()
+        yield db
+        db.drop_all()
+
+@pytest.fixture
+def staff(app, init_database):
+    """Create four stylists and a manager, returning their IDs by username."""
+    with app.app_context():
+        users = {}
+        for username in ['anna', 'ben', 'cara', 'dev', 'manager']:
+            user = User(username=username, email=f'{username}@example.com',
+                        first_name=username.title(), last_name='Smith')
+            user.roles.append(Role.query.filter_by(name='manager' if username == 'manager' else 'stylist').first())
+            users[username] = user
+        db.session.add_all(users.values())
+        db.session.commit()
+        return {username: user.id for username, user in users.items()}
+
+def add_holiday(user_id, start, end, status='approved'):
+    request = HolidayRequest(user_id=user_id, start_date=start, end_date=end,
+                             days_requested=(end - start).days + 1, status=status)
+    db.session.add(request)
+    db.session.commit()
+    return request.id
+
+def count_statements(function, *args, **kwargs):
+    """Run a function, returning its result and the number of SQL statements it executed."""
+    statements = []
+    listener = lambda *listener_args: statements.append(listener_args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    return result, len(statements)
+
+class TestHolidayCoverage:
+    """Test the sweep-line holiday coverage engine."""
+
+    def test_segments_headcount_and_windows(self):
+        day = date(2024, 7, 1)
+        ranges = [
+            (1, day, day + timedelta(days=4)),
+            # The same person twice, overlapping and then adjacent, still counts once
+            (1, day + timedelta(days=2), day + timedelta(days=6)),
+            (1, day + timedelta(days=7), day + timedelta(days=7)),
+            (2, day + timedelta(days=3), day + timedelta(days=5)),
+            (3, day + timedelta(days=4), day + timedelta(days=9)),
+            (4, day + timedelta(days=5), day + timedelta(days=5)),
+        ]
+
+        segments = HolidayCoverageService.build_segments(ranges)
+        headcount = HolidayCoverageService.daily_headcount(segments)
+
+        assert [headcount.get(day + timedelta(days=offset), 0) for offset in range(11)] == [
+            1, 1, 1, 2, 3, 4, 2, 2, 1, 1, 0
+        ]
+        assert segments[0] == {'start': day, 'end': day + timedelta(days=2), 'count': 1,
+                               'user_ids': frozenset({1})}
+
+        windows = HolidayCoverageService.conflict_windows(segments)
+        assert windows == [{'start': day + timedelta(days=4), 'end': day + timedelta(days=5),
+                            'peak': 4, 'user_ids': {1, 2, 3, 4}}]
+        assert HolidayCoverageService.conflict_windows(segments, max_staff=3)[0]['start'] == day + timedelta(days=5)
+
+    def test_analytics_reports_each_window_once(self, app, staff):
+        with app.app_context():
+            day = date(2024, 8, 5)
+            for username in ['anna', 'ben', 'cara']:
+                add_holiday(staff[username], day, day + timedelta(days=4))
+            add_holiday(staff['dev'], day, day + timedelta(days=4), status='rejected')
+
+            conflicts = AnalyticsService._detect_holiday_conflicts(date(2024, 8, 1), date(2024, 8, 31))
+
+            assert len(conflicts) == 1
+            assert conflicts[0]['date_range'] == '2024-08-05 to 2024-08-09'
+            assert conflicts[0]['affected_staff'] == 3
+            assert conflicts[0]['staff'] == ['Anna Smith', 'Ben Smith', 'Cara Smith']
+
+    def test_approval_warns_about_cover(self, app, staff):
+        with app.app_context():
+            day = date(2024, 9, 2)
+            add_holiday(staff['anna'], day, day + timedelta(days=4))
+            add_holiday(staff['ben'], day + timedelta(days=3), day + timedelta(days=7))
+            pending_id = add_holiday(staff['cara'], day + timedelta(days=2), day + timedelta(days=4), status='pending')
+
+            pending = HolidayRequest.query.get(pending_id)
+            assert HolidayCoverageService.conflicts_if_approved(pending)[0]['start'] == day + timedelta(days=3)
+
+            success, message = HolidayService.approve_holiday_request(pending_id, staff['manager'])
+
+            assert success
+            assert 'Warning' in message and '2024-09-05 to 2024-09-06 (3 off)' in message
+            assert HolidayRequest.query.get(pending_id).status == 'approved'
+
+class TestHolidayTrends:
+    """Test the dialect-portable date buckets behind the trend reports."""
+
+    def test_date_buckets(self, app):
+        with app.app_context():
+            day = literal(date(2024, 8, 31), Date)
+            values = {unit: db.session.execute(select(date_bucket(unit, day))).scalar() for unit in DATE_BUCKET_UNITS}
+            assert values == {'day': date(2024, 8, 31), 'week': date(2024, 8, 26),
+                              'month': date(2024, 8, 1), 'quarter': date(2024, 7, 1)}
+            assert [bucket_label(values[unit], unit) for unit in DATE_BUCKET_UNITS] == [
+                '2024-08-31', '2024-W35', '2024-08', '2024-Q3'
+            ]
+
+            postgres_sql = str(select(date_bucket('quarter', HolidayRequest.start_date)).compile(
+                dialect=postgresql.dialect()
+            ))
+            assert "CAST(date_trunc('quarter', holiday_request.start_date) AS DATE)" in postgres_sql
+            with pytest.raises(ValueError):
+                date_bucket('fortnight', HolidayRequest.start_date)
+
+    def test_trends_by_bucket(self, app, staff):
+        with app.app_context():
+            add_holiday(staff['anna'], date(2024, 7, 29), date(2024, 7, 30))
+            add_holiday(staff['ben'], date(2024, 8, 2), date(2024, 8, 2), status='rejected')
+            add_holiday(staff['cara'], date(2024, 8, 5), date(2024, 8, 9))
+
+            monthly = AnalyticsService.analyze_holiday_trends(date(2024, 7, 1), date(2024, 8, 31))
+            assert [(trend['month'], trend['total_requests'], trend['approved']) for trend in monthly['monthly_trends']] == [
+                ('2024-07', 1, 1), ('2024-08', 2, 1)
+            ]
+
+            weekly = AnalyticsService.analyze_holiday_trends(date(2024, 7, 1), date(2024, 8, 31), 'week')
+            assert [(trend['month'], trend['total_requests'], trend['rejected']) for trend in weekly['monthly_trends']] == [
+                ('2024-W31', 2, 1), ('2024-W32', 1, 0)
+            ]
+
+class TestTeamHolidaySummary:
+    """Test the grouped team holiday summary and batch quota provisioning."""
+
+    def test_provisioning_and_summary(self, app, staff):
+        with app.app_context():
+            day = {'working': True, 'start': '09:00', 'end': '17:00'}
+            for username, days in [('anna', 5), ('ben', 3), ('cara', 5)]:
+                db.session.add(WorkPattern(user_id=staff[username], pattern_name='Standard', work_schedule={
+                    weekday: day for weekday in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday'][:days]
+                }))
+            for username in ['anna', 'ben']:
+                db.session.add(EmploymentDetails(user_id=staff[username], employment_type='employed',
+                                                 start_date=date(2020, 1, 1)))
+            db.session.commit()
+            add_holiday(staff['anna'], date(2024, 3, 4), date(2024, 3, 8))
+            add_holiday(staff['anna'], date(2024, 9, 2), date(2024, 9, 3), status='pending')
+            add_holiday(staff['anna'], date(2023, 12, 27), date(2023, 12, 29), status='pending')
+            add_holiday(staff['ben'], date(2024, 5, 1), date(2024, 5, 1), status='rejected')
+            add_holiday(staff['cara'], date(2024, 6, 3), date(2024, 6, 4))
+
+            # Pages only read quotas; provisioning is a separate step
+            summary, statements = count_statements(HolidayService.get_team_holiday_summary, 2024)
+            assert statements == 2
+            assert summary['stylists'] == []
+            assert HolidayQuota.query.count() == 0
+
+            result = HolidayService.provision_missing_quotas(2024)
+            db.session.commit()
+            assert result == {'created': 2, 'skipped': [staff['cara'], staff['dev']], 'carried_over': 0}
+            assert HolidayService.provision_missing_quotas(2024)['created'] == 0
+
+            summary, statements = count_statements(HolidayService.get_team_holiday_summary, 2024)
+            assert statements == 2
+            assert [user.username for user in summary['missing_quota']] == ['cara', 'dev']
+            assert [(stylist['user'].username, stylist['quota'].holiday_days_entitled,
+                     stylist['quota'].holiday_days_taken, stylist['request_counts'])
+                    for stylist in summary['stylists']] == [
+                ('anna', 28, 5, {'pending': 1, 'approved': 1, 'rejected': 0}),
+                ('ben', 18, 0, {'pending': 0, 'approved': 0, 'rejected': 1})
+            ]
+            # Cara has no quota, but Cara's approved holiday still counts towards the team totals
+            assert summary['request_counts'] == {'pending': 1, 'approved': 2, 'rejected': 1}
+            assert (summary['total_entitlement'], summary['total_taken'], summary['total_remaining']) == (46, 5, 41)
+
+            # A duplicate quota for the year is ignored, as get_or_create_holiday_quota ignores it
+            db.session.add(HolidayQuota(user_id=staff['anna'], year=2024, total_hours_per_week=40,
+                                        holiday_days_entitled=99, holiday_days_taken=0, holiday_days_remaining=99))
+            db.session.commit()
+            again = HolidayService.get_team_holiday_summary(2024)
+            assert [stylist['user'].username for stylist in again['stylists']] == ['anna', 'ben']
+            assert again['stylists'][0]['quota'].holiday_days_entitled == 28
+            assert again['request_counts'] == summary['request_counts']
+            assert again['total_entitlement'] == 46
+
+    def test_rollover_with_carry_over(self, app, staff):
+        with app.app_context():
+            day = {'working': True, 'start': '09:00', 'end': '17:00'}
+            for username in ['anna', 'ben', 'dev']:
+                db.session.add(WorkPattern(user_id=staff[username], pattern_name='Standard', work_schedule={
+                    weekday: day for weekday in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday']
+                }))
+            # Ben leaves before the new year and Cara has no work pattern
+            for username, end_date in [('anna', None), ('ben', date(2024, 6, 30)), ('cara', None)]:
+                db.session.add(EmploymentDetails(user_id=staff[username], employment_type='employed',
+                                                 start_date=date(2020, 1, 1), end_date=end_date))
+            db.session.add(HolidayQuota(user_id=staff['anna'], year=2024, total_hours_per_week=40,
+                                        holiday_days_entitled=28, holiday_days_taken=20,
+                                        holiday_days_remaining=8))
+            db.session.commit()
+
+            result, statements = count_statements(HolidayService.rollover_quotas, 2025, carry_over=True)
+            db.session.commit()
+            assert statements == 6
+            assert result == {'created': 1, 'skipped': [staff['cara']], 'carried_over': 5}
+
+            quota = HolidayQuota.query.filter_by(user_id=staff['anna'], year=2025).one()
+            assert (quota.holiday_days_entitled, quota.holiday_days_carried_over, quota.holiday_days_remaining) == (28, 5, 33)
+            quota.holiday_days_taken = 3
+            quota.update_remaining_days()
+            assert quota.holiday_days_remaining == 30
+
+            # Running it again leaves the new quotas alone
+            assert HolidayService.rollover_quotas(2025, carry_over=True)['created'] == 0
+            assert HolidayService.rollover_quotas(2026)['carried_over'] == 0
+
+class TestBulkHolidayApproval:
+    """Test approving and rejecting many holiday requests in one transaction."""
+
+    def test_days_added_in_sql(self, app, staff):
+        with app.app_context():
+            for username, taken in [('anna', 2), ('ben', 0)]:
+                db.session.add(HolidayQuota(user_id=staff[username], year=2024, total_hours_per_week=40,
+                                            holiday_days_entitled=28, holiday_days_taken=taken,
+                                            holiday_days_remaining=28 - taken))
+            db.session.commit()
+            pending = [
+                add_holiday(staff['anna'], date(2024, 9, 2), date(2024, 9, 4), status='pending'),
+                add_holiday(staff['anna'], date(2024, 10, 7), date(2024, 10, 8), status='pending'),
+                add_holiday(staff['ben'], date(2024, 9, 9), date(2024, 9, 9), status='pending'),
+                # Cara has no work pattern, so no quota to update
+                add_holiday(staff['cara'], date(2024, 9, 16), date(2024, 9, 16), status='pending')
+            ]
+            approved = add_holiday(staff['dev'], date(2024, 8, 5), date(2024, 8, 5))
+
+            # Another manager's approval lands after this session read Anna's quota
+            quota = HolidayQuota.query.filter_by(user_id=staff['anna']).one()
+            assert quota.holiday_days_taken == 2
+            db.session.execute(update(HolidayQuota).where(HolidayQuota.id == quota.id).values(
+                holiday_days_taken=HolidayQuota.holiday_days_taken + 10
+            ))
+
+            result = HolidayService.decide_holiday_requests(pending + [approved], 'approve', staff['manager'],
+                                                            'Summer cover agreed')
+            assert result['decided'] == pending
+            assert result['skipped'] == [approved]
+            assert result['shortfalls'] == []
+
+            assert [(quota.user_id, quota.holiday_days_taken, quota.holiday_days_remaining)
+                    for quota in HolidayQuota.query.order_by(HolidayQuota.user_id)] == [
+                (staff['anna'], 17, 21), (staff['ben'], 1, 27)
+            ]
+            requests = HolidayRequest.query.filter(HolidayRequest.id.in_(pending)).all()
+            assert {request.status for request in requests} == {'approved'}
+            assert all(request.approved_by_id == staff['manager'] for request in requests)
+            assert all('Summer cover agreed' in request.notes for request in requests)
+
+    def test_minimum_cover_blocks_the_batch(self, app, staff):
+        with app.app_context():
+            # Wednesday, with Anna and Ben already off
+            add_holiday(staff['anna'], date(2024, 9, 4), date(2024, 9, 4))
+            add_holiday(staff['ben'], date(2024, 9, 4), date(2024, 9, 4))
+            cara = add_holiday(staff['cara'], date(2024, 9, 3), date(2024, 9, 4), status='pending')
+            dev = add_holiday(staff['dev'], date(2024, 9, 4), date(2024, 9, 5), status='pending')
+
+            result = HolidayService.decide_holiday_requests([cara, dev], 'approve', staff['manager'], min_staff=1)
+            assert result['decided'] == []
+            assert result['shortfalls'] == [{'date': date(2024, 9, 4), 'working': 0, 'scheduled': 4}]
+            assert HolidayRequest.query.filter_by(status='pending').count() == 2
+            assert HolidayQuota.query.count() == 0
+
+            result = HolidayService.decide_holiday_requests([cara], 'approve', staff['manager'], min_staff=1)
+            assert result['decided'] == [cara]
+            assert [(window['start'], window['peak']) for window in result['conflicts']] == [(date(2024, 9, 4), 3)]
+
+            app.config['HOLIDAY_MIN_STAFF_COVERAGE'] = 1
+            success, message = HolidayService.approve_holiday_request(dev, staff['manager'])
+            assert not success and '2024-09-04 (0 of 4 working)' in message
+
+            result = HolidayService.decide_holiday_requests([dev], 'reject', staff['manager'], 'Too many off')
+            assert result['decided'] == [dev]
+            assert HolidayRequest.query.get(dev).status == 'rejected'
+
+    def test_single_stylist_can_take_holiday_by_default(self, app, init_database):
+        with app.app_context():
+            stylist = User(username='solo', email='solo@example.com', first_name='Solo', last_name='Smith')
+            stylist.roles.append(Role.query.filter_by(name='stylist').first())
+            manager = User(username='manager', email='manager@example.com', first_name='Manager', last_name='Smith')
+            manager.roles.append(Role.query.filter_by(name='manager').first())
+            db.session.add_all([stylist, manager])
+            db.session.commit()
+            request_id = add_holiday(stylist.id, date(2024, 9, 2), date(2024, 9, 6), status='pending')
+
+            success, message = HolidayService.approve_holiday_request(request_id, manager.id)
+            assert success, message
+            assert HolidayRequest.query.get(request_id).status == 'approved'
+
+            # With cover required, the salon's only stylist cannot be off
+            app.config['HOLIDAY_MIN_STAFF_COVERAGE'] = 1
+            other = add_holiday(stylist.id, date(2024, 10, 7), date(2024, 10, 7), status='pending')
+            success, message = HolidayService.approve_holiday_request(other, manager.id)
+            assert not success and '2024-10-07 (0 of 1 working)' in message
+
+class TestWorkingDays:
+    """Test counting working days from work patterns and bank holidays."""
+
+    def test_count_weekdays_matches_day_by_day(self):
+        start = date(2024, 2, 26)
+        for weekdays in [frozenset(), frozenset(range(5)), frozenset({1, 2, 3, 4, 5}), frozenset({6})]:
+            for length in range(0, 40, 3):
+                for shift in range(7):
+                    first = start + timedelta(days=shift)
+                    last = first + timedelta(days=length)
+                    expected = sum(1 for offset in range(length + 1)
+                                   if (first + timedelta(days=offset)).weekday() in weekdays)
+                    assert WorkingDayService.count_weekdays(weekdays, first, last) == expected
+        assert WorkingDayService.count_weekdays(frozenset(range(7)), start, start - timedelta(days=1)) == 0
+
+    def test_pattern_and_bank_holidays(self, app, staff):
+        with app.app_context():
+            # Tuesday to Saturday
+            shift = {'working': True, 'start': '09:00', 'end': '17:00'}
+            db.session.add(WorkPattern(user_id=staff['anna'], pattern_name='Tuesday to Saturday', work_schedule={
+                day: shift for day in ['tuesday', 'wednesday', 'thursday', 'friday', 'saturday']
+            }))
+            db.session.commit()
+            assert WorkingDayService.seed_bank_holidays() == 0
+
+            # Two weeks over Easter 2027: Good Friday is worked, Easter Monday is not
+            start, end = date(2027, 3, 22), date(2027, 4, 4)
+            assert WorkingDayService.count_working_days(staff['anna'], start, end) == (9, [date(2027, 3, 26)])
+            # Without a pattern Monday to Friday counts, so both bank holidays come off
+            assert WorkingDayService.count_working_days(staff['ben'], start, end) == (
+                8, [date(2027, 3, 26), date(2027, 3, 29)]
+            )
+
+            validation = HolidayService.validate_holiday_request(staff['anna'], start, end)
+            assert validation['requested_days'] == 9
+            assert any('26/03/2027' in warning for warning in validation['warnings'])
+
+            # Sunday and Monday are not worked
+            validation = HolidayService.validate_holiday_request(staff['anna'], date(2027, 4, 4), date(2027, 4, 5))
+            assert validation['requested_days'] == 0
+            assert "No working days in the selected date range" in validation['errors']
+
+class TestHolidayReassignment:
+    """Test finding and reassigning appointments booked over a holiday."""
+
+    def test_greedy_reassignment(self, app, staff):
+        with app.app_context():
+            day = date(2027, 9, 1)
+            cut = Service(name='Cut', duration=60, price=30)
+            colour = Service(name='Colour', duration=60, price=70)
+            db.session.add_all([cut, colour])
+            db.session.flush()
+            # Ben may not colour, and has his own client from 11:00
+            db.session.add(StylistServiceAssociation(stylist_id=staff['ben'], service_id=colour.id, is_allowed=False))
+            book = lambda stylist, service, hour: Appointment(
+                customer_id=staff['manager'], stylist_id=staff[stylist], appointment_date=day,
+                start_time=time(hour), end_time=time(hour + 1), status='confirmed',
+                services_link=[AppointmentService(service_id=service.id, duration=60)]
+            )
+            appointments = [book('anna', colour, 10), book('anna', cut, 10), book('anna', cut, 11),
+                            book('anna', cut, 10), book('ben', cut, 11)]
+            db.session.add_all(appointments)
+            db.session.commit()
+            # Cara is already off that day
+            add_holiday(staff['cara'], day, day)
+            colour_10, cut_10, cut_11, second_cut_10 = [appointment.id for appointment in appointments[:4]]
+
+            plan = HolidayReassignmentService.plan(staff['anna'], day, day)
+            assert [(suggestion['appointment'].id, suggestion['candidates'], suggestion['stylist_id'])
+                    for suggestion in plan] == [
+                (colour_10, [staff['dev']], staff['dev']),
+                (cut_10, [staff['ben'], staff['dev']], staff['ben']),
+                (second_cut_10, [staff['ben'], staff['dev']], None),
+                (cut_11, [staff['dev']], staff['dev'])
+            ]
+
+            validation = HolidayService.validate_holiday_request(staff['anna'], day, day)
+            assert ("4 appointments are booked in this period: 3 can be reassigned to other stylists, "
+                    "1 would need rescheduling") in validation['warnings']
+
+            request_id = add_holiday(staff['anna'], day, day, status='pending')
+            success, message = HolidayService.approve_holiday_request(request_id, staff['manager'], reassign=True)
+            assert success
+            assert '3 appointments reassigned, 1 still need rescheduling' in message
+
+            assert [Appointment.query.get(appointment_id).stylist_id
+                    for appointment_id in [colour_10, cut_10, cut_11, second_cut_10]] == [
+                staff['dev'], staff['ben'], staff['dev'], staff['anna']
+            ]
+            assert sorted(job.appointment_id for job in CostRecalculationJob.query) == sorted(
+                [colour_10, cut_10, cut_11]
+            )
+            assert HolidayReassignmentService.affected_appointments(staff['anna'], day, day)[0].id == second_cut_10
@@ -0,0 +1,666 @@
+import pytest
+from datetime import date, time, timedelta
+from decimal import Decimal
+from app import create_app
+from app.extensions import db
+from app.models import (
+    User, Role, Appointment, AppointmentService, AppointmentCost, Service,
+    EmploymentDetails, BillingElement, CostRecalculationJob, DailyStylistRollup, WorkPattern, HolidayRequest,
+    ReportCacheEntry, AppointmentCostElement
+)
+from app.services.analytics_service import AnalyticsService
+from app.services.billing_ledger import BillingLedgerService
+from app.services.capacity_service import CapacityService
+from app.services.cost_queue import CostQueue, COST_JOB_MAX_ATTEMPTS
+from app.services.hr_service import HRService
+from app.services.report_cache import MemoryReportCache, ReportCache
+from app.services.rollup_service import DailyRollupService, ROLLUP_COLUMNS
+from app.services.staff_directory import StaffDirectory
+from app.services.schedule_cache import ScheduleCache
+from app.services.utilization_service import UtilizationService
+from sqlalchemy import event
+from unittest.mock import patch
+
+COST_FIELDS = ['stylist_id', 'service_revenue', 'stylist_cost', 'salon_profit', 'calculation_method',
+               'hours_worked', 'commission_amount', 'commission_breakdown', 'billing_method',
+               'billing_elements_applied']
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    return app
+
+@pytest.fixture
+def init_database(app):
+    with app.app_context():
+        db.create_all()
+
+        for role_name in ['customer', 'stylist']:
+            if not Role.query.filter_by(name=role_name).first():
+                db.session.add(Role(name=role_name, description=f'Test {role_name} role'))
+        db.session.add_all([
+            BillingElement(name='Colour', percentage=Decimal('25.00')),
+            BillingElement(name='Electric', percentage=Decimal('5.00')),
+            BillingElement(name='Retired', percentage=Decimal('10.00'), is_active=False)
+        ])
+        db.session.commit()
+        yield db
+        db.drop_all()
+
+@pytest.fixture
+def hr_data(app, init_database):
+    """Create hourly, commission and unemployed stylists with a week of appointments.
+
+    Returns a dict of the stylist, customer and appointment IDs.
+    """
+    with app.app_context():
+        stylist_role = Role.query.filter_by(name='stylist').first()
+        users = {}
+        for username in ['hourly', 'commission', 'unemployed', 'customer']:
+            user = User(username=username, email=f'{username}@example.com',
+                        first_name=username.title(), last_name='User')
+            user.roles.append(stylist_role if username != 'customer' else
+                              Role.query.filter_by(name='customer').first())
+            users[username] = user
+        db.session.add_all(users.values())
+        db.session.flush()
+
+        db.session.add_all([
+            EmploymentDetails(user_id=users['hourly'].id, employment_type='employed',
+                              hourly_rate=Decimal('12.50'), start_date=date(2020, 1, 1)),
+            EmploymentDetails(user_id=users['commission'].id, employment_type='self_employed',
+                              commission_rate=Decimal('60.00'), billing_method='stylist_bills',
+                              start_date=date(2020, 1, 1))
+        ])
+
+        cut = Service(name='Cut', duration=30, price=Decimal('25.00'))
+        colour = Service(name='Colour', duration=60, waiting_time=15, price=Decimal('70.00'))
+        db.session.add_all([cut, colour])
+        db.session.flush()
+
+        appointment_ids = []
+        day = date(2024, 5, 6)
+        for offset in range(5):
+            for stylist in ['hourly', 'commission', 'unemployed']:
+                appointment = Appointment(customer_id=users['customer'].id, stylist_id=users[stylist].id,
+                                          appointment_date=day + timedelta(days=offset),
+                                          start_time=time(10, 0), end_time=time(11, 45),
+                                          status='completed' if offset % 2 == 0 else 'confirmed')
+                db.session.add(appointment)
+                db.session.flush()
+                services = [cut, colour] if offset % 2 == 0 else [cut]
+                for order, service in enumerate(services):
+                    db.session.add(AppointmentService(appointment_id=appointment.id, service_id=service.id,
+                                                      duration=service.duration, waiting_time=service.waiting_time,
+                                                      order=order))
+                appointment_ids.append(appointment.id)
+        db.session.commit()
+
+        return {
+            'hourly': users['hourly'].id,
+            'commission': users['commission'].id,
+            'unemployed': users['unemployed'].id,
+            'customer': users['customer'].id,
+            'appointments': appointment_ids
+        }
+
+def cost_snapshot():
+    """Map appointment ID to its stored cost fields."""
+    db.session.expire_all()
+    return {
+        cost.appointment_id: {field: getattr(cost, field) for field in COST_FIELDS}
+        for cost in AppointmentCost.query.all()
+    }
+
+class TestBulkCostRecalculation:
+    """Test the set-based AppointmentCost recalculation engine."""
+
+    def test_matches_single_appointment_calculation(self, app, hr_data):
+        with app.app_context():
+            for appointment_id in hr_data['appointments']:
+                HRService.calculate_appointment_cost(appointment_id)
+            expected = cost_snapshot()
+            AppointmentCost.query.delete()
+            db.session.commit()
+
+            progress = []
+            result = HRService.recalculate_costs(date(2024, 5, 1), date(2024, 5, 31), batch_size=4,
+                                                 progress=lambda done, total: progress.append((done, total)))
+
+            assert cost_snapshot() == expected
+            assert result['total'] == 15
+            assert result['created'] == 10
+            assert result['updated'] == 0
+            assert result['skipped'] == 5
+            assert progress == [(4, 15), (8, 15), (12, 15), (15, 15)]
+            assert result['elapsed_seconds'] >= 0
+
+    def test_updates_existing_rows_for_selected_stylists(self, app, hr_data):
+        with app.app_context():
+            HRService.recalculate_costs(date(2024, 5, 1), date(2024, 5, 31))
+            employment = EmploymentDetails.query.filter_by(user_id=hr_data['hourly']).first()
+            employment.hourly_rate = Decimal('20.00')
+            db.session.commit()
+
+            result = HRService.recalculate_costs(stylist_ids=[hr_data['hourly']])
+
+            assert result['created'] == 0
+            assert result['updated'] == 5
+            costs = AppointmentCost.query.filter_by(stylist_id=hr_data['hourly']).all()
+            assert len(costs) == 5
+            # 105 minutes of services (with waiting time) or 30 minutes at the new rate
+            assert sorted(float(cost.stylist_cost) for cost in costs) == [10.0, 10.0, 35.0, 35.0, 35.0]
+            assert AppointmentCost.query.count() == 10
+
+class TestCostQueue:
+    """Test the background appointment cost queue."""
+
+    def test_enqueue_coalesces_and_worker_computes_in_batches(self, app, hr_data):
+        with app.app_context():
+            for appointment_id in hr_data['appointments']:
+                HRService.calculate_appointment_cost(appointment_id)
+            expected = cost_snapshot()
+            AppointmentCost.query.delete()
+            db.session.commit()
+
+            first, second = hr_data['appointments'][:2]
+            CostQueue.enqueue([first, second])
+            CostQueue.enqueue([first])
+            CostQueue.enqueue(hr_data['appointments'])
+            db.session.commit()
+            assert CostRecalculationJob.query.count() == 15
+
+            assert CostQueue.process_batch(batch_size=4) == 4
+            assert CostQueue.pending_count() == 11
+            assert CostQueue.process_pending(batch_size=4) == 11
+            assert CostQueue.pending_count() == 0
+            assert cost_snapshot() == expected
+
+    def test_failed_batches_are_retried_then_left(self, app, hr_data):
+        with app.app_context():
+            CostQueue.enqueue(hr_data['appointments'][:3])
+            db.session.commit()
+
+            with patch.object(HRService, 'recalculate_costs', side_effect=RuntimeError('boom')):
+                for attempt in range(COST_JOB_MAX_ATTEMPTS):
+                    assert CostQueue.process_batch() == 3
+                assert CostQueue.process_batch() == 0
+
+            jobs = CostRecalculationJob.query.all()
+            assert len(jobs) == 3
+            assert all(job.attempts == COST_JOB_MAX_ATTEMPTS and job.last_error == 'boom' for job in jobs)
+            assert AppointmentCost.query.count() == 0
+
+            # Enqueuing again makes failed jobs eligible once more
+            CostQueue.enqueue(hr_data['appointments'][:1])
+            db.session.commit()
+            assert CostQueue.pending_count() == 1
+
+    def test_failing_job_does_not_hold_back_its_batch(self, app, hr_data):
+        with app.app_context():
+            bad_id = hr_data['appointments'][1]
+            CostQueue.enqueue(hr_data['appointments'][:3])
+            db.session.commit()
+
+            recalculate_costs = HRService.recalculate_costs
+            def fail_on_bad(appointment_ids=None, **kwargs):
+                if bad_id in appointment_ids:
+                    raise RuntimeError('boom')
+                return recalculate_costs(appointment_ids=appointment_ids, **kwargs)
+
+            with patch.object(HRService, 'recalculate_costs', side_effect=fail_on_bad):
+                assert CostQueue.process_batch() == 3
+
+            jobs = CostRecalculationJob.query.all()
+            assert [(job.appointment_id, job.attempts, job.last_error) for job in jobs] == [(bad_id, 1, 'boom')]
+            # The third appointment's stylist has no employment details, so only the first is costed
+            assert [cost.appointment_id for cost in AppointmentCost.query] == hr_data['appointments'][:1]
+
+class TestStylistReports:
+    """Test the grouped per-stylist earnings and commission reports."""
+
+    def test_reports_match_cost_records(self, app, hr_data):
+        with app.app_context():
+            HRService.recalculate_costs(date(2024, 5, 1), date(2024, 5, 31))
+            stylist_ids = [hr_data['hourly'], hr_data['commission'], hr_data['unemployed']]
+            earnings, earnings_queries = count_statements(
+                HRService.calculate_earnings_by_stylist, date(2024, 5, 1), date(2024, 5, 31), stylist_ids)
+            performance, performance_queries = count_statements(
+                HRService.calculate_commission_performance_by_stylist, date(2024, 5, 1), date(2024, 5, 31),
+                stylist_ids)
+            assert earnings_queries == performance_queries == 1
+
+            # Three completed appointments each, with 105 minutes of Cut and Colour;
+            # SQLite keeps costs as floats, so SQL sums can be a penny off the rounded rows
+            hourly_costs = AppointmentCost.query.join(Appointment).filter(
+                AppointmentCost.stylist_id == hr_data['hourly'], Appointment.status == 'completed').all()
+            assert earnings[hr_data['hourly']]['total_earnings'] == pytest.approx(
+                sum(float(cost.stylist_cost) for cost in hourly_costs), abs=0.02)
+            assert earnings[hr_data['hourly']]['total_hours'] == pytest.approx(3 * 1.75)
+            assert earnings[hr_data['hourly']]['appointment_count'] == 3
+            assert earnings[hr_data['commission']]['total_earnings'] == pytest.approx(3 * 57.0)
+            assert earnings[hr_data['commission']]['total_hours'] == 0
+            assert earnings[hr_data['unemployed']]['appointment_count'] == 0
+
+            commission = performance[hr_data['commission']]
+            assert commission['total_commission'] == pytest.approx(171.0)
+            assert commission['total_revenue'] == pytest.approx(285.0)
+            assert commission['commission_appointments'] == 3
+            assert commission['commission_rate'] == 100
+            # Uncosted appointments still count towards the hourly stylist's total
+            assert performance[hr_data['hourly']]['appointment_count'] == 3
+            assert performance[hr_data['hourly']]['commission_appointments'] == 0
+            assert performance[hr_data['unemployed']]['appointment_count'] == 3
+
+            assert HRService.calculate_stylist_earnings(
+                hr_data['hourly'], date(2024, 5, 1), date(2024, 5, 31)) == earnings[hr_data['hourly']]
+
+    def test_performance_report_counts_statuses(self, app, hr_data):
+        with app.app_context():
+            Appointment.query.get(hr_data['appointments'][4]).status = 'cancelled'
+            db.session.commit()
+
+            report = HRService.get_stylist_performance_report(hr_data['commission'], date(2024, 5, 1),
+                                                              date(2024, 5, 31))
+
+            assert report['total_appointments'] == 5
+            assert report['completed_appointments'] == 3
+            assert report['cancelled_appointments'] == 1
+            assert report['completion_rate'] == 60
+
+def count_statements(function, *args, **kwargs):
+    """Run a function, returning its result and the number of SQL statements it executed."""
+    statements = []
+    listener = lambda *listener_args: statements.append(listener_args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    return result, len(statements)
+
+def rollup_snapshot():
+    """Map (date, stylist ID) to its rollup totals."""
+    db.session.expire_all()
+    return {
+        (rollup.date, rollup.stylist_id): tuple(getattr(rollup, column) for column in ROLLUP_COLUMNS[2:-1])
+        for rollup in DailyStylistRollup.query.all()
+    }
+
+class TestDailyRollups:
+    """Test the incrementally maintained (date, stylist) rollups and the reports reading them."""
+
+    def test_rollups_follow_costs_and_status_changes(self, app, hr_data):
+        with app.app_context():
+            # Booking the appointments alone fills in counts and booked minutes
+            monday = date(2024, 5, 6)
+            rollup = DailyStylistRollup.query.filter_by(date=monday, stylist_id=hr_data['hourly']).one()
+            assert (rollup.appointment_count, rollup.completed_count, rollup.booked_minutes) == (1, 1, 105)
+            assert rollup.costed_count == 0
+
+            HRService.recalculate_costs(date(2024, 5, 1), date(2024, 5, 31))
+            HRService.calculate_appointment_cost(hr_data['appointments'][0])
+
+            profit = HRService.calculate_salon_profit(date(2024, 5, 1), date(2024, 5, 31))
+            completed_costs = AppointmentCost.query.join(Appointment).filter(Appointment.status == 'completed').all()
+            assert profit['appointment_count'] == len(completed_costs) == 6
+            assert profit['total_revenue'] == pytest.approx(sum(float(cost.service_revenue) for cost in completed_costs))
+
+            summary = HRService.calculate_salon_commission_summary(date(2024, 5, 1), date(2024, 5, 31))
+            assert summary['appointment_count'] == 3
+            assert summary['total_commission'] == pytest.approx(171.0)
+            assert [row['stylist_id'] for row in summary['stylist_breakdown']] == [hr_data['commission']]
+
+            dashboard = AnalyticsService.get_executive_dashboard_data(date(2024, 5, 1), date(2024, 5, 31))
+            assert dashboard['total_appointments'] == 15
+            assert dashboard['active_stylists'] == 3
+            assert dashboard['commission'] == pytest.approx(171.0)
+
+            # Cancelling and moving appointments updates the rows they leave and join
+            cancelled = Appointment.query.get(hr_data['appointments'][1])
+            cancelled.status = 'cancelled'
+            moved = Appointment.query.get(hr_data['appointments'][0])
+            moved.appointment_date = date(2024, 6, 3)
+            db.session.commit()
+
+            rollup = DailyStylistRollup.query.filter_by(date=monday, stylist_id=hr_data['commission']).one()
+            assert (rollup.appointment_count, rollup.completed_count, rollup.booked_minutes) == (1, 0, 0)
+            assert rollup.commission_count == 0
+            assert rollup.booked_commission_count == 1
+            assert DailyStylistRollup.query.filter_by(date=monday, stylist_id=hr_data['hourly']).first() is None
+            assert DailyStylistRollup.query.filter_by(date=date(2024, 6, 3)).one().costed_count == 1
+
+            # Rolled back changes leave the rollups alone
+            Appointment.query.get(hr_data['appointments'][2]).status = 'cancelled'
+            db.session.flush()
+            db.session.rollback()
+            before_rebuild = rollup_snapshot()
+
+            DailyRollupService.rebuild()
+            db.session.commit()
+            assert rollup_snapshot() == before_rebuild
+
+    def test_rebuild_range(self, app, hr_data):
+        with app.app_context():
+            expected = rollup_snapshot()
+            DailyStylistRollup.query.delete()
+            db.session.commit()
+
+            assert DailyRollupService.rebuild(date(2024, 5, 7), date(2024, 5, 8)) == 6
+            db.session.commit()
+            assert {key[0] for key in rollup_snapshot()} == {date(2024, 5, 7), date(2024, 5, 8)}
+
+            DailyRollupService.rebuild()
+            db.session.commit()
+            assert rollup_snapshot() == expected
+
+    def test_refresh_upserts_exactly_the_given_pairs(self, app, hr_data):
+        with app.app_context():
+            expected = rollup_snapshot()
+            monday, tuesday = date(2024, 5, 6), date(2024, 5, 7)
+            # Stale rows, as if another transaction had written them first
+            DailyStylistRollup.query.update({DailyStylistRollup.appointment_count: 99})
+            db.session.commit()
+
+            DailyRollupService.refresh({(monday, hr_data['hourly']), (tuesday, hr_data['commission'])})
+            db.session.commit()
+
+            counts = {key: totals[0] for key, totals in rollup_snapshot().items()}
+            assert counts[(monday, hr_data['hourly'])] == expected[(monday, hr_data['hourly'])][0] == 1
+            assert counts[(tuesday, hr_data['commission'])] == 1
+            # Other combinations of those dates and stylists are left alone
+            assert counts[(monday, hr_data['commission'])] == 99
+            assert counts[(tuesday, hr_data['hourly'])] == 99
+
+class TestStaffDirectory:
+    """Test batched display name resolution."""
+
+    def test_names_resolved_in_one_query_and_remembered(self, app, hr_data):
+        with app.app_context():
+            user_ids = [hr_data['hourly'], hr_data['commission'], 9999]
+            names, queries = count_statements(StaffDirectory.get_names, user_ids)
+            assert names == {hr_data['hourly']: 'Hourly User', hr_data['commission']: 'Commission User'}
+            assert queries == 1
+
+            name, queries = count_statements(StaffDirectory.get_name, hr_data['commission'])
+            assert name == 'Commission User'
+            assert queries == 0
+
+    def test_commission_summary_names_stylists(self, app, hr_data):
+        with app.app_context():
+            HRService.recalculate_costs(date(2024, 5, 1), date(2024, 5, 31))
+            summary, queries = count_statements(HRService.calculate_salon_commission_summary,
+                                                date(2024, 5, 1), date(2024, 5, 31))
+            assert [row['stylist_name'] for row in summary['stylist_breakdown']] == ['Commission User']
+            assert queries == 3
+
+class TestStaffUtilization:
+    """Test the work pattern based utilisation engine."""
+
+    def test_weekday_counts(self):
+        # 1 to 31 May 2024 starts on a Wednesday
+        assert UtilizationService.weekday_counts(date(2024, 5, 1), date(2024, 5, 31)) == [4, 4, 5, 5, 5, 4, 4]
+        assert UtilizationService.weekday_counts(date(2024, 5, 2), date(2024, 5, 1)) == [0] * 7
+
+    def test_team_utilization(self, app, hr_data):
+        with app.app_context():
+            weekdays = {'working': True, 'start': '09:00', 'end': '17:00'}
+            db.session.add(WorkPattern(user_id=hr_data['hourly'], pattern_name='Full time', work_schedule={
+                day: weekdays for day in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday']
+            }))
+            # Wednesday to the following Monday, of which Wednesday to Friday fall in the week
+            db.session.add(HolidayRequest(user_id=hr_data['hourly'], start_date=date(2024, 5, 8),
+                                          end_date=date(2024, 5, 13), days_requested=4, status='approved'))
+            db.session.commit()
+            HRService.recalculate_costs(date(2024, 5, 1), date(2024, 5, 31))
+            ScheduleCache.get_weekly_opening_minutes()
+
+            result, queries = count_statements(UtilizationService.calculate_team_utilization,
+                                               date(2024, 5, 6), date(2024, 5, 12))
+            by_name = {row['username']: row for row in result}
+
+            hourly = by_name['hourly']
+            assert hourly['scheduled_hours'] == 16
+            assert hourly['holiday_days'] == 5
+            assert hourly['appointment_count'] == 5
+            assert hourly['actual_hours'] == pytest.approx(5 * 1.75)
+            assert hourly['utilization_rate'] == pytest.approx(5 * 1.75 / 16 * 100)
+            assert hourly['total_revenue'] == pytest.approx(3 * 95 + 2 * 25)
+            assert hourly['revenue_per_hour'] == pytest.approx((3 * 95 + 2 * 25) / 8.75)
+
+            # Without a work pattern a stylist is scheduled whenever the salon is open
+            assert by_name['commission']['scheduled_hours'] > 0
+            # Stylists, work patterns, holidays and bookings
+            assert queries == 4
+
+class TestCapacityAnalysis:
+    """Test the demand against staffed capacity heatmap."""
+
+    def test_occupancy_capacity_and_windows(self, app, hr_data):
+        with app.app_context():
+            shift = {'working': True, 'start': '10:00', 'end': '12:00'}
+            for stylist in ['hourly', 'commission', 'unemployed']:
+                db.session.add(WorkPattern(user_id=hr_data[stylist], pattern_name='Mornings', work_schedule={
+                    day: shift for day in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday']
+                }))
+            db.session.add(HolidayRequest(user_id=hr_data['unemployed'], start_date=date(2024, 5, 8),
+                                          end_date=date(2024, 5, 8), days_requested=1, status='approved'))
+            # Nothing booked on Thursday
+            for appointment in Appointment.query.filter_by(appointment_date=date(2024, 5, 9)):
+                appointment.status = 'cancelled'
+            db.session.commit()
+
+            analysis = CapacityService.analyze(date(2024, 5, 6), date(2024, 5, 12))
+            days = {day['date']: day for day in analysis['days']}
+
+            # Three stylists booked 10:00-11:45 of a 10:00-12:00 shift
+            assert days[date(2024, 5, 6)]['booked_hours'] == pytest.approx(3 * 1.75)
+            assert days[date(2024, 5, 6)]['staffed_hours'] == pytest.approx(6)
+            assert days[date(2024, 5, 6)]['utilization'] == pytest.approx(87.5)
+            # One of them on holiday but still booked
+            assert days[date(2024, 5, 8)]['staffed_hours'] == pytest.approx(4)
+            assert days[date(2024, 5, 9)]['utilization'] == 0
+            assert days[date(2024, 5, 11)]['staffed_hours'] == 0
+
+            windows = {(window['date'], window['type']): window for window in analysis['windows']}
+            assert windows[(date(2024, 5, 6), 'over_capacity')]['start'] == '10:00'
+            assert windows[(date(2024, 5, 6), 'over_capacity')]['end'] == '11:45'
+            assert windows[(date(2024, 5, 8), 'over_capacity')]['utilization'] == pytest.approx(150)
+            assert windows[(date(2024, 5, 9), 'under_capacity')]['minutes'] == 120
+            # The quiet quarter hour after each booking is too short to report
+            assert (date(2024, 5, 6), 'under_capacity') not in windows
+
+            heatmap = analysis['heatmap']
+            assert heatmap['hours'] == [10, 11]
+            monday = heatmap['rows'][0]
+            assert monday['weekday'] == 'Monday'
+            assert monday['cells'][0]['utilization'] == pytest.approx(100)
+            assert monday['cells'][1]['demand'] == pytest.approx(3 * 45 / 60)
+            assert monday['cells'][1]['capacity'] == pytest.approx(3)
+
+class TestReportCache:
+    """Test the report result cache and its invalidation."""
+
+    def test_memory_lru_and_ttl(self):
+        cache = MemoryReportCache(ttl_seconds=60, max_entries=2)
+        cache.set('a', {'total': 1}, ['costs'])
+        cache.set('b', {'total': 2}, ['holidays'])
+        assert cache.get('a') == (True, {'total': 1})
+        # 'b' is now the least recently used
+        cache.set('c', {'total': 3}, ['costs'])
+        assert cache.get('b') == (False, None)
+
+        cache.invalidate(['costs'])
+        assert cache.entry_count() == 0
+        assert cache.counts == {'hits': 1, 'misses': 1, 'evictions': 1, 'invalidations': 2}
+
+        expired = MemoryReportCache(ttl_seconds=0)
+        expired.set('a', 1, ['costs'])
+        assert expired.get('a') == (False, None)
+
+    def test_result_built_during_invalidation_is_not_stored(self):
+        cache = MemoryReportCache()
+        generation = cache.generation(['costs', 'holidays'])
+        cache.invalidate(['holidays'])
+        cache.set('a', {'total': 1}, ['costs', 'holidays'], generation)
+        assert cache.get('a') == (False, None)
+        assert cache.counts['stale'] == 1
+
+        cache.set('a', {'total': 2}, ['costs', 'holidays'], cache.generation(['costs', 'holidays']))
+        assert cache.get('a') == (True, {'total': 2})
+
+    def test_results_cached_until_data_changes(self, app, hr_data):
+        with app.app_context():
+            HRService.recalculate_costs(date(2024, 5, 1), date(2024, 5, 31))
+
+            first, _ = count_statements(HRService.calculate_salon_profit, date(2024, 5, 1), date(2024, 5, 31))
+            second, queries = count_statements(HRService.calculate_salon_profit, date(2024, 5, 1), date(2024, 5, 31))
+            assert second == first
+            assert queries == 0
+
+            # Another date range is another entry
+            other = HRService.calculate_salon_profit(date(2024, 5, 7), date(2024, 5, 7))
+            assert other['appointment_count'] == 0
+
+            Appointment.query.get(hr_data['appointments'][0]).status = 'cancelled'
+            db.session.commit()
+            after_cancel = HRService.calculate_salon_profit(date(2024, 5, 1), date(2024, 5, 31))
+            assert after_cancel['appointment_count'] == first['appointment_count'] - 1
+
+            # Bulk cost writes invalidate too
+            EmploymentDetails.query.filter_by(user_id=hr_data['hourly']).one().hourly_rate = Decimal('20.00')
+            db.session.commit()
+            # Stored costs do not change with the rate until they are recalculated
+            assert HRService.calculate_salon_profit(date(2024, 5, 1), date(2024, 5, 31)) == after_cancel
+            HRService.recalculate_costs(date(2024, 5, 1), date(2024, 5, 31))
+            assert (HRService.calculate_salon_profit(date(2024, 5, 1), date(2024, 5, 31))['total_stylist_cost'] >
+                    after_cancel['total_stylist_cost'])
+
+            stats = ReportCache.stats()
+            assert stats['backend'] == 'memory'
+            assert (stats['hits'], stats['misses']) == (2, 4)
+
+    def test_database_backend_shared_and_invalidated(self, app, hr_data):
+        app.config['REPORT_CACHE_BACKEND'] = 'database'
+        # Setting up the data already created the default backend
+        app.extensions.pop('report_cache')
+        with app.app_context():
+            summary = HRService.calculate_salon_commission_summary(date(2024, 5, 1), date(2024, 5, 31))
+            assert ReportCacheEntry.query.count() == 1
+
+            # A fresh backend, as in another worker, sees the stored result
+            app.extensions.pop('report_cache')
+            _, queries = count_statements(HRService.calculate_salon_commission_summary,
+                                          date(2024, 5, 1), date(2024, 5, 31))
+            # Tag generations, then the entry and its last-used time
+            assert queries == 3
+            assert ReportCache.stats()['hits'] == 1
+
+            HRService.recalculate_costs(date(2024, 5, 1), date(2024, 5, 31))
+            assert ReportCacheEntry.query.count() == 0
+            assert (HRService.calculate_salon_commission_summary(date(2024, 5, 1), date(2024, 5, 31))['total_commission'] >
+                    summary['total_commission'])
+
+    def test_database_backend_ignores_unsigned_entries(self, app, hr_data):
+        app.config['REPORT_CACHE_BACKEND'] = 'database'
+        app.extensions.pop('report_cache')
+        with app.app_context():
+            summary = HRService.calculate_salon_commission_summary(date(2024, 5, 1), date(2024, 5, 31))
+            entry = ReportCacheEntry.query.one()
+            entry.value = bytes([entry.value[0] ^ 1]) + entry.value[1:]
+            db.session.commit()
+
+            assert HRService.calculate_salon_commission_summary(date(2024, 5, 1), date(2024, 5, 31)) == summary
+            stats = ReportCache.stats()
+            assert (stats['hits'], stats['misses']) == (0, 2)
+
+            # A different SECRET_KEY cannot read the re-signed entry either
+            app.config['SECRET_KEY'] = 'another-key'
+            assert ReportCache._instance().get(entry.key) == (False, None)
+
+    def test_database_backend_skips_results_invalidated_meanwhile(self, app, hr_data):
+        app.config['REPORT_CACHE_BACKEND'] = 'database'
+        app.extensions.pop('report_cache')
+        with app.app_context():
+            calls = []
+            def build_summary(start_date, end_date):
+                if not calls:
+                    # Another worker commits new costs while the first report is being built
+                    ReportCache.invalidate('costs')
+                calls.append((start_date, end_date))
+                return HRService.calculate_salon_commission_summary.uncached(start_date, end_date)
+
+            cached = ReportCache.cached('costs')(build_summary)
+            cached(date(2024, 5, 1), date(2024, 5, 31))
+            assert ReportCacheEntry.query.count() == 0
+            assert ReportCache.stats()['stale'] == 1
+
+            cached(date(2024, 5, 1), date(2024, 5, 31))
+            assert ReportCacheEntry.query.count() == 1
+
+def ledger_snapshot():
+    """Map (cost ID, element ID) to its ledger date, stylist and amounts."""
+    return {
+        (row.appointment_cost_id, row.element_id): (row.date, row.stylist_id, row.amount, row.commission_portion)
+        for row in AppointmentCostElement.query.all()
+    }
+
+class TestBillingLedger:
+    """Test the billing element ledger behind element performance."""
+
+    def test_ledger_follows_costs(self, app, hr_data):
+        with app.app_context():
+            HRService.recalculate_costs(date(2024, 5, 1), date(2024, 5, 31))
+            colour = BillingElement.query.filter_by(name='Colour').one()
+
+            # Two active elements for each of the commission stylist's five appointments
+            ledger = ledger_snapshot()
+            assert len(ledger) == 10
+            assert {stylist_id for _, stylist_id, _, _ in ledger.values()} == {hr_data['commission']}
+
+            performance = BillingLedgerService.element_performance(date(2024, 5, 1), date(2024, 5, 31))
+            assert performance[colour.id]['total_revenue'] == pytest.approx(0.25 * (3 * 95 + 2 * 25))
+            assert performance[colour.id]['commission_generated'] == pytest.approx(0.6 * 0.25 * (3 * 95 + 2 * 25))
+            assert performance[colour.id]['appointment_count'] == 5
+
+            trends = AnalyticsService.analyze_commission_trends(date(2024, 5, 1), date(2024, 5, 31))
+            assert trends['billing_elements']['Colour']['total_revenue'] == pytest.approx(83.75)
+            assert trends['billing_elements']['Electric']['commission_generated'] == pytest.approx(0.6 * 16.75)
+
+            # Recalculating one cost rewrites its rows rather than adding more
+            appointment_id = hr_data['appointments'][1]
+            HRService.calculate_appointment_cost(appointment_id)
+            assert ledger_snapshot() == ledger
+
+            moved = Appointment.query.get(appointment_id)
+            moved.appointment_date = date(2024, 6, 3)
+            db.session.commit()
+            cost_id = AppointmentCost.query.filter_by(appointment_id=appointment_id).one().id
+            assert ledger_snapshot()[(cost_id, colour.id)][0] == date(2024, 6, 3)
+
+            db.session.delete(AppointmentCost.query.get(cost_id))
+            db.session.commit()
+            assert len(ledger_snapshot()) == 8
+
+    def test_backfill_from_stored_breakdowns(self, app, hr_data):
+        with app.app_context():
+            HRService.recalculate_costs(date(2024, 5, 1), date(2024, 5, 31))
+            expected = ledger_snapshot()
+
+            # Breakdowns stored before they carried the element ID are matched by name
+            for cost in AppointmentCost.query.all():
+                if cost.billing_elements_applied:
+                    cost.billing_elements_applied = {
+                        name: {key: value for key, value in element.items() if key != 'element_id'}
+                        for name, element in cost.billing_elements_applied.items()
+                    }
+            db.session.commit()
+            assert ledger_snapshot() == expected
+
+            AppointmentCostElement.query.delete()
+            db.session.commit()
+            assert ledger_snapshot() == {}
+
+            assert BillingLedgerService.backfill(batch_size=2) == 10
+            db.session.commit()
+            assert ledger_snapshot() == expected